@@ -0,0 +1,392 @@
+# -*- coding: utf-8 -*-
+"""
+
+Aggregation of the databases used in the analysis of the first recipients of
+COVID-19 vaccines
+http://wjgsp.com/first-covid-19-vaccines-recipients-by-country
+
+No plotting library is imported here, so that the numbers behind the
+figures can be computed without them (see compute_stats.py).
+
+"""
+
+import numpy as np
+import pandas as pd
+
+from schema import float_ages
+from countries import (
+    POPULATION_COUNTRY_COLUMNS, country_codes, recipient_country_codes,
+    population_country_codes, join_on_country)
+
+# rows of the UN database for each year, in the order of the sex axis of
+# `PopulationStructure`
+SEXES = ('Both sexes combined', 'Female', 'Male')
+BOTH_SEXES, FEMALE, MALE = range(len(SEXES))
+
+
+def select_latest_per_group(
+        dataframe, group_column='country', year_column='year',
+        reference_year=None):
+    # keeping only the latest available year for each group (country); if
+    # `reference_year` is given, the latest available on or before that year
+    #
+    # single groupby pass, all rows of the selected year are kept and the
+    # original order is preserved
+    if reference_year is not None:
+        dataframe = dataframe[dataframe[year_column] <= reference_year]
+    latest_year = dataframe.groupby(
+        group_column, sort=False)[year_column].transform('max')
+    return dataframe[dataframe[year_column] == latest_year]
+
+
+def age_categories(df_population):
+    # columns of the UN database holding the age bins (`0-4`, ..., `100+`);
+    # `df_population` can also be a `PopulationStructure`
+    if isinstance(df_population, PopulationStructure):
+        return list(df_population.categories)
+    return [col for col in df_population.columns
+            if col not in ('Time', 'Sex', 'total')]
+
+
+class PopulationStructure(object):
+    # all years and sexes of the UN database as a single array of counts
+    # (year, sex, age bin), from which the proportion of each age bin and the
+    # fraction of males are derived at once for every year and sex; a year
+    # is then a lookup in `year_index`
+    #
+    # a database without `Time` column (a single year already selected) is
+    # stored as the year None
+    def __init__(self, df_population):
+        self.categories = age_categories(df_population)
+        n_rows = len(df_population.index)
+        if 'Time' in df_population.columns:
+            years, year_position = np.unique(
+                df_population['Time'].to_numpy(), return_inverse=True)
+        else:
+            years = np.array([None], dtype=object)
+            year_position = np.zeros(n_rows, dtype=int)
+        sex_position = pd.Categorical(
+            df_population['Sex'], categories=SEXES).codes
+        if (sex_position < 0).any():
+            raise ValueError(
+                'unknown sex in the population database: '
+                f'{set(df_population["Sex"]) - set(SEXES)}')
+        if n_rows != years.size*len(SEXES) or np.unique(
+                year_position*len(SEXES) + sex_position).size != n_rows:
+            raise ValueError(
+                'the population database must have exactly one row per year '
+                f'and sex {SEXES}')
+
+        # rows ordered by (year, sex), then one reshape to (year, sex, bin)
+        order = np.lexsort((sex_position, year_position))
+        self.years = years.tolist()
+        self.year_index = {year: index for index, year in enumerate(
+            self.years)}
+        self.counts = df_population[self.categories].to_numpy(
+            dtype=float)[order].reshape(
+                years.size, len(SEXES), len(self.categories))
+        self.age_edges = np.array(category_edges(self.categories))
+        self.age_starts = self.age_edges[:-1]
+        # counts of the ages below each bin start (and of all ages, last),
+        # so that the counts of any range of bins are a difference
+        self.cumulative = np.zeros(self.counts.shape[:2] + (
+            len(self.categories) + 1,))
+        np.cumsum(self.counts, axis=2, out=self.cumulative[:, :, 1:])
+        self.totals = self.counts.sum(axis=2)
+        self.age_proportion = self.counts/self.totals[:, :, np.newaxis]
+        self.male_fraction = self.counts[:, MALE]/self.counts[:, BOTH_SEXES]
+        self.total_male_fraction = \
+            self.totals[:, MALE]/self.totals[:, BOTH_SEXES]
+
+    def index(self, year=None):
+        # position of `year` along the first axis of the arrays; None
+        # selects the only year of a single-year structure
+        if year is None and len(self.years) == 1:
+            return 0
+        try:
+            return self.year_index[year]
+        except KeyError:
+            raise KeyError(
+                f'year {year} not in the population database') from None
+
+    def bin_position(self, age=None):
+        # position of the age bin starting at `age`; None is the end of the
+        # last bin (`100+`)
+        if age is None:
+            return len(self.categories)
+        position = int(np.searchsorted(self.age_starts, age))
+        if position == self.age_starts.size or \
+                self.age_starts[position] != age:
+            raise ValueError(
+                f'{age} is not the start of an age bin of the population '
+                f'database {self.age_starts.tolist()}')
+        return position
+
+    def range_counts(self, year=None, min_age=0, max_age=None):
+        # population by sex (see SEXES) aged in [min_age, max_age), both ages
+        # being starts of age bins; max_age None for no upper bound
+        cumulative = self.cumulative[self.index(year)]
+        return cumulative[:, self.bin_position(max_age)] - \
+            cumulative[:, self.bin_position(min_age)]
+
+    def male_proportion(self, year=None, min_age=0, max_age=None):
+        # proportion of males in the population aged in [min_age, max_age)
+        counts = self.range_counts(year, min_age, max_age)
+        return counts[MALE]/counts[BOTH_SEXES]
+
+    def male_proportion_sweep(self):
+        # proportion of males in the population aged `age_starts[k]` and
+        # over, for every year (rows) and threshold k (columns)
+        above = self.cumulative[:, :, -1:] - self.cumulative[:, :, :-1]
+        return above[:, MALE]/above[:, BOTH_SEXES]
+
+
+def population_structure(df_population, year=None):
+    # `PopulationStructure` of `df_population` (returned as is if it is
+    # already one) and the position of `year` in it
+    if not isinstance(df_population, PopulationStructure):
+        df_population = PopulationStructure(df_population)
+    return df_population, df_population.index(year)
+
+
+def category_edges(categories):
+    # edges of the age bins named `a-b` (ages a to b included) and, for the
+    # last one, `a+`, closed with the width of the bin before it
+    starts = [int(col.split('-')[0].replace('+','')) for col in categories]
+    ends = [int(col.split('-')[1]) + 1 if '-' in col else None
+            for col in categories]
+    if ends[-1] is None:
+        ends[-1] = starts[-1] + (ends[-2] - starts[-2])
+    if None in ends or ends[:-1] != starts[1:]:
+        raise ValueError(f'age bins are not contiguous: {categories}')
+    return starts + [ends[-1]]
+
+
+def age_bin_edges(df_population):
+    # start of the age bins of the UN database (`0-4`, ..., `100+`), their
+    # width and the edges used for the histogram of the recipients ages,
+    # which has one more bin for the ages above the `100+` one
+    edges = category_edges(age_categories(df_population))
+    age_bins = edges[:-1]
+    age_bin_width = age_bins[1] - age_bins[0]
+    bin_edges = edges + [edges[-1] + age_bin_width]
+    return age_bins, age_bin_width, bin_edges
+
+
+def rebin_counts(counts, edges, target_edges):
+    # counts over the bins `edges` (last axis of `counts`) re-aggregated over
+    # the bins `target_edges`, the ages being uniformly spread within each
+    # bin; target edges outside of `edges` are clipped to them
+    #
+    # the counts below each target edge are interpolated from the cumulative
+    # counts, for all the leading axes (years, sexes) at once
+    counts = np.asarray(counts, dtype=float)
+    edges = np.asarray(edges, dtype=float)
+    target_edges = np.asarray(target_edges, dtype=float)
+    if target_edges.size < 2 or (np.diff(target_edges) <= 0).any():
+        raise ValueError(
+            f'age edges must be increasing: {target_edges.tolist()}')
+    target_edges = target_edges.clip(edges[0], edges[-1])
+
+    cumulative = np.zeros(counts.shape[:-1] + (edges.size,))
+    np.cumsum(counts, axis=-1, out=cumulative[..., 1:])
+    position = (np.searchsorted(edges, target_edges, side='right') - 1).clip(
+        0, edges.size - 2)
+    fraction = (target_edges - edges[position])/np.diff(edges)[position]
+    below = cumulative[..., position] + fraction*counts[..., position]
+    return np.diff(below, axis=-1)
+
+
+def age_distribution(
+        df_vaccine, df_population, vaccine_age_heights=None, year=None,
+        age_edges=None):
+    # age distribution of the vaccine recipients and of the world population,
+    # by the age bins of the UN database; `df_population` holds a single year,
+    # or is a `PopulationStructure` from which `year` is taken
+    #
+    # with `age_edges` (e.g. [0, 18, 65, 110]), both distributions are by
+    # these bins instead, the UN counts being re-aggregated with
+    # `rebin_counts`; recipients older than the last edge are ignored
+    #
+    # the recipients histogram can be given directly as `vaccine_age_heights`
+    # (counts over `age_bin_edges`, or over `age_edges` if given), e.g. from a
+    # streaming aggregation, in which case `df_vaccine` is not used
+    structure, index = population_structure(df_population, year)
+    if age_edges is None:
+        age_bins, age_bin_width, bin_edges = age_bin_edges(structure)
+        world_edges = structure.age_edges
+        world_age_proportion = structure.age_proportion[index, BOTH_SEXES]
+    else:
+        world_edges = bin_edges = np.asarray(age_edges)
+        age_bins = world_edges[:-1].tolist()
+        age_bin_width = np.diff(world_edges)
+        world_counts = rebin_counts(
+            structure.counts[index, BOTH_SEXES], structure.age_edges,
+            world_edges)
+        world_age_proportion = world_counts/world_counts.sum()
+    bin_edges = np.asarray(bin_edges)
+    age_bins_centers = (bin_edges[:-1] + bin_edges[1:])/2
+    
+    if vaccine_age_heights is None:
+        # ignoring all rows that have no age
+        vaccine_age_heights, bins = np.histogram(
+            float_ages(df_vaccine['age'].dropna()), bins=bin_edges)
+    vaccine_age_percentage = [
+        (h/sum(vaccine_age_heights))*100 for h in vaccine_age_heights]
+    
+    return dict(
+        age_bins=age_bins,
+        age_bin_width=age_bin_width,
+        age_edges=np.asarray(world_edges),
+        vaccine_age_edges=bin_edges,
+        age_bins_centers=age_bins_centers,
+        vaccine_age_heights=vaccine_age_heights,
+        vaccine_age_percentage=vaccine_age_percentage,
+        world_age_proportion=world_age_proportion,
+        )
+
+
+def nursing_by_country(df_health_workers):
+    # proportion of males in the nursing personnel of each country, latest
+    # available year, indexed by country code (see countries.py); the names
+    # of the WHO database are resolved once
+    latest = select_latest_per_group(df_health_workers)
+    table = pd.DataFrame(dict(
+        country_code=country_codes(latest['country'].to_numpy()),
+        nursing_male_proportion=latest['male_nursing_perc'].to_numpy(
+            dtype=float)/100,
+        ))
+    # several rows of the same year for a country are averaged
+    return table.dropna(subset=['country_code']).groupby(
+        'country_code').mean()
+
+
+def population_by_country(df_population):
+    # `PopulationStructure` of each country of a population database with a
+    # country dimension (see `countries.population_country_codes`), by
+    # country code; empty for the world population database
+    codes = population_country_codes(df_population)
+    if codes is None:
+        return {}
+    columns = [col for col in POPULATION_COUNTRY_COLUMNS
+               if col in df_population.columns]
+    return {
+        code: PopulationStructure(
+            df_population[codes == code].drop(columns=columns))
+        for code in pd.unique(codes[pd.notna(codes)])}
+
+
+def recipient_country_table(
+        df_vaccine, df_health_workers, country_structures=None, year=None,
+        elderly_min_age=None):
+    # for each recipient (in the order of `df_vaccine`), its country code and
+    # the proportion of males in the nursing personnel, the population and
+    # the elderly population (`elderly_min_age` and over) of its country, NaN
+    # where unknown; the recipients are hash joined to the tables of the
+    # countries on their code
+    table = nursing_by_country(df_health_workers)
+    population = {}
+    for code, structure in (country_structures or {}).items():
+        # a database of a single year is used for any year
+        if year in structure.year_index:
+            index = structure.year_index[year]
+        elif structure.years == [None]:
+            index = 0
+        else:
+            continue
+        population[code] = dict(
+            world_male_proportion=structure.total_male_fraction[index],
+            elderly_male_proportion=structure.male_proportion(
+                structure.years[index], elderly_min_age or 0),
+            )
+    if population:
+        table = table.join(
+            pd.DataFrame.from_dict(population, orient='index'), how='outer')
+    codes = recipient_country_codes(df_vaccine)
+    joined = join_on_country(codes, table)
+    joined.insert(0, 'country_code', codes)
+    return joined
+
+
+def sex_distribution(
+        df_vaccine, df_population, df_health_workers, age_cat_elder=6,
+        vaccine_sex_counts=None, year=None, own_country=False,
+        country_structures=None):
+    # proportion of males among the vaccine recipients, the world population
+    # (all ages and the last `age_cat_elder` age bins; 8 for 65+, 6 for 75+)
+    # and the nursing personnel; `df_population` holds a single year, or is a
+    # `PopulationStructure` from which `year` is taken
+    #
+    # the number of recipients by sex can be given directly as
+    # `vaccine_sex_counts` ({'male': ..., 'female': ...}), e.g. from a
+    # streaming aggregation, in which case `df_vaccine` is not used
+    #
+    # with `own_country`, each recipient is compared with its own country
+    # instead of the world: the proportions of the nursing personnel (and of
+    # the population and elderly population, if the population of each
+    # country is given as `country_structures`, see
+    # `population_by_country`) are the means over the recipients of the ones
+    # of their countries, ignoring the recipients of countries not listed
+    if vaccine_sex_counts is None:
+        # ignoring all rows that have no sex info
+        vaccine_sex = df_vaccine['sex'].dropna()
+        vacine_male_proportion = \
+            np.sum(vaccine_sex == 'male')/len(vaccine_sex)
+    else:
+        vacine_male_proportion = \
+            vaccine_sex_counts.get('male', 0)/sum(vaccine_sex_counts.values())
+    
+    structure, index = population_structure(df_population, year)
+    world_male_proportion = structure.total_male_fraction[index]
+    elderly_min_age = int(structure.age_starts[-age_cat_elder])
+    elderly_male_proportion = structure.male_proportion(
+        structure.years[index], elderly_min_age)
+    
+    if not own_country:
+        # gender ratio for the nursing personnel based on the average among
+        # all the countries listed, latest available per country
+        nursing_male_proportion = select_latest_per_group(
+            df_health_workers).male_nursing_perc.mean()/100
+        return dict(
+            vacine_male_proportion=vacine_male_proportion,
+            world_male_proportion=world_male_proportion,
+            elderly_male_proportion=elderly_male_proportion,
+            elderly_min_age=elderly_min_age,
+            nursing_male_proportion=nursing_male_proportion,
+            )
+    
+    if df_vaccine is None:
+        raise ValueError('the comparison with the own country of the '
+                         'recipients needs the vaccination database')
+    # same recipients as their proportion of males: the ones with sex info
+    countries = recipient_country_table(
+        df_vaccine, df_health_workers, country_structures,
+        structure.years[index], elderly_min_age)[
+            df_vaccine['sex'].notna().to_numpy()]
+    if countries['nursing_male_proportion'].isna().all():
+        raise ValueError('no nursing personnel numbers for the countries '
+                         'of the recipients')
+    if 'world_male_proportion' in countries.columns:
+        world_male_proportion = countries['world_male_proportion'].mean()
+        elderly_male_proportion = countries['elderly_male_proportion'].mean()
+    return dict(
+        vacine_male_proportion=vacine_male_proportion,
+        world_male_proportion=world_male_proportion,
+        elderly_male_proportion=elderly_male_proportion,
+        elderly_min_age=elderly_min_age,
+        nursing_male_proportion=countries['nursing_male_proportion'].mean(),
+        nursing_matched_recipients=int(
+            countries['nursing_male_proportion'].notna().sum()),
+        population_matched_recipients=int(
+            countries.get('world_male_proportion', pd.Series(
+                dtype=float)).notna().sum()),
+        )
+
+
+def occupation_sex_counts(df_vaccine):
+    # number of recipients by occupation (rows) and sex (columns), ignoring
+    # the rows missing any of them; the values are stripped at load (see
+    # schema.py)
+    df_known = df_vaccine.dropna(axis='index',subset=['occupation','sex'])
+    return pd.crosstab(
+        df_known['occupation'].astype(str), df_known['sex'].astype(str))
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+
+Deterministic beeswarm layout, computing the horizontal position of each point
+of a categorical scatter (swarm) plot directly from the values and categories
+http://wjgsp.com/first-covid-19-vaccines-recipients-by-country
+
+Points are placed in increasing order of value, each one at the position
+closest to the center of its category that does not overlap the points
+already placed. Only the points closer than one marker diameter in the value
+direction are tested, kept in a sliding window over the sorted values.
+
+"""
+
+import numpy as np
+
+
+def marker_extent(ax, marker_size):
+    # size of a marker of diameter `marker_size` (in points) in data units
+    # of the x and y axis, for the current limits and size of the axes
+    diameter_pixels = marker_size*ax.figure.dpi/72.0
+    (x0, y0), (x1, y1) = ax.transData.transform([[0, 0], [1, 1]])
+    return diameter_pixels/abs(x1 - x0), diameter_pixels/abs(y1 - y0)
+
+
+def _closest_free_position(lower, upper):
+    # position closest to 0 outside the union of the open intervals
+    # (lower, upper)
+    blocking = (lower < 0) & (upper > 0)
+    if not blocking.any():
+        return 0.0
+    order = np.argsort(lower, kind='stable')
+    lower = lower[order]
+    upper_max = np.maximum.accumulate(upper[order])
+    # merging the overlapping intervals: a new one starts wherever the lower
+    # bound is beyond all previous upper bounds
+    starts = np.ones(lower.size, dtype=bool)
+    starts[1:] = lower[1:] >= upper_max[:-1]
+    group = np.cumsum(starts) - 1
+    group_zero = group[np.flatnonzero(blocking[order])[0]]
+    in_group = np.flatnonzero(group == group_zero)
+    left, right = lower[in_group[0]], upper_max[in_group[-1]]
+    return left if -left <= right else right
+
+
+def _swarm_offsets(values):
+    # offsets of points with sorted `values`, in units of marker diameter
+    offsets = np.zeros(values.size)
+    window_start = 0
+    for index in range(values.size):
+        while values[index] - values[window_start] >= 1.0:
+            window_start += 1
+        if window_start == index:
+            continue
+        delta = values[index] - values[window_start:index]
+        half_width = np.sqrt(1.0 - delta*delta)
+        neighbours = offsets[window_start:index]
+        offsets[index] = _closest_free_position(
+            neighbours - half_width, neighbours + half_width)
+    return offsets
+
+
+def beeswarm_layout(
+        values, positions, point_width, point_height, max_width=None):
+    # horizontal coordinate of every point of a swarm plot
+    #
+    # `values` are the coordinates along the value axis and `positions` the
+    # coordinate of the center of the category of each point; `point_width`
+    # and `point_height` are the marker diameter in data units of each axis
+    # (see `marker_extent`). If `max_width` is given, points are clipped to
+    # that width around the category center. The result is aligned with the
+    # input and does not depend on the input order, except for equal values.
+    values = np.asarray(values, dtype=float)/point_height
+    positions = np.asarray(positions, dtype=float)
+    x = positions.copy()
+    # sorting by category then value, equal values keep their input order
+    order = np.lexsort((values, positions))
+    sorted_positions = positions[order]
+    bounds = np.flatnonzero(np.diff(sorted_positions)) + 1
+    for indices in np.split(order, bounds):
+        if indices.size == 0:
+            continue
+        offsets = _swarm_offsets(values[indices])*point_width
+        if max_width is not None:
+            offsets = np.clip(offsets, -max_width/2, max_width/2)
+        x[indices] += offsets
+    return x
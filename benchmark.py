@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+"""
+
+Benchmark of the figures pipeline on synthetic databases
+http://wjgsp.com/first-covid-19-vaccines-recipients-by-country
+
+Synthetic vaccination, UN population and WHO health workers databases are
+generated at multiples of the size of the shipped ones, and every stage of
+the pipeline is timed separately: CSV load, filtering, aggregation, swarm and
+label layout, artist creation and savefig. Results are written as JSON, and
+can be compared with the results of a previous run. Usage:
+
+    python benchmark.py [--scales 1 100 10000] [--output benchmark.json]
+                        [--compare previous.json] [--max-points 20000]
+                        [--label-counts 1000 2000 4000 8000]
+
+The figure stages (layout, artists, savefig) use at most --max-points
+recipients, sampled from the synthetic database; the number of points used
+is recorded with each result.
+
+The label layout is also timed for each of --label-counts labels (none to
+skip it), and flagged when its time per label grows faster than the number
+of labels.
+
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from data_loader import (
+    VACCINATION_FILE, POPULATION_FILE, HEALTH_WORKERS_FILE,
+    HEALTH_WORKERS_COLUMNS, read_database, select_population_year)
+from aggregation import (
+    select_latest_per_group, age_distribution, sex_distribution)
+from schema import SEXES, OCCUPATIONS, VACCINES, apply_schema, float_ages
+
+LABEL_COUNTS = (1000, 2000, 4000, 8000)
+# growth of the time per label, from one number of labels to the next, above
+# which the label layout is flagged as superlinear
+LABEL_SCALING_LIMIT = 1.5
+
+
+def count_rows(filename):
+    with open(filename, 'rb') as file:
+        return sum(1 for _ in file) - 1
+
+
+def synthetic_vaccination(n_rows, rng):
+    # vaccination database with the columns of the shipped one; about 15% of
+    # the rows have no age
+    countries = np.array([f'Country {index}' for index in range(
+        max(1, min(n_rows, 5000)))])
+    country_index = rng.integers(0, countries.size, n_rows)
+    age = np.round(rng.normal(60, 20, n_rows).clip(18, 104))
+    age[rng.random(n_rows) < 0.15] = np.nan
+    days = rng.integers(0, 365, n_rows)
+    dates = pd.Timestamp('2020-12-01') + pd.to_timedelta(days, unit='D')
+    return pd.DataFrame(dict(
+        country=countries[country_index],
+        code=np.char.add('C', country_index.astype(str)),
+        date=dates.strftime('%d/%m/%y'),
+        name='',
+        sex=np.array(SEXES)[rng.integers(0, len(SEXES), n_rows)],
+        age=age,
+        occupation=np.array(OCCUPATIONS)[
+            rng.integers(0, len(OCCUPATIONS), n_rows)],
+        vaccine=np.array(VACCINES)[rng.integers(0, len(VACCINES), n_rows)],
+        acessed='19/01/21',
+        source='https://example.org',
+        comments='',
+        ))
+
+
+def synthetic_population(n_rows, rng, age_columns):
+    # UN population database: consecutive years, three rows (both sexes,
+    # female, male) per year
+    n_years = max(1, n_rows//3)
+    female = rng.integers(1000, 700000, (n_years, len(age_columns)))
+    male = rng.integers(1000, 700000, (n_years, len(age_columns)))
+    years = np.repeat(2000 + np.arange(n_years), 3)
+    counts = np.stack([female + male, female, male], axis=1).reshape(
+        3*n_years, len(age_columns))
+    dataframe = pd.DataFrame(counts, columns=age_columns)
+    dataframe.insert(0, 'Sex', np.tile(
+        ['Both sexes combined', 'Female', 'Male'], n_years))
+    dataframe.insert(0, 'Time', years)
+    return dataframe
+
+
+def synthetic_health_workers(n_rows, rng):
+    # WHO health workers database, with the original column names
+    countries = np.array([f'Country {index}' for index in range(
+        max(1, n_rows//5))])
+    male_doctors = rng.uniform(20, 80, n_rows).round(3)
+    male_nurses = rng.uniform(1, 40, n_rows).round(3)
+    male_nurses[rng.random(n_rows) < 0.1] = np.nan
+    return pd.DataFrame({
+        'Country': countries[rng.integers(0, countries.size, n_rows)],
+        'Year': rng.integers(2000, 2020, n_rows),
+        'Male Medical doctors (%)': male_doctors,
+        'Female Medical doctors (%)': 100 - male_doctors,
+        'Male Nursing personnel (%)': male_nurses,
+        'Female Nursing personnel (%)': 100 - male_nurses,
+        })
+
+
+def write_synthetic_databases(scale, data_dir, seed=0):
+    # synthetic databases `scale` times the size of the shipped ones
+    rng = np.random.default_rng(seed)
+    age_columns = [col for col in pd.read_csv(POPULATION_FILE, nrows=0)
+                   if col not in ('Time', 'Sex')]
+    filenames = dict(
+        vaccine=os.path.join(data_dir, f'vaccination_x{scale}.csv'),
+        population=os.path.join(data_dir, f'population_x{scale}.csv'),
+        health_workers=os.path.join(data_dir, f'health_workers_x{scale}.csv'),
+        )
+    synthetic_vaccination(
+        count_rows(VACCINATION_FILE)*scale, rng).to_csv(
+            filenames['vaccine'], index=False)
+    synthetic_population(
+        count_rows(POPULATION_FILE)*scale, rng, age_columns).to_csv(
+            filenames['population'], index=False)
+    synthetic_health_workers(
+        count_rows(HEALTH_WORKERS_FILE)*scale, rng).to_csv(
+            filenames['health_workers'], index=False)
+    return filenames
+
+
+class StageTimer(object):
+    # wall time of the stages of a benchmark run
+    def __init__(self, scale):
+        self.scale = scale
+        self.results = []
+
+    def __call__(self, stage, function, *args, rows=None, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        self.results.append(dict(
+            scale=self.scale, stage=stage, rows=rows, seconds=seconds))
+        print(f'x{self.scale:<6} {stage:<32} {seconds:10.4f} s')
+        return result
+
+
+def benchmark_scale(scale, data_dir, max_points=20000, dpi=450, seed=0):
+    # timing every stage of the pipeline for one scale
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from beeswarm import beeswarm_layout
+    from label_placement import place_labels
+    from plot_age_by_occupation import plot_age_by_occupation, occupation_map
+    from plot_distribution_by_age import plot_distribution_by_age
+    from plot_distribution_by_gender import plot_distribution_by_gender
+
+    filenames = write_synthetic_databases(scale, data_dir, seed)
+    timer = StageTimer(scale)
+
+    # loading
+    df_vaccine = timer(
+        'load/vaccination', read_database, filenames['vaccine'],
+        use_cache=False, rows=count_rows(filenames['vaccine']))
+    df_population = timer(
+        'load/population', read_database, filenames['population'],
+        use_cache=False, rows=count_rows(filenames['population']))
+    df_health_workers = timer(
+        'load/health_workers', read_database, filenames['health_workers'],
+        use_cache=False, rows=count_rows(filenames['health_workers']))
+    df_health_workers.columns = HEALTH_WORKERS_COLUMNS
+    df_vaccine = timer(
+        'load/vaccination_schema', apply_schema, df_vaccine,
+        rows=len(df_vaccine.index))
+
+    # filtering
+    df_with_age = timer(
+        'filter/vaccination_age', lambda: df_vaccine.dropna(
+            axis='index',subset=['age']).copy(), rows=len(df_vaccine.index))
+    df_year = timer(
+        'filter/population_year', select_population_year, df_population,
+        int(df_population['Time'].iloc[0]), rows=len(df_population.index))
+    df_nursing = timer(
+        'filter/health_workers_nursing', lambda: df_health_workers.dropna(
+            axis='index',subset=['male_nursing_perc']),
+        rows=len(df_health_workers.index))
+    timer('filter/health_workers_latest', select_latest_per_group,
+          df_nursing, rows=len(df_nursing.index))
+
+    # aggregation
+    age_stats = timer(
+        'aggregate/age_distribution', age_distribution, df_vaccine, df_year,
+        rows=len(df_vaccine.index))
+    sex_stats = timer(
+        'aggregate/sex_distribution', sex_distribution, df_vaccine, df_year,
+        df_nursing, rows=len(df_vaccine.index))
+
+    # layout, on at most `max_points` recipients
+    if len(df_with_age.index) > max_points:
+        df_with_age = df_with_age.sample(n=max_points, random_state=seed)
+    n_points = len(df_with_age.index)
+    positions = df_with_age['occupation'].astype(str).map(
+        occupation_map).to_numpy(dtype=float)
+    ages = float_ages(df_with_age['age'])
+    x = timer('layout/beeswarm', beeswarm_layout,
+              ages, positions, 0.05, 0.8, rows=n_points)
+    timer('layout/labels', place_labels,
+          x, ages,
+          np.full(n_points, 0.3), np.full(n_points, 0.8), 0.05, 0.8,
+          limits=((-0.5, 6.5), (20, 104)), rows=n_points)
+
+    # artist creation and savefig
+    for name, plot_function, arguments, rows in (
+            ('occupation', plot_age_by_occupation, (df_with_age,), n_points),
+            ('age', plot_distribution_by_age, (age_stats,), None),
+            ('gender', plot_distribution_by_gender, (sex_stats,), None),
+            ):
+        fig = timer(f'artists/{name}', plot_function, *arguments, rows=rows)
+        timer(f'savefig/{name}', fig.savefig, io.BytesIO(), format='png',
+              dpi=dpi, rows=rows)
+        plt.close(fig)
+    return timer.results
+
+
+def benchmark_label_scaling(label_counts=LABEL_COUNTS, seed=0):
+    # timing the label layout of the age by occupation figure for each of
+    # `label_counts` recipients, and flagging a time per label growing with
+    # their number
+    from beeswarm import beeswarm_layout
+    from label_placement import place_labels
+    from plot_age_by_occupation import occupation_map
+
+    rng = np.random.default_rng(seed)
+    timer = StageTimer(1)
+    previous = None
+    for n_labels in label_counts:
+        # recipients with an age, which are the labelled ones
+        df_vaccine = synthetic_vaccination(2*n_labels, rng).dropna(
+            axis='index',subset=['age']).iloc[:n_labels]
+        ages = df_vaccine['age'].to_numpy()
+        positions = df_vaccine['occupation'].map(occupation_map).to_numpy(
+            dtype=float)
+        x = beeswarm_layout(ages, positions, 0.05, 0.8)
+        timer(f'scaling/labels_{n_labels}', place_labels,
+              x, ages,
+              np.full(n_labels, 0.3), np.full(n_labels, 0.8), 0.05, 0.8,
+              limits=((-0.5, 6.5), (20, 104)), rows=n_labels)
+        seconds = timer.results[-1]['seconds']
+        if previous is not None:
+            growth = (seconds/n_labels)/(previous[1]/previous[0])
+            flag = '  <-- superlinear' if growth > LABEL_SCALING_LIMIT else ''
+            print(f'{"":7} {"time per label":<32} {growth:8.2f}x{flag}')
+        previous = (n_labels, seconds)
+    return timer.results
+
+
+def compare_results(results, previous):
+    # ratio of the times of this run to the ones of a previous run
+    previous_times = {
+        (entry['scale'], entry['stage']): entry['seconds']
+        for entry in previous['results']}
+    for entry in results:
+        key = (entry['scale'], entry['stage'])
+        if previous_times.get(key):
+            ratio = entry['seconds']/previous_times[key]
+            flag = '  <-- slower' if ratio > 1.2 else ''
+            print(f'x{key[0]:<6} {key[1]:<32} {ratio:8.2f}x{flag}')
+
+
+def parse_arguments(args=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark every stage of the figures pipeline on '
+                    'synthetic databases.')
+    parser.add_argument(
+        '--scales', nargs='+', type=int, default=[1, 100, 10000],
+        help='sizes of the synthetic databases, as multiples of the '
+             'shipped ones')
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument(
+        '--compare', default=None,
+        help='results of a previous run to compare with')
+    parser.add_argument('--max-points', type=int, default=20000)
+    parser.add_argument(
+        '--label-counts', nargs='*', type=int, default=list(LABEL_COUNTS),
+        help='numbers of labels of the label layout scaling check')
+    parser.add_argument('--dpi', type=int, default=450)
+    parser.add_argument(
+        '--data-dir', default=None,
+        help='directory of the synthetic databases (default: temporary)')
+    return parser.parse_args(args)
+
+
+if __name__ == '__main__':
+    print('Start')
+    arguments = parse_arguments()
+
+    results = []
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        data_dir = arguments.data_dir or temporary_dir
+        os.makedirs(data_dir, exist_ok=True)
+        for scale in arguments.scales:
+            results += benchmark_scale(
+                scale, data_dir, arguments.max_points, arguments.dpi)
+    if arguments.label_counts:
+        results += benchmark_label_scaling(arguments.label_counts)
+
+    output = dict(
+        python=sys.version.split()[0],
+        platform=platform.platform(),
+        numpy=np.__version__,
+        pandas=pd.__version__,
+        time=time.strftime('%Y-%m-%dT%H:%M:%S'),
+        results=results,
+        )
+    print(f'Saving: {arguments.output}')
+    with open(arguments.output, 'w', encoding='utf-8') as file:
+        json.dump(output, file, indent=1)
+    if arguments.compare:
+        with open(arguments.compare, 'r', encoding='utf-8') as file:
+            compare_results(results, json.load(file))
+    print('Done')
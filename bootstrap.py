@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+
+Bootstrap confidence intervals of the proportions of vaccine recipients
+http://wjgsp.com/first-covid-19-vaccines-recipients-by-country
+
+The recipients are resampled with replacement. Each batch of resamples is
+drawn as one matrix of indices (resample, recipient), and the number of
+recipients of each category (age bin, sex) is counted for all the resamples
+of the batch with a single `np.bincount`. The batches are bounded in size
+and get their own random stream, derived from the seed, so that they can be
+drawn in a pool of processes with the same result as in a single one.
+
+When only the counts by category are known (streaming aggregation), the
+resamples are drawn from the multinomial distribution, which is the same
+as resampling the recipients. It is also used when the index matrices of
+all the resamples would exceed MAX_INDEX_DRAWS elements (millions of
+recipients), as the cost of the multinomial draws does not depend on the
+number of recipients.
+
+No plotting library is imported here.
+
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from schema import float_ages
+
+# number of elements of the index matrix of a batch of resamples, and of
+# the index matrices of all the resamples
+MAX_BATCH_ELEMENTS = 1 << 22
+MAX_INDEX_DRAWS = 1 << 30
+
+
+def resample_counts(codes, n_categories, n_resamples, seed=None):
+    # number of records of each category in `n_resamples` resamples of the
+    # records, whose categories are `codes` (integers in [0, n_categories));
+    # array (resample, category)
+    codes = np.asarray(codes, dtype=np.int64)
+    rng = np.random.default_rng(seed)
+    index = rng.integers(0, codes.size, size=(n_resamples, codes.size))
+    # category of each draw, offset by the resample it belongs to
+    offsets = np.arange(n_resamples)[:, np.newaxis]*n_categories
+    return np.bincount(
+        (codes[index] + offsets).ravel(),
+        minlength=n_resamples*n_categories,
+        ).reshape(n_resamples, n_categories)
+
+
+def resample_category_counts(counts, n_resamples, seed=None):
+    # same as `resample_counts`, from the number of records of each category
+    counts = np.asarray(counts, dtype=np.int64)
+    rng = np.random.default_rng(seed)
+    return rng.multinomial(
+        counts.sum(), counts/counts.sum(), size=n_resamples)
+
+
+def _resample_batch(task):
+    # worker: one batch of resamples
+    function, data, n_resamples, seed = task
+    if function == 'codes':
+        codes, n_categories = data
+        return resample_counts(codes, n_categories, n_resamples, seed)
+    return resample_category_counts(data, n_resamples, seed)
+
+
+def bootstrap_counts(
+        codes=None, n_categories=None, counts=None, n_resamples=10000,
+        seed=0, jobs=None):
+    # number of records of each category in `n_resamples` resamples, from
+    # the categories of the records (`codes`, `n_categories`) or from their
+    # counts (`counts`); the batches are drawn in `jobs` processes if more
+    # than one
+    if codes is not None and \
+            np.size(codes)*n_resamples > MAX_INDEX_DRAWS:
+        counts = np.bincount(
+            np.asarray(codes, dtype=np.int64), minlength=n_categories)
+        codes = None
+    if codes is not None:
+        codes = np.asarray(codes, dtype=np.int64)
+        n_records = codes.size
+        data = (codes, n_categories)
+        function = 'codes'
+    else:
+        counts = np.asarray(counts, dtype=np.int64)
+        n_records = len(counts)
+        data = counts
+        function = 'counts'
+    if n_records == 0:
+        raise ValueError('no records to resample')
+
+    batch_size = max(1, MAX_BATCH_ELEMENTS//n_records)
+    batch_sizes = [min(batch_size, n_resamples - start)
+                   for start in range(0, n_resamples, batch_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(batch_sizes))
+    tasks = [(function, data, size, batch_seed)
+             for size, batch_seed in zip(batch_sizes, seeds)]
+    if jobs is not None and jobs > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            batches = list(executor.map(_resample_batch, tasks))
+    else:
+        batches = [_resample_batch(task) for task in tasks]
+    return np.concatenate(batches)
+
+
+def share_intervals(resampled_counts, confidence=0.95):
+    # percentile interval of the share of each category over the resamples;
+    # array (2, category) of the lower and upper bounds
+    resampled_counts = np.asarray(resampled_counts, dtype=float)
+    shares = resampled_counts/resampled_counts.sum(axis=1, keepdims=True)
+    alpha = (1 - confidence)/2
+    return np.quantile(shares, [alpha, 1 - alpha], axis=0)
+
+
+def age_codes(ages, bin_edges):
+    # bin of each age, as `np.histogram` (last bin closed); ages outside of
+    # the bins are dropped
+    ages = float_ages(ages)
+    ages = ages[(ages >= bin_edges[0]) & (ages <= bin_edges[-1])]
+    return np.searchsorted(bin_edges, ages, side='right').clip(
+        1, len(bin_edges) - 1) - 1
+
+
+def recipient_intervals(
+        df_vaccine=None, bin_edges=None, aggregates=None, n_resamples=10000,
+        confidence=0.95, seed=0, jobs=None):
+    # confidence intervals of the percentage of recipients in each age bin
+    # (`bin_edges`) and of the proportion of males among the recipients,
+    # ignoring the recipients with no age or sex as the figures do;
+    # from `aggregates` (see streaming.py) if given, else from `df_vaccine`
+    options = dict(n_resamples=n_resamples, seed=seed, jobs=jobs)
+    if aggregates is None:
+        age_counts = bootstrap_counts(
+            codes=age_codes(df_vaccine['age'].dropna(), bin_edges),
+            n_categories=len(bin_edges) - 1, **options)
+        sex = df_vaccine['sex'].dropna()
+        sex_counts = bootstrap_counts(
+            codes=(sex == 'male').to_numpy(dtype=np.int64), n_categories=2,
+            **options)
+    else:
+        age_counts = bootstrap_counts(counts=aggregates.age_counts, **options)
+        n_male = aggregates.sex_counts.get('male', 0)
+        sex_counts = bootstrap_counts(
+            counts=[sum(aggregates.sex_counts.values()) - n_male, n_male],
+            **options)
+    return dict(
+        vaccine_age_percentage_interval=share_intervals(
+            age_counts, confidence)*100,
+        vacine_male_proportion_interval=share_intervals(
+            sex_counts, confidence)[:, 1],
+        )
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+
+Incremental build of the figures of the analysis of the first recipients of
+COVID-19 vaccines
+http://wjgsp.com/first-covid-19-vaccines-recipients-by-country
+
+Each output image is recorded in a manifest with a key combining the hash of
+its input databases, its parameters and the source code that produces it
+(plotting module, aggregation and styling). When the key of a figure is
+unchanged and the image exists, rendering it again can be skipped.
+
+"""
+
+import os
+import json
+import hashlib
+
+from data_loader import file_hash
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+MANIFEST_NAME = '.render_manifest.json'
+
+
+def render_key(inputs=(), parameters=None, code=()):
+    # key of a figure, from its input files, its parameters (any JSON
+    # serializable values) and the names of the modules of this repository
+    # producing it
+    description = dict(
+        inputs={os.path.basename(filename): file_hash(filename)
+                for filename in inputs},
+        parameters=parameters or {},
+        code={name: file_hash(os.path.join(CODE_DIR, name + '.py'))
+              for name in code},
+        )
+    return hashlib.sha1(
+        json.dumps(description, sort_keys=True, default=repr).encode('utf-8')
+        ).hexdigest()
+
+
+class RenderManifest(object):
+    # keys of the figures rendered in `output_dir`
+    def __init__(self, output_dir='.'):
+        self.output_dir = output_dir
+        self.filename = os.path.join(output_dir, MANIFEST_NAME)
+        self.entries = {}
+        if os.path.isfile(self.filename):
+            try:
+                with open(self.filename, 'r', encoding='utf-8') as file:
+                    self.entries = json.load(file)
+            except ValueError:
+                # corrupted manifest, everything is rendered again
+                self.entries = {}
+
+    def is_up_to_date(self, output, key):
+        # the image exists and was produced with the same key
+        return (os.path.isfile(os.path.join(self.output_dir, output)) and
+                self.entries.get(output) == key)
+
+    def record(self, output, key):
+        self.entries[output] = key
+        os.makedirs(self.output_dir, exist_ok=True)
+        temporary_file = self.filename + '.tmp'
+        with open(temporary_file, 'w', encoding='utf-8') as file:
+            json.dump(self.entries, file, indent=1, sort_keys=True)
+        os.replace(temporary_file, self.filename)
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""
+
+Numbers behind the figures of the analysis of the first recipients of
+COVID-19 vaccines, without plotting
+http://wjgsp.com/first-covid-19-vaccines-recipients-by-country
+
+Computes, with the same aggregation as the figures, the age distribution of
+the recipients and of the world population, the proportion of males among
+the recipients, the world population (all ages and elderly) and the nursing
+personnel, the proportion of males in the world population aged X and over
+for every age bin start X, and the number of recipients by occupation and
+sex. No plotting library is imported. Usage:
+
+    python compute_stats.py [--years 2015] [--age-cat-elder 6]
+                            [--output stats.json] [--format json|csv]
+                            [--stream [CHUNKSIZE]]
+                            [--age-edges 0 18 65 110]
+                            [--bootstrap [RESAMPLES]] [--jobs N]
+                            [--own-country] [--country-population FILE]
+
+In CSV format, four files are written next to --output, suffixed with
+_age, _sex, _sex_by_min_age and _occupation_sex. With --bootstrap, the
+percentages of recipients by age and the proportion of males among them
+get the bounds of their 95% confidence interval (see bootstrap.py). With
+--own-country, the proportion of males among the recipients is compared with
+the nursing personnel of their own countries instead of the average of all
+countries (see `aggregation.sex_distribution`). With --country-population,
+the UN table of the population by country and single age FILE (converted
+once into a memory-mapped store, see population_store.py) gives the
+percentile of the age of each recipient in their own country, summarized in
+`own_country_age_percentile`.
+
+"""
+
+import os
+import json
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from data_loader import (
+    load_vaccination, load_world_population, load_health_workers)
+from aggregation import (
+    PopulationStructure, population_structure, age_bin_edges,
+    age_distribution, sex_distribution, occupation_sex_counts,
+    population_by_country)
+from streaming import stream_vaccination
+from bootstrap import recipient_intervals
+from population_store import load_population_store, recipient_age_percentiles
+
+
+def compute_stats(
+        df_vaccine, df_population, df_health_workers, year_to_consider=2015,
+        age_cat_elder=6, aggregates=None, age_edges=None, intervals=None,
+        own_country=False, country_structures=None, population_store=None):
+    # all the numbers behind the figures for one year of the world
+    # population, as plain python values; `df_population` holds all years,
+    # or is their `aggregation.PopulationStructure`; the age distribution is
+    # by the bins of the UN database, or by `age_edges` if given
+    #
+    # if `aggregates` (see streaming.py) is given, the recipients numbers
+    # are taken from it and `df_vaccine` is not used; `intervals` are the
+    # bootstrap confidence intervals of the recipients proportions (see
+    # `bootstrap.recipient_intervals`, over the same age bins); with
+    # `own_country`, the recipients are compared with their own countries
+    # (see `aggregation.sex_distribution`); with `population_store` (see
+    # population_store.py), the age of each recipient is scored in the
+    # population of their own country
+    structure, year_index = population_structure(
+        df_population, year_to_consider)
+    age_stats = age_distribution(
+        df_vaccine, structure,
+        vaccine_age_heights=getattr(aggregates, 'age_counts', None),
+        year=year_to_consider, age_edges=age_edges)
+    sex_stats = sex_distribution(
+        df_vaccine, structure, df_health_workers, age_cat_elder,
+        vaccine_sex_counts=getattr(aggregates, 'sex_counts', None),
+        year=year_to_consider, own_country=own_country,
+        country_structures=country_structures)
+    if aggregates is None:
+        occupation_sex = occupation_sex_counts(df_vaccine)
+    else:
+        occupation_sex = aggregates.occupation_sex_table()
+
+    # one row per bin of the recipients histogram; with the bins of the UN
+    # database, the last one (105+) has no counterpart in it
+    bin_edges = age_stats['vaccine_age_edges']
+    if age_edges is None:
+        categories = structure.categories
+    else:
+        categories = [f'{start}-{end - 1}'
+                      for start, end in zip(age_edges[:-1], age_edges[1:])]
+    age_rows = []
+    for index, count in enumerate(age_stats['vaccine_age_heights']):
+        world = age_stats['world_age_proportion']
+        age_rows.append(dict(
+            age_bin=(categories[index] if index < len(categories)
+                     else f'{bin_edges[index]}+'),
+            age_start=int(bin_edges[index]),
+            vaccine_count=int(count),
+            vaccine_percentage=float(age_stats['vaccine_age_percentage'][index]),
+            world_percentage=(float(world[index]*100) if index < world.size
+                              else None),
+            ))
+        if intervals is not None:
+            lower, upper = intervals['vaccine_age_percentage_interval']
+            age_rows[-1].update(
+                vaccine_percentage_lower=float(lower[index]),
+                vaccine_percentage_upper=float(upper[index]),
+                )
+
+    # proportion of males aged X and over, for every age bin start X
+    male_proportion_by_min_age = [
+        dict(min_age=int(min_age), world_male_proportion=float(proportion))
+        for min_age, proportion in zip(
+            structure.age_starts, structure.male_proportion_sweep()[year_index])]
+
+    sex_rows = dict(
+        vaccine_male_proportion=float(sex_stats['vacine_male_proportion']),
+        world_male_proportion=float(sex_stats['world_male_proportion']),
+        elderly_male_proportion=float(sex_stats['elderly_male_proportion']),
+        elderly_min_age=int(sex_stats['elderly_min_age']),
+        nursing_male_proportion=float(sex_stats['nursing_male_proportion']),
+        )
+    if intervals is not None:
+        lower, upper = intervals['vacine_male_proportion_interval']
+        sex_rows.update(
+            vaccine_male_proportion_lower=float(lower),
+            vaccine_male_proportion_upper=float(upper),
+            )
+    if own_country:
+        sex_rows.update(
+            nursing_matched_recipients=sex_stats['nursing_matched_recipients'],
+            population_matched_recipients=sex_stats[
+                'population_matched_recipients'],
+            )
+
+    stats = dict(
+        year_to_consider=int(year_to_consider),
+        age_cat_elder=int(age_cat_elder),
+        age_distribution=age_rows,
+        male_proportion_by_min_age=male_proportion_by_min_age,
+        sex_distribution=sex_rows,
+        occupation_sex={
+            occupation: {sex: int(count) for sex, count in row.items()}
+            for occupation, row in occupation_sex.iterrows()},
+        )
+    if population_store is not None:
+        percentiles = recipient_age_percentiles(
+            df_vaccine, population_store, year_to_consider)
+        percentiles = percentiles[~np.isnan(percentiles)]
+        quartiles = (np.percentile(percentiles, [25, 50, 75]).tolist()
+                     if percentiles.size else [None]*3)
+        stats['own_country_age_percentile'] = dict(
+            matched_recipients=int(percentiles.size),
+            mean=float(percentiles.mean()) if percentiles.size else None,
+            lower_quartile=quartiles[0],
+            median=quartiles[1],
+            upper_quartile=quartiles[2],
+            )
+    return stats
+
+
+def write_json(stats, filename):
+    with open(filename, 'w', encoding='utf-8') as file:
+        json.dump(stats, file, indent=1)
+    return [filename]
+
+
+def write_csv(stats, filename):
+    # four tables for all years: age distribution, sex distribution,
+    # proportion of males by age threshold and recipients by occupation and
+    # sex
+    stem = os.path.splitext(filename)[0]
+    age_rows, sex_rows, min_age_rows = [], [], []
+    for year_stats in stats:
+        for row in year_stats['age_distribution']:
+            age_rows.append(dict(
+                year_to_consider=year_stats['year_to_consider'], **row))
+        for row in year_stats['male_proportion_by_min_age']:
+            min_age_rows.append(dict(
+                year_to_consider=year_stats['year_to_consider'], **row))
+        sex_rows.append(dict(
+            year_to_consider=year_stats['year_to_consider'],
+            age_cat_elder=year_stats['age_cat_elder'],
+            **year_stats['sex_distribution']))
+    # same recipients for all years
+    occupation_sex = pd.DataFrame(
+        stats[0]['occupation_sex']).T.fillna(0).astype(np.int64)
+    occupation_sex.index.name = 'occupation'
+
+    filenames = [stem + '_age.csv', stem + '_sex.csv',
+                 stem + '_sex_by_min_age.csv', stem + '_occupation_sex.csv']
+    pd.DataFrame(age_rows).to_csv(filenames[0], index=False)
+    pd.DataFrame(sex_rows).to_csv(filenames[1], index=False)
+    pd.DataFrame(min_age_rows).to_csv(filenames[2], index=False)
+    occupation_sex.to_csv(filenames[3])
+    return filenames
+
+
+def parse_arguments(args=None):
+    parser = argparse.ArgumentParser(
+        description='Compute the numbers behind the figures of the first '
+                    'COVID-19 vaccine recipients analysis, without plotting.')
+    parser.add_argument(
+        '--years', nargs='+', type=int, default=[2015],
+        help='years of the world population to compare with')
+    parser.add_argument(
+        '--age-cat-elder', type=int, default=6,
+        help='number of age bins of the elderly population (6 for 75+)')
+    parser.add_argument('--output', default='stats.json')
+    parser.add_argument('--format', choices=('json', 'csv'), default='json')
+    parser.add_argument(
+        '--age-edges', nargs='+', type=int, default=None,
+        help='edges of the age bins of the age distribution, e.g. '
+             '0 18 65 110 (default: the bins of the UN database)')
+    parser.add_argument(
+        '--bootstrap', type=int, nargs='?', const=10000, default=None,
+        metavar='RESAMPLES',
+        help='95%% bootstrap confidence intervals of the recipients '
+             'proportions, from RESAMPLES resamples (default 10000)')
+    parser.add_argument(
+        '--jobs', type=int, default=None,
+        help='number of processes drawing the bootstrap resamples')
+    parser.add_argument(
+        '--own-country', action='store_true',
+        help='compare the recipients with the nursing personnel of their '
+             'own countries instead of the average of all countries')
+    parser.add_argument(
+        '--country-population', default=None, metavar='FILE',
+        help='UN table of the population by country, year, sex and single '
+             'age, to score the age of each recipient in their own country')
+    parser.add_argument(
+        '--stream', type=int, nargs='?', const=1_000_000, default=None,
+        metavar='CHUNKSIZE',
+        help='aggregate the vaccination database by chunks of CHUNKSIZE '
+             'rows (default 1000000) instead of loading it whole')
+    return parser.parse_args(args)
+
+
+if __name__ == '__main__':
+    print('Start')
+    arguments = parse_arguments()
+    if (arguments.own_country or arguments.country_population) and \
+            arguments.stream is not None:
+        raise SystemExit('--own-country and --country-population need the '
+                         'whole vaccination database, they cannot be used '
+                         'with --stream')
+
+    # all years of the world population at once, each year is then a lookup
+    df_population = load_world_population()
+    population = PopulationStructure(df_population)
+    country_structures = population_by_country(df_population)
+    population_store = None
+    if arguments.country_population:
+        population_store = load_population_store(arguments.country_population)
+    df_health_workers = load_health_workers()
+    df_vaccine = None
+    aggregates = None
+    if arguments.stream is None:
+        df_vaccine = load_vaccination()
+    else:
+        bin_edges = arguments.age_edges
+        if bin_edges is None:
+            _, _, bin_edges = age_bin_edges(population)
+        aggregates = stream_vaccination(
+            bin_edges, chunksize=arguments.stream)
+
+    intervals = None
+    if arguments.bootstrap:
+        # same recipients for all years
+        bin_edges = arguments.age_edges
+        if bin_edges is None:
+            _, _, bin_edges = age_bin_edges(population)
+        intervals = recipient_intervals(
+            df_vaccine, bin_edges, aggregates,
+            n_resamples=arguments.bootstrap, jobs=arguments.jobs)
+
+    stats = [
+        compute_stats(
+            df_vaccine, population, df_health_workers, year,
+            arguments.age_cat_elder, aggregates, arguments.age_edges,
+            intervals, arguments.own_country, country_structures,
+            population_store)
+        for year in arguments.years]
+
+    if arguments.format == 'json':
+        filenames = write_json(
+            stats[0] if len(stats) == 1 else stats, arguments.output)
+    else:
+        filenames = write_csv(stats, arguments.output)
+    for filename in filenames:
+        print(f'Saving: {filename}')
+    print('Done')
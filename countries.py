@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+
+Normalized index of the countries of the vaccination, UN and WHO databases
+used in the analysis of the first recipients of COVID-19 vaccines
+http://wjgsp.com/first-covid-19-vaccines-recipients-by-country
+
+Every country is keyed by its ISO 3166-1 alpha-3 code. The names are
+normalized (case, accents, punctuation, `&`, leading "the") and looked up in
+a hash table of the names of the countries (UN M49 names, also used by the
+WHO), of their aliases (short and former names) and of their codes, built
+once per process. The databases are then joined on the code: each distinct
+name is resolved once, and the rows of one database are matched to the
+table of the other one by a hash lookup of the codes, without any string
+matching per row.
+
+No plotting library is imported here.
+
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from regions import country_code
+
+# UN M49 names
+COUNTRY_NAMES = dict(
+    AFG='Afghanistan', ALA='Åland Islands', ALB='Albania', DZA='Algeria',
+    ASM='American Samoa', AND='Andorra', AGO='Angola', AIA='Anguilla',
+    ATG='Antigua and Barbuda', ARG='Argentina', ARM='Armenia', ABW='Aruba',
+    AUS='Australia', AUT='Austria', AZE='Azerbaijan', BHS='Bahamas',
+    BHR='Bahrain', BGD='Bangladesh', BRB='Barbados', BLR='Belarus',
+    BEL='Belgium', BLZ='Belize', BEN='Benin', BMU='Bermuda', BTN='Bhutan',
+    BOL='Bolivia (Plurinational State of)',
+    BES='Bonaire, Sint Eustatius and Saba', BIH='Bosnia and Herzegovina',
+    BWA='Botswana', BRA='Brazil', VGB='British Virgin Islands',
+    BRN='Brunei Darussalam', BGR='Bulgaria', BFA='Burkina Faso',
+    BDI='Burundi', CPV='Cabo Verde', KHM='Cambodia', CMR='Cameroon',
+    CAN='Canada', CYM='Cayman Islands', CAF='Central African Republic',
+    TCD='Chad', CHL='Chile', CHN='China',
+    HKG='China, Hong Kong Special Administrative Region',
+    MAC='China, Macao Special Administrative Region', COL='Colombia',
+    COM='Comoros', COG='Congo', COK='Cook Islands', CRI='Costa Rica',
+    CIV="Côte d'Ivoire", HRV='Croatia', CUB='Cuba', CUW='Curaçao',
+    CYP='Cyprus', CZE='Czechia',
+    PRK="Democratic People's Republic of Korea",
+    COD='Democratic Republic of the Congo', DNK='Denmark', DJI='Djibouti',
+    DMA='Dominica', DOM='Dominican Republic', ECU='Ecuador', EGY='Egypt',
+    SLV='El Salvador', GNQ='Equatorial Guinea', ERI='Eritrea',
+    EST='Estonia', SWZ='Eswatini', ETH='Ethiopia',
+    FLK='Falkland Islands (Malvinas)', FRO='Faroe Islands', FJI='Fiji',
+    FIN='Finland', FRA='France', GUF='French Guiana',
+    PYF='French Polynesia', GAB='Gabon', GMB='Gambia', GEO='Georgia',
+    DEU='Germany', GHA='Ghana', GIB='Gibraltar', GRC='Greece',
+    GRL='Greenland', GRD='Grenada', GLP='Guadeloupe', GUM='Guam',
+    GTM='Guatemala', GGY='Guernsey', GIN='Guinea', GNB='Guinea-Bissau',
+    GUY='Guyana', HTI='Haiti', VAT='Holy See', HND='Honduras',
+    HUN='Hungary', ISL='Iceland', IND='India', IDN='Indonesia',
+    IRN='Iran (Islamic Republic of)', IRQ='Iraq', IRL='Ireland',
+    IMN='Isle of Man', ISR='Israel', ITA='Italy', JAM='Jamaica',
+    JPN='Japan', JEY='Jersey', JOR='Jordan', KAZ='Kazakhstan', KEN='Kenya',
+    KIR='Kiribati', KWT='Kuwait', KGZ='Kyrgyzstan',
+    LAO="Lao People's Democratic Republic", LVA='Latvia', LBN='Lebanon',
+    LSO='Lesotho', LBR='Liberia', LBY='Libya', LIE='Liechtenstein',
+    LTU='Lithuania', LUX='Luxembourg', MDG='Madagascar', MWI='Malawi',
+    MYS='Malaysia', MDV='Maldives', MLI='Mali', MLT='Malta',
+    MHL='Marshall Islands', MTQ='Martinique', MRT='Mauritania',
+    MUS='Mauritius', MYT='Mayotte', MEX='Mexico',
+    FSM='Micronesia (Federated States of)', MCO='Monaco', MNG='Mongolia',
+    MNE='Montenegro', MSR='Montserrat', MAR='Morocco', MOZ='Mozambique',
+    MMR='Myanmar', NAM='Namibia', NRU='Nauru', NPL='Nepal',
+    NLD='Netherlands', NCL='New Caledonia', NZL='New Zealand',
+    NIC='Nicaragua', NER='Niger', NGA='Nigeria', NIU='Niue',
+    NFK='Norfolk Island', MKD='North Macedonia',
+    MNP='Northern Mariana Islands', NOR='Norway', OMN='Oman',
+    PAK='Pakistan', PLW='Palau', PSE='State of Palestine', PAN='Panama',
+    PNG='Papua New Guinea', PRY='Paraguay', PER='Peru', PHL='Philippines',
+    PCN='Pitcairn', POL='Poland', PRT='Portugal', PRI='Puerto Rico',
+    QAT='Qatar', KOR='Republic of Korea', MDA='Republic of Moldova',
+    REU='Réunion', ROU='Romania', RUS='Russian Federation', RWA='Rwanda',
+    BLM='Saint Barthélemy', SHN='Saint Helena',
+    KNA='Saint Kitts and Nevis', LCA='Saint Lucia',
+    MAF='Saint Martin (French Part)', SPM='Saint Pierre and Miquelon',
+    VCT='Saint Vincent and the Grenadines', WSM='Samoa', SMR='San Marino',
+    STP='Sao Tome and Principe', SAU='Saudi Arabia', SEN='Senegal',
+    SRB='Serbia', SYC='Seychelles', SLE='Sierra Leone', SGP='Singapore',
+    SXM='Sint Maarten (Dutch part)', SVK='Slovakia', SVN='Slovenia',
+    SLB='Solomon Islands', SOM='Somalia', ZAF='South Africa',
+    SSD='South Sudan', ESP='Spain', LKA='Sri Lanka', SDN='Sudan',
+    SUR='Suriname', SJM='Svalbard and Jan Mayen Islands', SWE='Sweden',
+    CHE='Switzerland', SYR='Syrian Arab Republic', TWN='Taiwan',
+    TJK='Tajikistan', THA='Thailand', TLS='Timor-Leste', TGO='Togo',
+    TKL='Tokelau', TON='Tonga', TTO='Trinidad and Tobago', TUN='Tunisia',
+    TUR='Turkey', TKM='Turkmenistan', TCA='Turks and Caicos Islands',
+    TUV='Tuvalu', UGA='Uganda', UKR='Ukraine',
+    ARE='United Arab Emirates',
+    GBR='United Kingdom of Great Britain and Northern Ireland',
+    TZA='United Republic of Tanzania',
+    UMI='United States Minor Outlying Islands',
+    USA='United States of America', VIR='United States Virgin Islands',
+    URY='Uruguay', UZB='Uzbekistan', VUT='Vanuatu',
+    VEN='Venezuela (Bolivarian Republic of)', VNM='Viet Nam',
+    WLF='Wallis and Futuna Islands', ESH='Western Sahara', YEM='Yemen',
+    ZMB='Zambia', ZWE='Zimbabwe',
+    )
+# other names found in the databases, or in common use
+ALIASES = {
+    'Bolivia': 'BOL', 'Brunei': 'BRN', 'Cape Verde': 'CPV',
+    'Czech Republic': 'CZE', 'Ivory Coast': 'CIV', 'Swaziland': 'SWZ',
+    'Hong Kong': 'HKG', 'Macao': 'MAC', 'Macau': 'MAC', 'Iran': 'IRN',
+    'Laos': 'LAO', 'Micronesia': 'FSM', 'Moldova': 'MDA',
+    'North Korea': 'PRK', 'South Korea': 'KOR', 'Korea': 'KOR',
+    'Palestine': 'PSE', 'Russia': 'RUS', 'Syria': 'SYR', 'Tanzania': 'TZA',
+    'Macedonia': 'MKD', 'The former Yugoslav Republic of Macedonia': 'MKD',
+    'Turkiye': 'TUR', 'United Kingdom': 'GBR', 'UK': 'GBR',
+    'Great Britain': 'GBR', 'England': 'GBR', 'Scotland': 'GBR',
+    'Wales': 'GBR', 'Northern Ireland': 'GBR', 'United States': 'USA',
+    'USA': 'USA', 'US': 'USA', 'Venezuela': 'VEN', 'Vietnam': 'VNM',
+    'Congo-Brazzaville': 'COG', 'Republic of the Congo': 'COG',
+    'Congo-Kinshasa': 'COD', 'DR Congo': 'COD', 'East Timor': 'TLS',
+    'Burma': 'MMR', 'Holland': 'NLD', 'Vatican': 'VAT',
+    'Federated States of Micronesia': 'FSM', 'Curacao': 'CUW',
+    'Reunion': 'REU',
+    }
+# columns of a population database with a country dimension (see
+# `population_country_codes`): codes, names, type of location
+POPULATION_CODE_COLUMNS = ('ISO3_code', 'ISO3 Alpha-code')
+POPULATION_NAME_COLUMN = 'Location'
+LOCATION_TYPE_COLUMN = 'LocTypeName'
+COUNTRY_LOCATION_TYPE = 'Country/Area'
+POPULATION_COUNTRY_COLUMNS = POPULATION_CODE_COLUMNS + (
+    POPULATION_NAME_COLUMN, LOCATION_TYPE_COLUMN)
+
+
+def normalize_name(name):
+    # key of a country name in the index: lower case, no accents, no
+    # punctuation, single spaces, no leading "the"
+    name = unicodedata.normalize('NFKD', str(name))
+    name = ''.join(char for char in name if not unicodedata.combining(char))
+    name = name.lower().replace('&', ' and ')
+    name = re.sub(r"[^0-9a-z]+", ' ', name.replace("'", '')).strip()
+    return re.sub(r'^the ', '', name)
+
+
+@lru_cache(maxsize=None)
+def country_index():
+    # hash table of the normalized names, aliases and codes of the countries
+    index = {}
+    for code, name in COUNTRY_NAMES.items():
+        index[normalize_name(name)] = code
+        index[code.lower()] = code
+    for alias, code in ALIASES.items():
+        index[normalize_name(alias)] = code
+    return index
+
+
+def lookup_country(name):
+    # ISO 3166-1 alpha-3 code of a country name or code (also of a
+    # subdivision code, e.g. GB-ENG), None if unknown
+    if not isinstance(name, str):
+        return None
+    code = country_code(name)
+    if code in COUNTRY_NAMES:
+        return code
+    return country_index().get(normalize_name(name))
+
+
+def country_codes(values):
+    # ISO 3166-1 alpha-3 code of each of the names or codes of `values`, as
+    # an object array (None if unknown); each distinct value is resolved once
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+    resolved = np.array(
+        [lookup_country(value) for value in uniques] + [None], dtype=object)
+    # missing values (code -1) are taken from the appended None
+    return resolved[codes]
+
+
+def recipient_country_codes(df_vaccine):
+    # country of each recipient, from the `code` column of the vaccination
+    # database, else from the `country` one
+    codes = country_codes(df_vaccine['code'].astype(object))
+    unknown = pd.isna(codes)
+    if unknown.any():
+        codes[unknown] = country_codes(
+            df_vaccine['country'].astype(object).to_numpy()[unknown])
+    return codes
+
+
+def population_country_codes(dataframe):
+    # country code of each row of a population database, from its code
+    # column if any, else its name (None where unknown); the rows with no
+    # code are regions and other aggregates, whose names can be the ones of
+    # countries (e.g. the Micronesia region), so they are not looked up by
+    # name, nor are the rows whose type of location is not a country; None
+    # if the database has no country dimension
+    code_columns = [col for col in POPULATION_CODE_COLUMNS
+                    if col in dataframe.columns]
+    if code_columns:
+        codes = country_codes(dataframe[code_columns[0]].to_numpy())
+    elif POPULATION_NAME_COLUMN in dataframe.columns:
+        codes = country_codes(dataframe[POPULATION_NAME_COLUMN].to_numpy())
+    else:
+        return None
+    if LOCATION_TYPE_COLUMN in dataframe.columns:
+        codes[(dataframe[LOCATION_TYPE_COLUMN] !=
+               COUNTRY_LOCATION_TYPE).to_numpy()] = None
+    return codes
+
+
+def join_on_country(codes, table):
+    # rows of `table` (indexed by country code) for each of the `codes`, NaN
+    # where the country is not in the table; a hash join on the codes
+    positions = pd.Index(table.index).get_indexer(
+        pd.Index(codes, dtype=object))
+    if len(table.index) == 0:
+        return pd.DataFrame(
+            np.nan, index=pd.RangeIndex(len(positions)),
+            columns=table.columns)
+    joined = table.iloc[np.maximum(positions, 0)].copy()
+    joined[positions < 0] = np.nan
+    joined.index = pd.RangeIndex(len(positions))
+    return joined
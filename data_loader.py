@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+
+Shared loading of the databases used in the analysis of the first recipients
+of COVID-19 vaccines
+http://wjgsp.com/first-covid-19-vaccines-recipients-by-country
+
+Each CSV file is parsed only once: the resulting columns are stored in a
+binary columnar cache (one .npz per database and options of `read_csv`,
+typed arrays, no pickling) keyed on the modification time and on the hash of
+the source file, and on these options. Later calls return the frame rebuilt
+from the cache.
+
+"""
+
+import os
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from schema import apply_schema
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+CACHE_DIR = os.path.join(DATA_DIR, '.cache')
+
+VACCINATION_FILE = os.path.join(
+    DATA_DIR, 'database_first_covid_vaccination.csv')
+POPULATION_FILE = os.path.join(
+    DATA_DIR, 'database_world_population_by_UN_CC-BY-3.0-IGO.csv')
+HEALTH_WORKERS_FILE = os.path.join(
+    DATA_DIR,
+    'database_sex_distribution_health_workers_by_WHO_CC-BY-NC-SA-3.0-IGO.csv')
+
+# options of `read_csv` of the databases, unless given otherwise
+READ_CSV_DEFAULTS = dict(sep=',', encoding='utf-8')
+
+HEALTH_WORKERS_COLUMNS = (
+    'country','year',
+    'male_doctor_perc','female_doctor_perc',
+    'male_nursing_perc','female_nursing_perc',
+    )
+
+
+def file_hash(filename, block_size=1<<20):
+    # sha1 of the file contents, read by blocks
+    sha = hashlib.sha1()
+    with open(filename, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def read_options(read_csv_kwargs):
+    # text of the options of `read_csv`, part of the key of the cache
+    return repr(sorted(read_csv_kwargs.items()))
+
+
+def cache_filename(filename, options=read_options(READ_CSV_DEFAULTS)):
+    # cache of the database read with `options` (see `read_options`), the
+    # ones other than the defaults having their own file
+    name = os.path.splitext(os.path.basename(filename))[0]
+    if options != read_options(READ_CSV_DEFAULTS):
+        name += '_' + hashlib.sha1(options.encode('utf-8')).hexdigest()[:12]
+    return os.path.join(CACHE_DIR, name + '.npz')
+
+
+def _frame_to_arrays(dataframe):
+    # converting the frame to a dict of typed arrays; text columns are stored
+    # as fixed width unicode plus a mask of the missing values
+    arrays = {}
+    kinds = []
+    for index, col in enumerate(dataframe.columns):
+        series = dataframe[col]
+        if series.dtype.kind in 'biuf':
+            arrays[f'col_{index}'] = series.to_numpy()
+            kinds.append('numeric')
+        else:
+            mask = series.isna().to_numpy()
+            arrays[f'col_{index}'] = np.array(
+                series.fillna('').astype(str).tolist(), dtype=str)
+            arrays[f'mask_{index}'] = mask
+            kinds.append('text')
+    arrays['__columns__'] = np.array(list(dataframe.columns), dtype=str)
+    arrays['__kinds__'] = np.array(kinds, dtype=str)
+    return arrays
+
+
+def _arrays_to_frame(arrays):
+    columns = {}
+    for index, (col, kind) in enumerate(
+            zip(arrays['__columns__'], arrays['__kinds__'])):
+        values = arrays[f'col_{index}']
+        if kind == 'text':
+            values = values.astype(object)
+            values[arrays[f'mask_{index}']] = np.nan
+        columns[str(col)] = values
+    return pd.DataFrame(columns)
+
+
+def _write_cache(filename, dataframe, source_mtime, source_hash, options):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    arrays = _frame_to_arrays(dataframe)
+    arrays['__source_mtime__'] = np.array(source_mtime, dtype=np.int64)
+    arrays['__source_hash__'] = np.array(source_hash)
+    arrays['__read_options__'] = np.array(options)
+    # writing to a temporary file first, so that an interrupted run never
+    # leaves a truncated cache behind
+    cache_file = cache_filename(filename, options)
+    temporary_file = cache_file + '.tmp'
+    with open(temporary_file, 'wb') as file:
+        np.savez(file, **arrays)
+    os.replace(temporary_file, cache_file)
+
+
+def read_database(filename, use_cache=True, **read_csv_kwargs):
+    # reading a CSV database, from the cache whenever the source and the
+    # options of `read_csv` are unchanged
+    read_csv_kwargs = {**READ_CSV_DEFAULTS, **read_csv_kwargs}
+    if not use_cache:
+        return pd.read_csv(filename, **read_csv_kwargs)
+
+    options = read_options(read_csv_kwargs)
+    source_mtime = os.stat(filename).st_mtime_ns
+    source_hash = None
+    cache_file = cache_filename(filename, options)
+    if os.path.isfile(cache_file):
+        try:
+            with np.load(cache_file, allow_pickle=False) as cached:
+                arrays = dict(cached)
+        except (OSError, ValueError):
+            arrays = None
+        # ignoring a cache of other options, or written before they were
+        # part of its key
+        if arrays is not None and \
+                str(arrays.get('__read_options__')) == options:
+            if int(arrays['__source_mtime__']) == source_mtime:
+                return _arrays_to_frame(arrays)
+            # file touched, checking if the contents actually changed
+            source_hash = file_hash(filename)
+            if str(arrays['__source_hash__']) == source_hash:
+                dataframe = _arrays_to_frame(arrays)
+                _write_cache(
+                    filename, dataframe, source_mtime, source_hash, options)
+                return dataframe
+
+    dataframe = pd.read_csv(filename, **read_csv_kwargs)
+    if source_hash is None:
+        source_hash = file_hash(filename)
+    _write_cache(filename, dataframe, source_mtime, source_hash, options)
+    return dataframe
+
+
+def load_vaccination(dropna_subset=None, filename=VACCINATION_FILE):
+    # vaccination database, typed and with stripped values (see schema.py);
+    # rows missing any of the `dropna_subset` columns are ignored
+    dataframe = apply_schema(read_database(filename))
+    if dropna_subset:
+        dataframe = dataframe.dropna(
+            axis='index',subset=list(dropna_subset)).copy()
+    return dataframe
+
+
+def load_world_population(year=None, filename=POPULATION_FILE):
+    # world population database; if `year` is given, only that year is kept
+    # and the year info is removed
+    dataframe = read_database(filename)
+    if year is not None:
+        dataframe = select_population_year(dataframe, year)
+    return dataframe
+
+
+def select_population_year(dataframe, year):
+    # rows of the world population database for `year`, without year info
+    dataframe = dataframe[dataframe['Time'] == year]
+    return dataframe.drop(['Time'],axis=1)
+
+
+def load_health_workers(filename=HEALTH_WORKERS_FILE):
+    # health workers database, with renamed columns and ignoring all rows
+    # that have no nursing staff numbers
+    dataframe = read_database(filename)
+    dataframe.columns = HEALTH_WORKERS_COLUMNS
+    return dataframe.dropna(axis='index',subset=['male_nursing_perc'])
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+
+Export of a figure in several formats and resolutions from a single drawing
+http://wjgsp.com/first-covid-19-vaccines-recipients-by-country
+
+The figure is drawn once with Agg, at the highest resolution needed by the
+raster variants; every raster variant (PNG at several DPIs, WebP
+thumbnails) is then resampled from these pixels and encoded in a pool of
+threads (Pillow releases the GIL while encoding). The vector variants (SVG,
+PDF) are written meanwhile by their own matplotlib backends, in the calling
+thread since a figure cannot be drawn from several threads.
+
+The variants are given as a list of dicts, e.g. in a JSON file:
+
+    [{"suffix": "", "format": "png", "dpi": 450},
+     {"suffix": "_thumb", "format": "webp", "width": 480},
+     {"suffix": "", "format": "svg"}]
+
+where raster variants have either a `dpi` or a `width` in pixels. The files
+written are listed in an output manifest (see `write_export_manifest`).
+
+"""
+
+import io
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# the five variants used for the website
+DEFAULT_VARIANTS = (
+    dict(suffix='', format='png', dpi=450),
+    dict(suffix='_150dpi', format='png', dpi=150),
+    dict(suffix='_thumb', format='webp', width=480),
+    dict(suffix='', format='svg'),
+    dict(suffix='', format='pdf'),
+    )
+RASTER_FORMATS = ('png', 'webp', 'jpeg', 'tiff')
+VECTOR_FORMATS = ('svg', 'pdf', 'eps', 'ps')
+EXPORT_MANIFEST_NAME = 'export_manifest.json'
+
+
+def load_variants(filename=None):
+    # variants of the JSON file `filename`, the default ones if None
+    if filename is None:
+        return [dict(variant) for variant in DEFAULT_VARIANTS]
+    with open(filename, 'r', encoding='utf-8') as file:
+        variants = json.load(file)
+    for variant in variants:
+        if variant.get('format') not in RASTER_FORMATS + VECTOR_FORMATS:
+            raise ValueError(f'unknown export format: {variant}')
+        if variant['format'] in RASTER_FORMATS and \
+                ('dpi' in variant) == ('width' in variant):
+            raise ValueError(
+                f'raster variants need either a dpi or a width: {variant}')
+    return variants
+
+
+def variant_filename(stem, variant):
+    return stem + variant.get('suffix', '') + '.' + variant['format']
+
+
+def _variant_dpi(fig, variant):
+    # resolution of a raster variant, from its width if given
+    if 'width' in variant:
+        return variant['width']/fig.get_figwidth()
+    return variant['dpi']
+
+
+def draw_pixels(fig, dpi):
+    # RGBA pixels of the figure drawn with Agg at `dpi`, the same as the
+    # ones of `savefig` in PNG
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='rgba', dpi=dpi)
+    pixels = np.frombuffer(buffer.getbuffer(), dtype=np.uint8)
+    height = int(fig.get_figheight()*dpi)
+    return pixels.reshape(height, -1, 4)
+
+
+def encode_raster(pixels, pixels_dpi, variant, filename, dpi):
+    # worker thread: resampling the pixels drawn at `pixels_dpi` to `dpi`
+    # and encoding them
+    from PIL import Image
+    image = Image.fromarray(pixels, 'RGBA')
+    if dpi != pixels_dpi:
+        scale = dpi/pixels_dpi
+        image = image.resize(
+            (max(1, round(image.width*scale)),
+             max(1, round(image.height*scale))),
+            Image.LANCZOS)
+    options = dict(dpi=(dpi, dpi))
+    if variant['format'] in ('webp', 'jpeg'):
+        options['quality'] = variant.get('quality', 85)
+    if variant['format'] == 'jpeg':
+        # no transparency in JPEG
+        image = image.convert('RGB')
+    image.save(filename, format=variant['format'].upper(), **options)
+    return dict(width=image.width, height=image.height)
+
+
+def export_figure(fig, stem, variants=DEFAULT_VARIANTS, jobs=None):
+    # writing all `variants` of the figure, named after `stem`; returns the
+    # entries of the output manifest, one per file
+    raster = [variant for variant in variants
+              if variant['format'] in RASTER_FORMATS]
+    vector = [variant for variant in variants
+              if variant['format'] not in RASTER_FORMATS]
+    entries = []
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = []
+        if raster:
+            dpis = [_variant_dpi(fig, variant) for variant in raster]
+            pixels_dpi = max(dpis)
+            pixels = draw_pixels(fig, pixels_dpi)
+            for variant, dpi in zip(raster, dpis):
+                filename = variant_filename(stem, variant)
+                futures.append((variant, filename, dpi, executor.submit(
+                    encode_raster, pixels, pixels_dpi, variant, filename,
+                    dpi)))
+        # vector formats, while the raster ones are encoded
+        for variant in vector:
+            filename = variant_filename(stem, variant)
+            fig.savefig(filename, format=variant['format'])
+            entries.append(dict(
+                file=os.path.basename(filename), format=variant['format'],
+                bytes=os.path.getsize(filename)))
+        for variant, filename, dpi, future in futures:
+            size = future.result()
+            entries.append(dict(
+                file=os.path.basename(filename), format=variant['format'],
+                dpi=round(dpi, 2), bytes=os.path.getsize(filename), **size))
+    return entries
+
+
+def write_export_manifest(entries, output_dir='.'):
+    # adding the files of the figures (`entries` by figure output name) to
+    # the output manifest of `output_dir`
+    filename = os.path.join(output_dir, EXPORT_MANIFEST_NAME)
+    manifest = {}
+    if os.path.isfile(filename):
+        try:
+            with open(filename, 'r', encoding='utf-8') as file:
+                manifest = json.load(file)
+        except ValueError:
+            manifest = {}
+    manifest.update(entries)
+    temporary_file = filename + '.tmp'
+    with open(temporary_file, 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    os.replace(temporary_file, filename)
+    return filename
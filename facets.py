@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+
+Small multiples of the age and occupation of the first recipients of COVID-19
+vaccines, one panel per vaccine, occupation band or continent
+http://wjgsp.com/first-covid-19-vaccines-recipients-by-country
+
+The recipients are split once into groups, and all the panels share the
+axis limits, occupation bands and styling of the age by occupation figure
+(see plot_age_by_occupation.py). The markers are the ones of the vaccine of
+each recipient (`vaccine_map`), their color the one of the sex. Usage:
+
+    python facets.py [--by vaccine|band|continent] [--columns N]
+                     [--separate] [--jobs N] [--output-dir .] [--dpi 450]
+
+By default, the panels are drawn in a grid in a single figure, after a
+single layout of the figure; the size of the markers in data units is then
+measured once, for all the panels. With --separate, each panel is written
+to its own file: the layout of a panel (position of the axes and size of the
+markers) is computed once, and the panels are then drawn concurrently in a
+pool of processes, without laying them out again.
+
+"""
+
+import os
+import re
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import matplotlib
+import matplotlib.pyplot as plt
+from matplotlib.lines import Line2D
+
+from data_loader import load_vaccination
+from schema import VACCINES
+from regions import CONTINENTS, continent
+from beeswarm import marker_extent
+from plot_age_by_occupation import (
+    OCCUPATION_BANDS, MARKER_SIZE, vaccine_map, occupation_band,
+    style_occupation_axes, draw_recipients)
+from instrumentation import stage, write_trace
+
+FACETS = ('vaccine', 'band', 'continent')
+FACET_TITLES = dict(
+    vaccine='vaccine', band='occupation group', continent='continent')
+REF_FONT_SIZE = 7
+# size of a panel, the one of the age by occupation figure
+PANEL_SIZE = (10/2.54, 8/2.54)
+PANEL_DPI = 300
+LEGEND_PROPERTIES = dict(
+    fancybox=False,
+    fontsize=REF_FONT_SIZE-2,
+    labelspacing=0.4,
+    handletextpad=0.25,
+    handlelength=1.5,
+    columnspacing=0.5,
+    )
+
+
+def facet_groups(dataframe, by='vaccine'):
+    # list of (group name, rows of `dataframe`) for the facet `by`, in the
+    # order of the vaccines, occupation bands or continents; rows with no
+    # group are ignored, as are empty groups
+    if by == 'vaccine':
+        keys = dataframe['vaccine'].astype(object)
+        order = list(VACCINES)
+    elif by == 'band':
+        keys = dataframe['occupation'].astype(object).map(occupation_band)
+        order = [name.replace('\n', ' ') for _, _, name in OCCUPATION_BANDS]
+    elif by == 'continent':
+        keys = dataframe['code'].map(continent)
+        order = list(CONTINENTS)
+    else:
+        raise ValueError(f'unknown facet: {by!r}')
+    keys = keys.where(pd.notna(keys), None)
+    found = set(keys.dropna())
+    order += sorted(found - set(order))
+    return [(name, dataframe[(keys == name).to_numpy()])
+            for name in order if name in found]
+
+
+def grid_shape(n_panels, columns=None):
+    # rows and columns of a grid of `n_panels` panels, as square as possible
+    # if the number of columns is not given
+    if columns is None:
+        columns = 1
+        while columns*columns < n_panels:
+            columns += 1
+    columns = max(1, min(columns, n_panels))
+    return -(-n_panels//columns), columns
+
+
+def legend_handles(sex_colors=None):
+    # handles of the sexes (colors) and vaccines (markers) of the panels
+    if sex_colors is None:
+        colormap = matplotlib.cm.get_cmap('viridis')
+        sex_colors = (colormap(0), colormap(100)) # male, female
+    marker_properties = dict(
+        linestyle='', markersize=MARKER_SIZE, markeredgewidth=0.5)
+    handles = [
+        Line2D([], [], marker='o', markerfacecolor=color, color='k',
+               label=sex, **marker_properties)
+        for sex, color in zip(('male', 'female'), sex_colors)]
+    handles += [
+        Line2D([], [], marker=marker, markerfacecolor='w', color=color,
+               label=vaccine, **marker_properties)
+        for vaccine, (marker, color) in vaccine_map.items()]
+    return handles
+
+
+def _panel_title(ax, name, dataframe):
+    ax.set_title(f'{name} ({len(dataframe.index)})', pad=20)
+
+
+def plot_facets(dataframe, by='vaccine', columns=None):
+    # single figure of the recipients of `dataframe` (rows with age info) in
+    # a grid, one panel per group of the facet `by`
+    groups = facet_groups(dataframe, by)
+    if not groups:
+        raise ValueError(f'no recipients to split by {by}')
+    rows, columns = grid_shape(len(groups), columns)
+    plt.rc('font', family='serif', size=REF_FONT_SIZE)
+    fig, axes = plt.subplots(
+        nrows=rows, ncols=columns,
+        constrained_layout=True,
+        dpi=PANEL_DPI,
+        figsize=(PANEL_SIZE[0]*columns, PANEL_SIZE[1]*rows),
+        squeeze=False,
+        )
+    axes = axes.ravel()
+    for index, (name, group) in enumerate(groups):
+        # names of the bands on the first row only; the names of the
+        # occupations also keep the lower bands out of the panel below
+        style_occupation_axes(
+            axes[index], REF_FONT_SIZE, band_labels=index < columns)
+        _panel_title(axes[index], name, group)
+    for ax in axes[len(groups):]:
+        ax.remove()
+    fig.suptitle(
+        'Age and occupation of first recipients of COVID-19 vaccine by '
+        + FACET_TITLES[by])
+
+    # a single layout for all the panels, which have the same size
+    with stage('facets/layout', panels=len(groups)):
+        fig.canvas.draw()
+        point_extent = marker_extent(axes[0], MARKER_SIZE)
+    for ax, (name, group) in zip(axes, groups):
+        with stage('facets/panel', panel=name):
+            draw_recipients(
+                ax, group, point_extent, REF_FONT_SIZE, vaccine_markers=True)
+    axes[0].legend(handles=legend_handles(), **LEGEND_PROPERTIES)
+    return fig
+
+
+def panel_layout():
+    # position of the axes of a panel drawn alone, and size of its markers
+    # in data units, from the layout of an empty panel
+    plt.rc('font', family='serif', size=REF_FONT_SIZE)
+    fig, ax = plt.subplots(
+        constrained_layout=True, dpi=PANEL_DPI, figsize=PANEL_SIZE)
+    style_occupation_axes(ax, REF_FONT_SIZE)
+    ax.set_title('title', pad=20)
+    fig.canvas.draw()
+    layout = dict(
+        position=tuple(ax.get_position().bounds),
+        point_extent=marker_extent(ax, MARKER_SIZE),
+        )
+    plt.close(fig)
+    return layout
+
+
+def plot_panel(dataframe, name, layout):
+    # figure of a single panel, with the precomputed `layout` (see
+    # `panel_layout`) instead of laying it out again
+    plt.rc('font', family='serif', size=REF_FONT_SIZE)
+    fig = plt.figure(dpi=PANEL_DPI, figsize=PANEL_SIZE)
+    ax = fig.add_axes(layout['position'])
+    style_occupation_axes(ax, REF_FONT_SIZE)
+    _panel_title(ax, name, dataframe)
+    draw_recipients(
+        ax, dataframe, layout['point_extent'], REF_FONT_SIZE,
+        vaccine_markers=True)
+    ax.legend(handles=legend_handles(), **LEGEND_PROPERTIES)
+    return fig
+
+
+def render_panel(dataframe, name, layout, filename, dpi=450):
+    # worker: drawing and saving a single panel
+    matplotlib.use('Agg')
+    with stage('draw', panel=name):
+        fig = plot_panel(dataframe, name, layout)
+    print(f'Saving: {filename}.png')
+    with stage('save', panel=name):
+        fig.savefig(filename, dpi=dpi)
+    plt.close(fig)
+    return filename + '.png'
+
+
+def panel_filename(by, name):
+    slug = re.sub(r'[^0-9a-z]+', '_', name.lower()).strip('_')
+    return f'graph_receivers_by_occupation_{by}_{slug}'
+
+
+def render_panels(dataframe, by='vaccine', output_dir='.', dpi=450,
+                  jobs=None):
+    # one file per group of the facet `by`, drawn in a pool of processes
+    groups = facet_groups(dataframe, by)
+    with stage('facets/layout', panels=len(groups)):
+        layout = panel_layout()
+    os.makedirs(output_dir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [
+            executor.submit(
+                render_panel, group, name, layout,
+                os.path.join(output_dir, panel_filename(by, name)), dpi)
+            for name, group in groups]
+        return [future.result() for future in futures]
+
+
+def parse_arguments(args=None):
+    parser = argparse.ArgumentParser(
+        description='Draw the age and occupation of the first COVID-19 '
+                    'vaccine recipients as small multiples.')
+    parser.add_argument(
+        '--by', choices=FACETS, default='vaccine',
+        help='groups of the panels (default: vaccine)')
+    parser.add_argument(
+        '--columns', type=int, default=None,
+        help='number of columns of the grid (default: as square as '
+             'possible)')
+    parser.add_argument(
+        '--separate', action='store_true',
+        help='write each panel to its own file, drawn in parallel')
+    parser.add_argument(
+        '--jobs', type=int, default=None,
+        help='number of worker processes with --separate (default: number '
+             'of CPUs)')
+    parser.add_argument('--output-dir', default='.')
+    parser.add_argument('--dpi', type=int, default=450)
+    return parser.parse_args(args)
+
+
+if __name__ == '__main__':
+    print('Start')
+    arguments = parse_arguments()
+    plt.close('all')
+
+    # ignoring all elements that have no age
+    with stage('load'):
+        dataframe = load_vaccination(dropna_subset=['age'])
+
+    if arguments.separate:
+        render_panels(dataframe, arguments.by, arguments.output_dir,
+                      arguments.dpi, arguments.jobs)
+    else:
+        os.makedirs(arguments.output_dir, exist_ok=True)
+        with stage('draw'):
+            fig = plot_facets(dataframe, arguments.by, arguments.columns)
+        filename = os.path.join(
+            arguments.output_dir,
+            f'graph_receivers_by_occupation_{arguments.by}')
+        print(f'Saving: {filename}.png')
+        with stage('save', figure=filename):
+            fig.savefig(filename, dpi=arguments.dpi)
+    write_trace()
+    print('Done')
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+
+Opt-in timing and memory instrumentation of the figures pipeline
+http://wjgsp.com/first-covid-19-vaccines-recipients-by-country
+
+Enabled by setting the environment variable DATAVIZ_TRACE to the name of the
+output file, e.g.
+
+    DATAVIZ_TRACE=trace.json python plot_age_by_occupation.py
+
+Each stage (load, aggregate, layout, draw, save) records its wall time, CPU
+time, peak of traced Python memory (tracemalloc) and the resident memory of
+the process. The output is a Chrome trace (chrome://tracing, Perfetto), the
+measures being in the `args` of each event. When disabled, `stage` does
+nothing.
+
+"""
+
+import os
+import json
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+TRACE_ENV = 'DATAVIZ_TRACE'
+
+_events = []
+_open_stages = []
+
+
+def enabled():
+    return bool(os.environ.get(TRACE_ENV))
+
+
+def _rss_kb():
+    # current resident memory of the process, in kB (Linux only)
+    try:
+        with open('/proc/self/statm', 'r') as file:
+            pages = int(file.read().split()[1])
+        return pages*os.sysconf('SC_PAGE_SIZE')//1024
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _max_rss_kb():
+    # peak resident memory of the process since it started, in kB
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+@contextmanager
+def stage(name, **details):
+    # measuring the stage `name`; `details` are added to the event
+    if not enabled():
+        yield
+        return
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    # the peak of the enclosing stage is kept before resetting it
+    if _open_stages:
+        _open_stages[-1]['peak'] = max(
+            _open_stages[-1]['peak'], tracemalloc.get_traced_memory()[1])
+    tracemalloc.reset_peak()
+    current = dict(peak=0)
+    start_traced = tracemalloc.get_traced_memory()[0]
+    _open_stages.append(current)
+
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    try:
+        yield
+    finally:
+        wall_time = time.perf_counter() - start_wall
+        cpu_time = time.process_time() - start_cpu
+        peak = max(current['peak'], tracemalloc.get_traced_memory()[1])
+        _open_stages.pop()
+        if _open_stages:
+            _open_stages[-1]['peak'] = max(_open_stages[-1]['peak'], peak)
+        _events.append(dict(
+            name=name,
+            cat='stage',
+            ph='X',
+            ts=(time.time() - wall_time)*1e6,
+            dur=wall_time*1e6,
+            pid=os.getpid(),
+            tid=threading.get_ident(),
+            args=dict(
+                details,
+                wall_time_s=wall_time,
+                cpu_time_s=cpu_time,
+                tracemalloc_peak_kb=peak//1024,
+                tracemalloc_peak_increase_kb=(peak - start_traced)//1024,
+                rss_kb=_rss_kb(),
+                max_rss_kb=_max_rss_kb(),
+                ),
+            ))
+
+
+def collect_events():
+    # events recorded so far by this process, which are then forgotten; used
+    # to gather the events of worker processes (a forked worker also holds
+    # the events of its parent, which are ignored)
+    events = [event for event in _events if event['pid'] == os.getpid()]
+    del _events[:]
+    return events
+
+
+def add_events(events):
+    _events.extend(events)
+
+
+def write_trace(filename=None):
+    # writing the recorded events as a Chrome trace, to `filename` or to the
+    # file given by DATAVIZ_TRACE
+    filename = filename or os.environ.get(TRACE_ENV)
+    if not filename:
+        return None
+    with open(filename, 'w', encoding='utf-8') as file:
+        json.dump(dict(traceEvents=_events, displayTimeUnit='ms'), file,
+                  indent=1)
+    print(f'Trace: {filename}')
+    return filename
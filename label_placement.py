@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""
+
+Automatic collision-free placement of point labels
+http://wjgsp.com/first-covid-19-vaccines-recipients-by-country
+
+Labels are placed one at a time around their point, trying a set of anchors
+(N, S, E, W and diagonals) at increasing distances, and keeping the first
+candidate whose bounding box overlaps neither a marker nor a label already
+placed, or else the candidate overlapping the fewest boxes. All boxes are in
+data coordinates and registered in a uniform grid whose cells have the size
+of a typical label, a larger box being registered in all the cells it
+covers; each candidate is only tested against the boxes of its own cells,
+for a batch of labels at once. A label which could not be placed free is
+avoided by the next labels of its batch, but only registered in the grid
+where its cells hold fewer than `FALLBACK_CELL_CAP` boxes, so that where the
+labels cannot all fit they do not pile up in the grid, and the cost of a
+label stays bounded.
+
+"""
+
+import numpy as np
+from matplotlib.font_manager import FontProperties
+
+# direction of the offset and alignment of the text for each anchor
+LABEL_ANCHORS = dict(
+    N=((0.0, 1.0), dict(ha='center',va='bottom')),
+    S=((0.0, -1.0), dict(ha='center',va='top')),
+    E=((1.0, 0.0), dict(ha='left',va='center')),
+    W=((-1.0, 0.0), dict(ha='right',va='center')),
+    NE=((0.7, 0.7), dict(ha='left',va='bottom')),
+    NW=((-0.7, 0.7), dict(ha='right',va='bottom')),
+    SE=((0.7, -0.7), dict(ha='left',va='top')),
+    SW=((-0.7, -0.7), dict(ha='right',va='top')),
+    )
+
+# fraction of the box to the left of / below the anchor, for each alignment
+_HA_SHIFT = dict(left=0.0, center=0.5, right=1.0)
+_VA_SHIFT = dict(bottom=0.0, center=0.5, top=1.0)
+# number of labels whose overlaps with the boxes of the grid are counted at
+# once
+LABEL_BATCH = 64
+# number of boxes of a cell above which the labels which could not be placed
+# free are no longer registered in it
+FALLBACK_CELL_CAP = 8
+
+
+def text_extent(
+        ax, labels, font_sizes, weights='regular', family='serif',
+        linespacing=1.2):
+    # width and height of each label in data units of the axes, multi-line
+    # labels included; sizes are measured once per distinct label style
+    renderer = ax.figure.canvas.get_renderer()
+    (x0, y0), (x1, y1) = ax.transData.transform([[0, 0], [1, 1]])
+    scale_x, scale_y = abs(x1 - x0), abs(y1 - y0)
+    font_sizes = np.broadcast_to(font_sizes, (len(labels),))
+    weights = np.broadcast_to(np.asarray(weights, dtype=object), (len(labels),))
+
+    measured = {}
+    widths = np.zeros(len(labels))
+    heights = np.zeros(len(labels))
+    for index, key in enumerate(zip(labels, font_sizes, weights)):
+        if key not in measured:
+            label, font_size, weight = key
+            prop = FontProperties(family=family, size=font_size, weight=weight)
+            lines = str(label).split('\n')
+            line_width = max(
+                renderer.get_text_width_height_descent(line, prop, False)[0]
+                for line in lines)
+            line_height = renderer.points_to_pixels(font_size)
+            measured[key] = (
+                line_width,
+                line_height*(1 + linespacing*(len(lines) - 1)))
+        widths[index], heights[index] = measured[key]
+    return widths/scale_x, heights/scale_y
+
+
+class BoxGrid(object):
+    # uniform grid over axis-aligned boxes (x0, y0, x1, y1), counting the
+    # boxes overlapping a candidate box from the cells it covers only; the
+    # grid spans `bounds` (x0, y0, x1, y1), the boxes beyond it being
+    # registered in its border cells
+    def __init__(self, cell_width, cell_height, bounds, depth=4):
+        self.shape = (
+            int((bounds[2] - bounds[0])//cell_width) + 1,
+            int((bounds[3] - bounds[1])//cell_height) + 1)
+        # to convert boxes to the columns and rows of their corner cells
+        self.origin = np.array([bounds[0], bounds[1]]*2, dtype=float)
+        self.cell_size = np.array([cell_width, cell_height]*2)
+        self.last_cell = np.array(self.shape*2) - 1
+        n_cells = self.shape[0]*self.shape[1]
+        # x0, y0, x1 and y1 of the boxes of each cell, padded with an empty
+        # box; the last cell stays empty
+        self.cell_boxes = np.empty((4, n_cells + 1, depth))
+        self.cell_boxes[:2], self.cell_boxes[2:] = np.inf, -np.inf
+        # whether each box starts in the column (1) and the row (2) of the
+        # cell
+        self.cell_flags = np.zeros((n_cells + 1, depth), dtype=np.int8)
+        self.cell_counts = np.zeros(n_cells + 1, dtype=int)
+
+    def _cell_index(self, boxes):
+        # first and last columns and rows (i0, j0, i1, j1) of the cells
+        # covered by each box
+        index = ((boxes - self.origin)//self.cell_size).astype(int)
+        return np.minimum(np.maximum(index, 0), self.last_cell)
+
+    def _covered_cells(self, boxes):
+        # cells covered by each box (box, column, row), the empty cell (-1)
+        # filling in for the smaller boxes, and whether each of them is in
+        # the first column (1) and row (2) of the box
+        i0, j0, i1, j1 = self._cell_index(boxes).T
+        di = np.arange((i1 - i0).max() + 1)[:, None]
+        dj = np.arange((j1 - j0).max() + 1)[None, :]
+        i = i0[:, None, None] + di
+        j = j0[:, None, None] + dj
+        cells = np.where(
+            (i <= i1[:, None, None]) & (j <= j1[:, None, None]),
+            i*self.shape[1] + j, -1)
+        return cells, np.broadcast_to((di == 0) + 2*(dj == 0), cells.shape)
+
+    def add(self, boxes, cap=None):
+        # registering the `boxes` (n, 4) in all the cells they cover; with a
+        # `cap`, only the boxes whose cells all hold fewer boxes
+        if len(boxes) and cap is not None:
+            cells, _ = self._covered_cells(boxes)
+            boxes = boxes[self.cell_counts[cells].max(axis=(1, 2)) < cap]
+        if not len(boxes):
+            return
+        cells, flags = self._covered_cells(boxes)
+        covered = cells >= 0
+        cells, flags = cells[covered], flags[covered]
+        box_index = np.nonzero(covered)[0]
+        # slot of each box in its cells, after the boxes already there
+        sort = np.argsort(cells, kind='stable')
+        cells, box_index, flags = cells[sort], box_index[sort], flags[sort]
+        slots = (self.cell_counts[cells] + np.arange(cells.size) -
+                 np.searchsorted(cells, cells))
+        depth = self.cell_flags.shape[1]
+        if slots.max() >= depth:
+            depth = max(2*depth, slots.max() + 1)
+            padding = np.empty((4, self.cell_boxes.shape[1],
+                                depth - self.cell_boxes.shape[2]))
+            padding[:2], padding[2:] = np.inf, -np.inf
+            self.cell_boxes = np.concatenate([self.cell_boxes, padding], axis=2)
+            self.cell_flags = np.hstack([
+                self.cell_flags, np.zeros_like(self.cell_flags, shape=(
+                    self.cell_flags.shape[0], padding.shape[2]))])
+        self.cell_boxes[:, cells, slots] = boxes[box_index].T
+        self.cell_flags[cells, slots] = flags
+        self.cell_counts += np.bincount(cells, minlength=self.cell_counts.size)
+
+    def overlap_count(self, candidates):
+        # number of boxes overlapping each of the `candidates` boxes
+        cells, corners = self._covered_cells(candidates)
+        cells_per_candidate = cells[0].size
+        corners, cells = corners.ravel(), cells.ravel()
+        # one pair per box of each of these cells, and its slot in the
+        # flattened lists of boxes of the cells
+        counts = self.cell_counts[cells]
+        pairs = np.repeat(np.arange(cells.size), counts)
+        depth = self.cell_flags.shape[1]
+        slots = np.arange(pairs.size) + np.repeat(
+            cells*depth - np.cumsum(counts) + counts, counts)
+        x0, y0, x1, y1 = np.take(
+            self.cell_boxes.reshape(4, -1), slots, axis=1)
+        # a box met in several cells of a candidate is only counted in the
+        # cell of the lower left corner of their intersection: the first
+        # column (row) of the box or of the candidate, whichever is last
+        first = np.take(self.cell_flags, slots) | np.take(corners, pairs)
+        index = pairs//cells_per_candidate
+        x = np.take(candidates, index, axis=0).T
+        overlap = (
+            (x[0] < x1) & (x[2] > x0) & (x[1] < y1) & (x[3] > y0) &
+            (first == 3))
+        return np.bincount(
+            index, weights=overlap, minlength=len(candidates)).astype(int)
+
+
+def _overlap_count(candidates, boxes, count=True):
+    # number of `boxes` overlapping each of the candidate boxes (or, if not
+    # `count`, whether each candidate overlaps each box)
+    overlap = (
+        (candidates[:, None, 0] < boxes[None, :, 2]) &
+        (candidates[:, None, 2] > boxes[None, :, 0]) &
+        (candidates[:, None, 1] < boxes[None, :, 3]) &
+        (candidates[:, None, 3] > boxes[None, :, 1])
+        )
+    return overlap.sum(axis=1) if count else overlap
+
+
+def _label_box(x, y, width, height, loc, offset):
+    alignment = LABEL_ANCHORS[loc][1]
+    x0 = x + offset[0] - _HA_SHIFT[alignment['ha']]*width
+    y0 = y + offset[1] - _VA_SHIFT[alignment['va']]*height
+    return (x0, y0, x0 + width, y0 + height)
+
+
+def place_labels(
+        x, y, widths, heights, point_width, point_height,
+        anchors=('E','W','N','S','NE','NW','SE','SW'),
+        distances=(1.0, 2.0, 3.5, 5.0, 8.0, 12.0),
+        limits=None, overrides=None):
+    # choosing the anchor and offset of the label of every point (x, y)
+    #
+    # `widths` and `heights` are the label sizes and `point_width` and
+    # `point_height` the marker diameter, all in data units. Candidates are
+    # the `anchors` at each of the `distances` (in marker diameters), tried
+    # in that order. `limits` ((xmin, xmax), (ymin, ymax)) keeps labels
+    # inside the axes. `overrides` maps a point index to a fixed
+    # (anchor, (offset_x, offset_y)); those labels are placed first. A label
+    # with no free candidate gets the first one with the fewest overlaps.
+    #
+    # returns the anchor name and the x and y offsets of each label
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    widths, heights = np.asarray(widths), np.asarray(heights)
+    overrides = dict(overrides or {})
+    n_points = x.size
+
+    locs = np.empty(n_points, dtype=object)
+    offsets = np.zeros((n_points, 2))
+    if n_points == 0:
+        return locs, offsets[:, 0], offsets[:, 1]
+
+    # cells of the size of a typical label: sized after the largest one, a
+    # single long label would make every candidate scan most of the boxes;
+    # the grid spans the points and all their candidate labels
+    reach_x = max(distances)*point_width + widths.max()
+    reach_y = max(distances)*point_height + heights.max()
+    grid = BoxGrid(
+        max(np.median(widths), point_width),
+        max(np.median(heights), point_height),
+        (x.min() - reach_x, y.min() - reach_y,
+         x.max() + reach_x, y.max() + reach_y))
+    grid.add(np.stack([
+        x - point_width/2, y - point_height/2,
+        x + point_width/2, y + point_height/2], axis=1))
+
+    for index, (loc, offset) in overrides.items():
+        locs[index], offsets[index] = loc, offset
+    if overrides:
+        grid.add(np.array([
+            _label_box(x[index], y[index], widths[index], heights[index],
+                       loc, offset)
+            for index, (loc, offset) in overrides.items()]))
+
+    candidates = [
+        (loc, (distance*LABEL_ANCHORS[loc][0][0]*point_width,
+               distance*LABEL_ANCHORS[loc][0][1]*point_height))
+        for distance in distances for loc in anchors]
+    # lower left corner of the candidate boxes relative to the point, for a
+    # label of unit width and height
+    candidate_offsets = np.array([offset for loc, offset in candidates])
+    candidate_shifts = np.array([
+        (_HA_SHIFT[LABEL_ANCHORS[loc][1]['ha']],
+         _VA_SHIFT[LABEL_ANCHORS[loc][1]['va']])
+        for loc, offset in candidates])
+
+    # labels of the points in the most crowded regions (cells of the size of
+    # the largest label) are placed first, while there is still room around
+    # them
+    cells = np.stack([
+        np.floor(x/max(widths.max(), point_width)),
+        np.floor(y/max(heights.max(), point_height))], axis=1)
+    _, cell_index, cell_count = np.unique(
+        cells, axis=0, return_inverse=True, return_counts=True)
+    order = np.argsort(
+        -cell_count[cell_index.ravel()], kind='stable')
+    order = order[~np.isin(order, list(overrides))]
+
+    # candidate boxes of every label (label, candidate, x0 y0 x1 y1), and a
+    # penalty for the ones outside the limits
+    size = np.stack([widths, heights], axis=1)[:, None, :]
+    corners = (np.stack([x, y], axis=1)[:, None, :] + candidate_offsets -
+               candidate_shifts*size)
+    boxes = np.concatenate([corners, corners + size], axis=2)
+    penalty = np.zeros(boxes.shape[:2], dtype=int)
+    if limits is not None:
+        (xmin, xmax), (ymin, ymax) = limits
+        penalty += n_points*(
+            (boxes[..., 0] < xmin) | (boxes[..., 2] > xmax) |
+            (boxes[..., 1] < ymin) | (boxes[..., 3] > ymax))
+
+    def grid_cost(labels, first, last):
+        # overlaps with the boxes of the grid of the candidates `first` to
+        # `last` of `labels`, plus the penalty
+        cost = grid.overlap_count(
+            boxes[labels, first:last].reshape(-1, 4)).reshape(labels.size, -1)
+        return cost + penalty[labels, first:last]
+
+    # the closest candidates are tested first, the others only if none of
+    # them is free; the overlaps with the boxes of the grid are counted for
+    # a batch of labels at once, and the ones with the labels placed before
+    # in the batch added label by label
+    n_near = len(anchors)*min(2, len(distances))
+    for start in range(0, order.size, LABEL_BATCH):
+        batch = order[start:start + LABEL_BATCH]
+        near_costs = grid_cost(batch, 0, n_near)
+        far_costs = {}
+        # labels of the batch whose candidates may overlap
+        extent = np.hstack([boxes[batch, :, :2].min(axis=1),
+                            boxes[batch, :, 2:].max(axis=1)])
+        neighbours = _overlap_count(extent, extent, count=False).tolist()
+        placed, free = [], []
+        for position, index in enumerate(batch):
+            neighbour_boxes = [box for other, box in placed
+                               if neighbours[position][other]]
+            if neighbour_boxes:
+                neighbour_boxes = np.array(neighbour_boxes)
+            cost = near_costs[position]
+            if len(neighbour_boxes):
+                cost = cost + _overlap_count(
+                    boxes[index, :n_near], neighbour_boxes)
+            if cost.min() > 0 and n_near < len(candidates):
+                if index not in far_costs:
+                    # the next labels of the batch are likely to need them
+                    far_costs = dict(zip(
+                        batch[position:],
+                        grid_cost(batch[position:], n_near, None)))
+                far_cost = far_costs[index]
+                if len(neighbour_boxes):
+                    far_cost = far_cost + _overlap_count(
+                        boxes[index, n_near:], neighbour_boxes)
+                cost = np.concatenate([cost, far_cost])
+            # first candidate with the lowest number of overlaps
+            best = int(np.argmin(cost))
+            locs[index], offsets[index] = candidates[best]
+            placed.append((position, boxes[index, best]))
+            free.append(cost[best] == 0)
+        # a label which could not be placed free is only registered where
+        # the cells are not full: where the labels cannot all fit, the boxes
+        # of the grid would otherwise pile up, and the cost of each label
+        # grow with their number
+        placed_boxes, free = np.array([box for _, box in placed]), \
+            np.array(free)
+        grid.add(placed_boxes[free])
+        grid.add(placed_boxes[~free], cap=FALLBACK_CELL_CAP)
+
+    return locs, offsets[:, 0], offsets[:, 1]
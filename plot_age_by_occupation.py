@@ -12,67 +12,78 @@ wjgsp.com
 """
 
 import numpy as np
-import pandas as pd
 import matplotlib
 import matplotlib.pyplot as plt
 from matplotlib.ticker import AutoMinorLocator
-import seaborn as sns
+from matplotlib.collections import LineCollection, PolyCollection
 
-if __name__ == '__main__':
-    print('Start')
-    plt.close('all')
-    
-    ref_font_size = 7
-    colormap = matplotlib.cm.get_cmap('viridis')
-    sex_colors = (colormap(100),colormap(0)) # female, male
-    marker_size = 4
-    
-    plt.rc('font', family='serif', size=ref_font_size)
-    
-    fig_size=(10/2.54,8/2.54)
-    legend_prop_dict = dict(
-        fancybox=False, 
-        fontsize=ref_font_size-2,
-        labelspacing=0.4,
-        handletextpad=0.25,
-        handlelength=1.5,
-        columnspacing=0.5,
-        )
-    
-    dataframe_raw = pd.read_csv(
-        'data/database_first_covid_vaccination.csv',sep=',',encoding='utf-8')
-    
-    # ignoring all elements that have no age
-    dataframe = dataframe_raw.dropna(axis='index',subset=['age']).copy()
-    
-    sex_map = dict(male='s', female='o')
-    vaccine_map = {'Oxford Univ./AstraZeneca':['o','k'],
-                   'Pfizer/BioNTech':['s','r'],
-                   'Sinopharm':['v','g'],
-                   'Sinovac':['^','b'],
-                   'Sputnik V':['D','k'],
-                   }
-    occupation_map = {'retired':0,
-                      'health minister':1,
-                      'prime minister':2,
-                      'president':3,
-                      'nurse':4,
-                      'sanitation worker':5, 
-                      'medical doctor':6, 
-                      }
-    
-    compare_series_str = lambda series, string: [
-        val.strip() == string.strip() for val in series]
-    
-    fig, ax = plt.subplots(
-        nrows=1, ncols=1,
-        constrained_layout=True,
-        dpi=300,
-        figsize=fig_size,
-        )
+from data_loader import load_vaccination
+from schema import OCCUPATIONS, float_ages
+from beeswarm import marker_extent, beeswarm_layout
+from label_placement import LABEL_ANCHORS, text_extent, place_labels
+from instrumentation import stage, write_trace
+
+sex_map = dict(male='s', female='o')
+vaccine_map = {'Oxford Univ./AstraZeneca':['o','k'],
+               'Pfizer/BioNTech':['s','r'],
+               'Sinopharm':['v','g'],
+               'Sinovac':['^','b'],
+               'Sputnik V':['D','k'],
+               }
+# position of each occupation on the x axis, in the order of the schema
+occupation_map = {occupation: position for position, occupation in
+                  enumerate(OCCUPATIONS)}
+
+def leader_lines(point_xy, label_xy, point_width, point_height):
+    # segments from the labels anchors to the edge of the markers, which are
+    # `point_width` by `point_height` in data units; labels over their
+    # marker get no line
+    delta = label_xy - point_xy
+    # distance in marker diameters, as seen on the figure
+    distance = np.hypot(delta[:, 0]/point_width, delta[:, 1]/point_height)
+    visible = distance > 0.5
+    start = point_xy[visible] + \
+        delta[visible]*(0.5/distance[visible])[:, np.newaxis]
+    return np.stack([label_xy[visible], start], axis=1)
+
+
+# occupation bands: limits on the x axis, color and name
+OCCUPATION_BANDS = (
+    ((-0.5, 0.5), 'blue', 'people at\nhigher risk'),
+    ((0.5, 3.5), 'red', 'government\nofficials'),
+    ((3.5, 6.5), 'green', 'front-line\nworkers'),
+    )
+MARKER_SIZE = 4
+# special labels of the youngest and oldest recipients, by country code and
+# age: other recipients of the same age keep the name of their country
+HIGHLIGHTED_LABELS = {
+    ('EST', 24): 'Estonian\n24-years-old\nmedical\nresident',
+    ('DEU', 101): '101-years-old\nGerman senior care\nfacility resident',
+    }
+# level of detail: above this number of recipients in an occupation, they are
+# drawn as a density (see `draw_density`), only the outliers and highlighted
+# ones being drawn as labeled points, at most `DETAIL_LIMIT` of them
+DENSITY_THRESHOLD = 100
+DETAIL_LIMIT = 10
+
+def occupation_band(occupation):
+    # name of the band of an occupation, on a single line; None if unknown
+    position = occupation_map.get(occupation)
+    if position is None:
+        return None
+    for (band_min, band_max), _, band_name in OCCUPATION_BANDS:
+        if band_min < position < band_max:
+            return band_name.replace('\n', ' ')
+    return None
+
+
+def style_occupation_axes(ax, ref_font_size=7, band_labels=True):
+    # limits, grid, occupation bands and ticks of the axes, the same for all
+    # the panels of the small multiples (see facets.py); the names of the
+    # bands are only written if `band_labels`
     
-    # as indicated on documentation, defining axis before producing
-    # the swarmplot
+    # defining axis before computing the swarm layout and the labels
+    # location, since they depend on the size of the markers in data units
     ax.set_xlim([-0.5,6.5])
     ax.set_ylim([20,104])
     
@@ -86,54 +97,11 @@ if __name__ == '__main__':
     ax.grid(linewidth=0.5, which='both', axis='both')
     ax.grid(linewidth=1.0, which='major', axis='both')
     ax.set_axisbelow(True)
-    
-    sns.swarmplot(
-        x=dataframe['occupation'].map(occupation_map),
-        y=dataframe['age'],
-        hue=list(dataframe['sex']),
-        dodge=False,
-        size=marker_size,
-        palette=sex_colors,
-        ax=ax,
-        edgecolor='k',
-        linewidth=0.5,
-        )
-    
-    # getting the different elements and associating them to the rows in the
-    # database
-    dataframe.insert(2, 'plotX', dataframe.age.values*0)
-    dataframe.insert(2, 'label_loc', 'N')
-    
-    for index_occupation, occupation in enumerate(occupation_map.keys()):
-        scatter_locations = np.array(
-            ax.get_children()[index_occupation].get_offsets()
-            )
-        dataframe_by_occupation = \
-            dataframe[dataframe.occupation == occupation].copy()
-        count_duplicates = np.zeros(dataframe_by_occupation.shape[0],dtype=int)
-        index_case = 0
-        for index_row, vaccinated in dataframe_by_occupation.sort_values(
-                by='age', ascending=True).iterrows():
-            mask_age = np.abs(
-                scatter_locations[:,1] - float(vaccinated['age'])) < 0.1
-            if np.sum(mask_age) > 1:
-                dataframe.loc[index_row,'plotX'] = scatter_locations[
-                    mask_age,0][count_duplicates[index_case-1]]
-                count_duplicates[index_case] += 1
-            else:
-                dataframe.loc[index_row,'plotX'] = scatter_locations[mask_age,0]
-            index_case += 1
-    
-    # selecing Sweden point position's directly
-    dataframe.loc[dataframe.country == 'Sweden','plotX'] = \
-        float(-dataframe.loc[dataframe.country == 'Costa Rica','plotX'])
+    # no major grid lines over the categories
+    ax.xaxis.grid(False, which='major')
     
     # adding bands to define major categories
-    for band_limits, band_color, band_name in zip(
-            ((-0.5, 0.5), (0.5, 3.5), (3.5, 6.5)),
-            ('blue','red','green'),
-            ('people at\nhigher risk','government\nofficials','front-line\nworkers'),
-        ):
+    for band_limits, band_color, band_name in OCCUPATION_BANDS:
         
         color_rgb = list(matplotlib.colors.to_rgba(band_color))
         # modifying transparence
@@ -149,133 +117,21 @@ if __name__ == '__main__':
                 linewidth=0.5,
                 )
         
-        annotation_citation = ax.annotate(
-            band_name,
-            xy=[(band_limits[0]+band_limits[1])/2, 104.5],
-            multialignment='center',
-            annotation_clip=False,
-            xycoords='data',
-            ha='center',
-            va='bottom',
-            fontsize=ref_font_size-1.5,
-            rotation=0,
-            )
-    
-    # dictionary indicating the relative position of the label
-    # label is placed manually
-    label_loc_dict = dict(
-        N=dict(ha='center',va='bottom'),
-        S=dict(ha='center',va='top'),
-        W=dict(ha='right',va='center'),
-        E=dict(ha='left',va='center'),
-        )
-    dataframe.loc[:,'label_loc'] = 'N'
-    
-    dataframe.insert(2, 'label_offsetX', np.zeros((dataframe.shape[0])))
-    dataframe.insert(2, 'label_offsetY', np.zeros((dataframe.shape[0])))
-    
-    # global definition of labels location
-    dataframe.loc[dataframe.label_loc == 'N', 'label_offsetX'] = +.0
-    dataframe.loc[dataframe.label_loc == 'N', 'label_offsetY'] = 4
-    
-    dataframe.loc[dataframe.plotX % 1.0 < 0.999, 'label_loc'] = 'W'
-    dataframe.loc[dataframe.label_loc == 'W', 'label_offsetX'] = -.1
-    dataframe.loc[dataframe.label_loc == 'W', 'label_offsetY'] = 4
-    
-    dataframe.loc[dataframe.plotX % 1.0 < 0.5, 'label_loc'] = 'E'
-    dataframe.loc[dataframe.label_loc == 'E', 'label_offsetX'] = +.1
-    dataframe.loc[dataframe.label_loc == 'E', 'label_offsetY'] = 4
-    
-    def define_loc_by_country(country,loc,offset=(0,5)):
-        mask_country = dataframe.country == country
-        dataframe.loc[mask_country,'label_loc'] = loc
-        dataframe.loc[mask_country,'label_offsetX'] = offset[0]
-        dataframe.loc[mask_country,'label_offsetY'] = offset[1]
-    
-    # setting labels location country by country
-    define_loc_by_country('Austria','E',(+.2,-1.2))
-    define_loc_by_country('Belgium','W',(-.0,+3))
-    define_loc_by_country('Brazil','E',(+.1,+3))
-    define_loc_by_country('Bulgaria','S',(-.1,-4))
-    define_loc_by_country('Canada','E',(+.2,-4))
-    define_loc_by_country('Chile','E',(+.1,+3))
-    define_loc_by_country('Costa Rica','E',(+.2,+0))
-    define_loc_by_country('Croatia','E',(+.3,-0.25))
-    define_loc_by_country('Czechia','E',(+.15,+4))
-    define_loc_by_country('Denmark','S',(+.15,-7.5))
-    define_loc_by_country('England','W',(+.05,-17))
-    define_loc_by_country('France','S',(+.2,-3))
-    define_loc_by_country('Germany','E',(+.2,+1))
-    define_loc_by_country('Ireland','E',(+.1,-2))
-    define_loc_by_country('India','S',(+.2,-3))
-    define_loc_by_country('Italy','E',(+.2,+1))
-    define_loc_by_country('Kuwait','W',(0,+4))
-    define_loc_by_country('Luxembourg','W',(-.05,-5))
-    define_loc_by_country('Malta','E',(+.3,0))
-    define_loc_by_country('Mexico','E',(+.2,+3))
-    define_loc_by_country('Netherlands','E',(+.1,+2.5))
-    define_loc_by_country('Norway','S',(+.1,-4))
-    define_loc_by_country('Romania','E',(+.15,-1))
-    define_loc_by_country('Serbia','S',(-.1,-4))
-    define_loc_by_country('Singapore','W',(-.2,0))
-    define_loc_by_country('Spain','E',(+.2,2))
-    define_loc_by_country('Slovakia','W',(-.1,-4))
-    define_loc_by_country('Sweden','S',(-.04,-3))
-    define_loc_by_country('Switzerland','E',(+.3,-2.75))
-    define_loc_by_country('Turkey','S',(+.1,-4))
-    define_loc_by_country('United States','W',(-.15,+1.5))
-    
-    # adding text label for all countries
-    for index_row, vaccinated in dataframe.iterrows():
-        code = vaccinated.code
-        occupation_index = vaccinated.map(occupation_map).occupation
-        age = vaccinated.age
-        
-        label = vaccinated.country
-        label_font_size = ref_font_size-4.0
-        weight = 'regular'
-        
-        # special labels for lowest and highest ages
-        if age == 24:
-            label = 'Estonian\n24-years-old\nmedical\nresident'
-            label_font_size += 1
-            weight='bold'
-        if age == 101:
-            label = '101-years-old\nGerman senior care\nfacility resident'
-            label_font_size += 1
-            vaccinated.label_offsetX += 0.5
-            vaccinated.label_offsetY += -3.0
-            weight='bold'
-            
-        ax.annotate(
-            label,
-            fontsize=label_font_size,
-            xy=(vaccinated.plotX, age),
-            xytext=(
-                vaccinated.plotX + vaccinated.label_offsetX,
-                age + vaccinated.label_offsetY,
-                ),
-            textcoords='data',
-            rotation=0,
-            arrowprops=dict(
-                 arrowstyle='-',
-                 facecolor='black',
-                 linewidth=0.5,
-                 shrinkA=0.0, shrinkB=marker_size/2,
-                 ),
-            bbox=dict(
-                 fc='none', ec='none', pad=0.5
-                 ),
-            **label_loc_dict[vaccinated.label_loc],
-            weight=weight,
-        )
+        if band_labels:
+            annotation_citation = ax.annotate(
+                band_name,
+                xy=[(band_limits[0]+band_limits[1])/2, 104.5],
+                multialignment='center',
+                annotation_clip=False,
+                xycoords='data',
+                ha='center',
+                va='bottom',
+                fontsize=ref_font_size-1.5,
+                rotation=0,
+                )
     
     ax.set_xlabel('', fontsize=ref_font_size)
     ax.set_ylabel('age in years', fontsize=ref_font_size, labelpad=0)
-    ax.set_title(
-        'Age and occupation of first recipients of\nCOVID-19 vaccine by country',
-        pad=20,
-        )
     
     ax.set_xticks(list(occupation_map.values()))
     ax.set_xticklabels(
@@ -289,18 +145,305 @@ if __name__ == '__main__':
         )
     for tick in ax.xaxis.get_major_ticks():
         tick.label1.set_verticalalignment('center')
+
+
+def highlighted_labels(codes, ages):
+    # special label of each row (see `HIGHLIGHTED_LABELS`), None for the
+    # rows that are not highlighted
+    labels = np.full(len(ages), None, dtype=object)
+    for (code, age), label in HIGHLIGHTED_LABELS.items():
+        labels[(np.asarray(codes) == code) & (np.asarray(ages) == age)] = label
+    return labels
+
+
+def detailed_rows(ages, positions, threshold=DENSITY_THRESHOLD,
+                  limit=DETAIL_LIMIT, highlighted=None):
+    # rows drawn as individual points: all the rows of the occupations
+    # (`positions`) with at most `threshold` recipients, all if None; else
+    # at most `limit` rows: the `highlighted` ones (boolean mask, see
+    # `highlighted_labels`), then the outliers (beyond 1.5 interquartile
+    # range of the ages of the occupation), the farthest from the median
+    # first
+    if highlighted is None:
+        highlighted = np.zeros(ages.size, dtype=bool)
+    detailed = np.ones(ages.size, dtype=bool)
+    if threshold is None:
+        return detailed
+    known = ~np.isnan(positions) & ~np.isnan(ages)
+    for position in np.unique(positions[known]):
+        rows = np.flatnonzero(known & (positions == position))
+        if rows.size <= threshold:
+            continue
+        occupation_ages = ages[rows]
+        q1, median, q3 = np.percentile(occupation_ages, [25, 50, 75])
+        fence = 1.5*(q3 - q1)
+        outliers = rows[(occupation_ages < q1 - fence) |
+                        (occupation_ages > q3 + fence)]
+        outliers = outliers[np.argsort(
+            -np.abs(ages[outliers] - median), kind='stable')]
+        special = rows[highlighted[rows]][:limit]
+        detailed[rows] = False
+        detailed[special] = True
+        detailed[outliers[:limit - special.size]] = True
+    return detailed
+
+
+def draw_density(ax, ages, positions, sexes, sex_colors, half_width=0.45):
+    # density of the recipients of each occupation (`positions`) by year of
+    # age, as split violins: females on the left of the occupation, males on
+    # the right, the widths being proportional to the counts of all the
+    # occupations; binned with a single 2-D histogram per sex and drawn as a
+    # single collection of rectangles per sex, whose size depends only on
+    # the number of occupations and ages, not of recipients
+    ymin, ymax = ax.get_ylim()
+    age_edges = np.arange(np.floor(ymin), np.ceil(ymax) + 1)
+    occupation_edges = np.arange(len(occupation_map) + 1) - 0.5
+    histograms = {}
+    for sex in ('female', 'male'):
+        mask_sex = sexes == sex
+        histograms[sex] = np.histogram2d(
+            positions[mask_sex], ages[mask_sex],
+            bins=(occupation_edges, age_edges))[0]
+    scale = half_width/max(max(h.max() for h in histograms.values()), 1)
+    collections = {}
+    for (sex, histogram), direction, sex_color in zip(
+            histograms.items(), (-1, 1), sex_colors):
+        occupation, age = np.nonzero(histogram)
+        x0 = occupation.astype(float)
+        x1 = x0 + direction*histogram[occupation, age]*scale
+        y0, y1 = age_edges[age], age_edges[age + 1]
+        collections[sex] = ax.add_collection(PolyCollection(
+            np.stack([np.stack([x0, y0], axis=1), np.stack([x1, y0], axis=1),
+                      np.stack([x1, y1], axis=1), np.stack([x0, y1], axis=1)],
+                     axis=1),
+            facecolors=[sex_color],
+            edgecolors='none',
+            alpha=0.8,
+            zorder=1.5,
+            ))
+    return collections
+
+
+def draw_recipients(
+        ax, dataframe, point_extent=None, ref_font_size=7,
+        label_overrides=None, vaccine_markers=False,
+        density_threshold=DENSITY_THRESHOLD):
+    # labeled points of the recipients of `dataframe` on axes styled by
+    # `style_occupation_axes`; `point_extent` is the size of the markers in
+    # data units (see `beeswarm.marker_extent`), measured on these axes if
+    # None; with `vaccine_markers`, the marker and its edge color are the
+    # ones of the vaccine (see `vaccine_map`)
+    #
+    # the occupations with more than `density_threshold` recipients (None
+    # for no limit) are drawn as a density, with only their outliers and
+    # highlighted recipients as labeled points (see `detailed_rows`)
+    #
+    # returns the artists (`scatter` of each sex, `labels` in the order of
+    # the rows drawn as points, leader `lines`, `density` of each sex) and
+    # the layout of the points and labels (`point_xy`, `label_xy`,
+    # `point_extent`), e.g. to animate them
+    dataframe = dataframe.copy()
+    # plain values for plotting: float ages, text countries
+    dataframe['age'] = float_ages(dataframe['age'])
+    dataframe['country'] = dataframe['country'].astype(str)
+    
+    colormap = matplotlib.cm.get_cmap('viridis')
+    sex_colors = (colormap(100),colormap(0)) # female, male
+    marker_size = MARKER_SIZE
+    
+    # swarm layout computed directly from ages and occupations, in the order
+    # of the rows of the database
+    occupation_positions = dataframe['occupation'].astype(str).map(
+        occupation_map).to_numpy(dtype=float)
+    # highlighted recipients, identified by country and age
+    special_labels = highlighted_labels(
+        dataframe['code'].astype(str).to_numpy(), dataframe['age'].to_numpy())
+    # level of detail: crowded occupations drawn as a density
+    detailed = detailed_rows(
+        dataframe['age'].to_numpy(), occupation_positions, density_threshold,
+        highlighted=special_labels != None)
+    density = {}
+    if not detailed.all():
+        with stage('layout/density', points=int((~detailed).sum())):
+            density = draw_density(
+                ax, dataframe['age'].to_numpy()[~detailed],
+                occupation_positions[~detailed],
+                dataframe['sex'].astype(object).to_numpy()[~detailed],
+                sex_colors)
+        dataframe = dataframe[detailed].copy()
+        occupation_positions = occupation_positions[detailed]
+        special_labels = special_labels[detailed]
+    if point_extent is None:
+        point_extent = marker_extent(ax, marker_size)
+    point_width, point_height = point_extent
+    with stage('layout/swarm', points=len(dataframe.index)):
+        dataframe.insert(2, 'plotX', beeswarm_layout(
+            dataframe['age'], occupation_positions, point_width, point_height))
+    
+    if vaccine_markers:
+        vaccines = dataframe['vaccine'].astype(str)
+        marker_groups = [
+            (vaccines == vaccine, marker, edge_color)
+            for vaccine, (marker, edge_color) in vaccine_map.items()]
+        marker_groups.append(
+            (~vaccines.isin(list(vaccine_map)), 'o', 'k'))
+    else:
+        marker_groups = [(True, 'o', 'k')]
+    sex_handles = {}
+    for sex, sex_color in zip(('female','male'), sex_colors):
+        for mask_marker, marker, edge_color in marker_groups:
+            mask_sex = (dataframe['sex'] == sex) & mask_marker
+            if vaccine_markers and not mask_sex.any():
+                continue
+            sex_handles[sex] = ax.scatter(
+                dataframe.loc[mask_sex,'plotX'],
+                dataframe.loc[mask_sex,'age'],
+                s=marker_size**2,
+                color=sex_color,
+                marker=marker,
+                edgecolor=edge_color,
+                linewidth=0.5,
+                zorder=2,
+                )
+    
+    # label text, special labels for the youngest and oldest recipients
+    dataframe.insert(2, 'label', dataframe['country'])
+    dataframe.insert(2, 'label_font_size', ref_font_size-4.0)
+    dataframe.insert(2, 'label_weight', 'regular')
+    mask_special = special_labels != None
+    dataframe.loc[mask_special,'label'] = special_labels[mask_special]
+    dataframe.loc[mask_special,'label_font_size'] += 1
+    dataframe.loc[mask_special,'label_weight'] = 'bold'
+    
+    with stage('layout/labels', labels=len(dataframe.index)):
+        label_widths, label_heights = text_extent(
+            ax,
+            dataframe['label'].tolist(),
+            dataframe['label_font_size'].values,
+            dataframe['label_weight'].values,
+            )
+        # a country override applies to the label of each of its recipients
+        label_overrides = label_overrides or {}
+        overrides = {position: label_overrides[country] for position, country
+                     in enumerate(dataframe['country'])
+                     if country in label_overrides}
+        label_loc, label_offsetX, label_offsetY = place_labels(
+            dataframe['plotX'].values,
+            dataframe['age'].values,
+            label_widths, label_heights,
+            point_width, point_height,
+            limits=(ax.get_xlim(), ax.get_ylim()),
+            overrides=overrides,
+            )
+    dataframe.insert(2, 'label_loc', label_loc)
+    dataframe.insert(2, 'label_offsetX', label_offsetX)
+    dataframe.insert(2, 'label_offsetY', label_offsetY)
+    
+    # leader lines of all labels as a single collection, from the label
+    # anchor to the edge of the marker
+    point_xy = dataframe[['plotX', 'age']].to_numpy(dtype=float)
+    label_xy = point_xy + dataframe[
+        ['label_offsetX', 'label_offsetY']].to_numpy(dtype=float)
+    with stage('artists/labels', labels=len(dataframe.index)):
+        lines = ax.add_collection(LineCollection(
+            leader_lines(point_xy, label_xy, point_width, point_height),
+            colors='black',
+            linewidths=0.5,
+            zorder=3,
+            ))
+        
+        # adding text label for all countries
+        labels = []
+        for label, (x, y), font_size, weight, loc in zip(
+                dataframe['label'], label_xy, dataframe['label_font_size'],
+                dataframe['label_weight'], dataframe['label_loc']):
+            labels.append(ax.text(
+                x, y, label,
+                fontsize=font_size,
+                rotation=0,
+                weight=weight,
+                **LABEL_ANCHORS[loc][1],
+                ))
+    return dict(
+        scatter=sex_handles,
+        labels=labels,
+        lines=lines,
+        density=density,
+        point_xy=point_xy,
+        label_xy=label_xy,
+        point_extent=point_extent,
+        )
+
+
+def plot_age_by_occupation(
+        dataframe, label_overrides=None, density_threshold=DENSITY_THRESHOLD):
+    # figure of the age and occupation of the recipients, one labeled point
+    # per country; `dataframe` holds the rows of the vaccination database
+    # with age info; the occupations with more than `density_threshold`
+    # recipients are drawn as a density (see `draw_recipients`)
+    #
+    # `label_overrides` is the manual location of labels, by country, as
+    # (anchor, (offsetX, offsetY)) in data units, e.g.
+    # {'England': ('W', (+.05,-17))}, applied to the label of each recipient
+    # of the country; all other labels are placed automatically
+    ref_font_size = 7
+    
+    plt.rc('font', family='serif', size=ref_font_size)
+    
+    fig_size=(10/2.54,8/2.54)
+    legend_prop_dict = dict(
+        fancybox=False, 
+        fontsize=ref_font_size-2,
+        labelspacing=0.4,
+        handletextpad=0.25,
+        handlelength=1.5,
+        columnspacing=0.5,
+        )
+    
+    fig, ax = plt.subplots(
+        nrows=1, ncols=1,
+        constrained_layout=True,
+        dpi=300,
+        figsize=fig_size,
+        )
+    
+    style_occupation_axes(ax, ref_font_size)
+    ax.set_title(
+        'Age and occupation of first recipients of\nCOVID-19 vaccine by country',
+        pad=20,
+        )
+    
+    # running the layout of the figure before converting marker and label
+    # sizes to data units, since it changes the size of the axes
+    fig.canvas.draw()
+    
+    sex_handles = draw_recipients(
+        ax, dataframe, ref_font_size=ref_font_size,
+        label_overrides=label_overrides,
+        density_threshold=density_threshold)['scatter']
     
-    # remove original legend and building a new one with my parameters
-    ax.get_legend().remove()
-    handles = [ax.get_children()[0], ax.get_children()[6]]
     ax.legend(
         labels=['male','female'],
-        handles=handles,
+        handles=[sex_handles['male'], sex_handles['female']],
         **legend_prop_dict,
         )
     
+    return fig
+
+if __name__ == '__main__':
+    print('Start')
+    plt.close('all')
+    
+    # ignoring all elements that have no age
+    with stage('load'):
+        dataframe = load_vaccination(dropna_subset=['age'])
+    
+    with stage('draw'):
+        fig = plot_age_by_occupation(dataframe)
+    
     filename = 'graph_receivers_by_occupation_country'
     print(f'Saving: {filename}.png')
-    fig.savefig(filename,dpi=450)
-    print('Done')
-    
\ No newline at end of file
+    with stage('save', figure=filename):
+        fig.savefig(filename,dpi=450)
+    write_trace()
+    print('Done')
\ No newline at end of file
@@ -11,12 +11,15 @@ wjgsp.com
 
 """
 
-import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.text
 from matplotlib.ticker import AutoMinorLocator
 
+from data_loader import load_vaccination, load_world_population
+from aggregation import age_distribution
+from instrumentation import stage, write_trace
+
 # custom classes to allow using a string as legend handler
 # from: https://matplotlib.org/3.3.3/tutorials/intermediate/legend_guide.html
 # and
@@ -48,9 +51,15 @@ class TextHandler(object):
 from matplotlib.legend import Legend
 Legend.update_default_handler_map({AnyObject: TextHandler()})
 
-if __name__ == '__main__':
-    print('Start')
-    plt.close("all")
+# fraction of the height of the axes kept free for the legend when the bars
+# go over the default 15%
+LEGEND_HEADROOM = 0.3
+
+def plot_distribution_by_age(age_stats, year_to_consider=2015):
+    # figure of the age distribution of the recipients compared to the world
+    # age structure, from the output of `aggregation.age_distribution`; the
+    # bars of the recipients and their counts have the gids `recipients` and
+    # `recipients_count_<bin>` (see timeline.py)
     
     # general plot properties
     ref_font_size = 7
@@ -75,79 +84,60 @@ if __name__ == '__main__':
         figsize=figure_size,
         )
     
-    #### vaccination database ###
-    df_vaccine_raw = pd.read_csv(
-        'data/database_first_covid_vaccination.csv',sep=',',encoding='utf-8')
-    # ignoring all rows that have no age
-    df_vaccine = df_vaccine_raw.dropna(axis='index',subset=['age']).copy()
-    
-    #### world population database ###
-    df_population = pd.read_csv(
-        'data/database_world_population_by_UN_CC-BY-3.0-IGO.csv',
-        delimiter=',',encoding='utf-8'
-        )
-    year_to_consider = 2015
-    mask_year = df_population['Time'] == year_to_consider
-    df_population = df_population[mask_year]
-    # remove year info, since only `year_to_consider` is considered
-    df_population = df_population.drop(['Time'],axis=1)
-    
-    age_categories = list(df_population.columns)
-    age_categories.remove('Sex')
-    
-    df_population['total'] = df_population.sum(axis=1)
-    
-    mask_both_sexes = df_population['Sex'] == 'Both sexes combined'
-    
-    age_bins = []
-    for col in age_categories:
-        age_bins.append(
-            int(col.split('-')[0].replace('+',''))
-            )
-    age_bin_width = (age_bins[1] + age_bins[0])
-    age_bins_centers = np.array(age_bins + [105])+age_bin_width/2
-    
-    # calculating the age distribution
-    df_population.loc[5] = \
-       ['Age proportion'] + (
-           df_population[age_categories + ['total']][mask_both_sexes].values/
-               df_population[mask_both_sexes]['total'].values
-                   ).tolist()[0]
-    
-    vaccine_age_heights, bins = np.histogram(
-        df_vaccine['age'],
-        bins=age_bins + [
-            age_bins[-1]+age_bin_width,age_bins[-1]+2*age_bin_width
-            ]
-        )
-    vaccine_age_percentage = [
-        (h/sum(vaccine_age_heights))*100 for h in vaccine_age_heights]
+    # bins of the world population, and of the recipients (which can have
+    # one more bin, above the last one of the world population)
+    age_edges = np.asarray(age_stats['age_edges'])
+    vaccine_age_edges = np.asarray(age_stats['vaccine_age_edges'])
+    world_age_centers = (age_edges[:-1] + age_edges[1:])/2
+    age_bins_centers = age_stats['age_bins_centers']
+    vaccine_age_heights = age_stats['vaccine_age_heights']
+    vaccine_age_percentage = age_stats['vaccine_age_percentage']
+    world_age_proportion = age_stats['world_age_proportion']
     
     ### plots ###
     plot_vaccine_dist = ax.bar(
         age_bins_centers,
         vaccine_age_percentage,
-        width=4,
+        width=0.8*np.diff(vaccine_age_edges),
         align='center',
         color='skyblue',
+        gid='recipients',
         )
+    # confidence intervals of the percentages of recipients, if computed
+    # (see bootstrap.py); the counts are then written above them
+    text_heights = vaccine_age_percentage
+    if 'vaccine_age_percentage_interval' in age_stats:
+        lower, upper = age_stats['vaccine_age_percentage_interval']
+        ax.errorbar(
+            age_bins_centers,
+            vaccine_age_percentage,
+            yerr=[np.subtract(vaccine_age_percentage, lower),
+                  np.subtract(upper, vaccine_age_percentage)],
+            fmt='none',
+            ecolor='steelblue',
+            elinewidth=0.5,
+            capsize=1,
+            capthick=0.5,
+            )
+        text_heights = np.maximum(vaccine_age_percentage, upper)
     # adding text annotation with the number of receivers
     text_vertical_offset = .25
-    for count, perc, loc in zip(
-            vaccine_age_heights,vaccine_age_percentage,age_bins_centers):
+    for index, (count, height, loc) in enumerate(zip(
+            vaccine_age_heights,text_heights,age_bins_centers)):
         if count > 0:
             ax.annotate(
                 str(count),
-                xy=[loc,perc+text_vertical_offset],
+                xy=[loc,height+text_vertical_offset],
                 ha='center',
                 color=count_text_color,
                 fontsize=ref_font_size-1,
+                gid=f'recipients_count_{index}',
                 )
     legend_text_handle = AnyObject('2', count_text_color)
     
     plot_world_dist = ax.plot(
-        np.array(age_bins)+age_bin_width/2,
-        df_population.loc[5][1:-1].values*100,
+        world_age_centers,
+        world_age_proportion*100,
         '-o',
         color='red',
         markeredgecolor='w',
@@ -157,20 +147,27 @@ if __name__ == '__main__':
         )
     
     # adding grid, only for y axis
-    ax.set_ylim([0,15])
+    # 15% unless wider age bins (e.g. custom age edges) hold larger
+    # percentages, leaving room for the counts above the bars, and then for
+    # the legend over the highest ones, in the upper `LEGEND_HEADROOM` of
+    # the axes
+    y_max = max(
+        np.max(text_heights), np.max(world_age_proportion)*100)
+    if y_max + 1 > 15:
+        y_max = (y_max + 1)/(1 - LEGEND_HEADROOM) - 1
+    ax.set_ylim([0,max(15, 5*np.ceil((y_max + 1)/5))])
     ax.yaxis.grid(True, which='minor')
     ax.yaxis.set_minor_locator(AutoMinorLocator(2))
     ax.grid(linewidth=0.5, which='both', axis='y')
     ax.set_axisbelow(True)
     
-    ax.set_xlim([0,age_bins[-1]+3*age_bin_width/2])
-    x_ticks = np.arange(
-        age_bin_width/2, age_bins[-1] + age_bin_width, age_bin_width
-        ) 
-    ax.set_xticks(x_ticks)
+    # showing half of the recipients bin above the world population bins
+    ax.set_xlim([
+        age_edges[0], (age_edges[-1] + vaccine_age_edges[-1])/2])
+    ax.set_xticks(world_age_centers)
     ax.set_xticklabels(
-        (f' {bin_start}-{bin_start+4}' for 
-             bin_start in age_bins),
+        (f' {bin_start:g}-{bin_end-1:g}' for 
+             bin_start, bin_end in zip(age_edges[:-1], age_edges[1:])),
         fontsize=ref_font_size-1,
         rotation=45,
         va='top', # using top and right to set rotation
@@ -197,7 +194,7 @@ if __name__ == '__main__':
     citation_string = \
         '*: United Nations, Department of Economic and Social Affairs,\n' + \
         'Population Division (2019). World Population Prospects 2019,\n' + \
-        'custom data acquired via website. Population in 2015.'
+        f'custom data acquired via website. Population in {year_to_consider}.'
     annotation_citation = ax.annotate(
                 citation_string,
                 xy=[1.04, 0.5],
@@ -211,7 +208,30 @@ if __name__ == '__main__':
                 rotation=90,
                 )
     
+    return fig
+
+if __name__ == '__main__':
+    print('Start')
+    plt.close("all")
+    
+    year_to_consider = 2015
+    with stage('load'):
+        #### vaccination database ###
+        # ignoring all rows that have no age
+        df_vaccine = load_vaccination(dropna_subset=['age'])
+        
+        #### world population database ###
+        # only `year_to_consider` is considered, year info is removed
+        df_population = load_world_population(year=year_to_consider)
+    
+    with stage('aggregate'):
+        age_stats = age_distribution(df_vaccine, df_population)
+    with stage('draw'):
+        fig = plot_distribution_by_age(age_stats, year_to_consider)
+    
     filename = 'graph_distribution_by_age'
     print(f'Saving: {filename}.png')
-    fig.savefig(filename,dpi=450)
+    with stage('save', figure=filename):
+        fig.savefig(filename,dpi=450)
+    write_trace()
     print('Done')
\ No newline at end of file
@@ -11,15 +11,21 @@ wjgsp.com
 
 """
 
-import pandas as pd
-import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.text
 from matplotlib.ticker import AutoMinorLocator
 
-if __name__ == '__main__':
-    print('Start')
-    plt.close("all")
+from data_loader import (
+    load_vaccination, load_world_population, load_health_workers)
+from aggregation import sex_distribution
+from instrumentation import stage, write_trace
+
+def plot_distribution_by_gender(sex_stats, year_to_consider=2015):
+    # figure of the proportion of males among the recipients, the world
+    # population and the nursing personnel, from the output of
+    # `aggregation.sex_distribution`; when its proportions are the ones of
+    # the own countries of the recipients (`own_country`), the labels and
+    # notes say so
     
     # general plot properties
     ref_font_size = 7
@@ -47,105 +53,15 @@ if __name__ == '__main__':
         figsize=figure_size,
         )
     
-    #### vaccination database ###
-    df_vaccine_raw = pd.read_csv(
-        'data/database_first_covid_vaccination.csv',sep=',',encoding='utf-8')
-    # ignoring all rows that have no sex info
-    df_vaccine = df_vaccine_raw.dropna(axis='index',subset=['sex']).copy()
-    
-    vaccine_total = len(df_vaccine.index)
-    vacine_male_proportion = \
-        np.sum(df_vaccine['sex'] == 'male')/vaccine_total
-    vacine_female_proportion = 1 - vacine_male_proportion
-    
-    #### world population database - UN ###
-    df_population = pd.read_csv(
-        'data/database_world_population_by_UN_CC-BY-3.0-IGO.csv',
-        delimiter=',',encoding='utf-8'
-        )
-    year_to_consider = 2015
-    mask_year = df_population['Time'] == year_to_consider
-    df_population = df_population[mask_year]
-    # remove year info, since only `year_to_consider` is considered
-    df_population = df_population.drop(['Time'],axis=1)
-    
-    age_categories = list(df_population.columns)
-    age_categories.remove('Sex')
-    
-    mask_both_sexes = df_population['Sex'] == 'Both sexes combined'
-    
-    df_population['total'] = df_population.sum(axis=1)
-    df_population.loc[4] = \
-            ['Male proportion'] + (
-                df_population[age_categories + ['total']][
-                    df_population['Sex'] == 'Male'].values/ \
-                df_population[age_categories + ['total']][
-                    mask_both_sexes].values
-                ).tolist()[0]
-            
-    df_population.loc[5] = \
-            ['Female proportion']+ (
-                1 - df_population[age_categories + ['total']][
-                    df_population['Sex'] == 'Male proportion'].values
-                ).tolist()[0]
-    world_male_proportion = df_population.loc[4]['total']
-    
-    # calculating the proportion of females over 65 years old
-    age_cat_elder = 6 # 8 for 65, 6 for 75
-    df_elderly_pop = df_population.copy()
-    df_elderly_pop = df_elderly_pop[['Sex'] + \
-        age_categories[-age_cat_elder:] + ['total']]
-    
-    # recalculating male/female ratios
-    mask_both_sexes = df_elderly_pop['Sex'] == 'Both sexes combined'
-    df_elderly_pop.total = 0
-    df_elderly_pop.total = df_elderly_pop.sum(axis=1)
-    df_elderly_pop.loc[4] = \
-            ['Male proportion'] + (
-                df_elderly_pop[age_categories[-age_cat_elder:] + ['total']][
-                    df_population['Sex'] == 'Male'].values/ \
-                df_elderly_pop[age_categories[-age_cat_elder:] + ['total']][
-                    mask_both_sexes].values
-                ).tolist()[0]
-            
-    df_elderly_pop.loc[5] = \
-            ['Female proportion']+ (
-                1 - df_elderly_pop[age_categories[-age_cat_elder:] + ['total']][
-                    df_elderly_pop['Sex'] == 'Male proportion'].values
-                ).tolist()[0]
-    elderly_male_proportion = df_elderly_pop.loc[4]['total']
-    
-    #### nurse population database - WHO ###
-    df_health_workers = pd.read_csv(
-        'data/database_sex_distribution_health_workers_by_WHO_CC-BY-NC-SA-3.0-IGO.csv',
-        delimiter=',',encoding='utf-8'
-        )
-    # renaming columns
-    df_health_workers.columns = (
-        'country','year',
-        'male_doctor_perc','female_doctor_perc',
-        'male_nursing_perc','female_nursing_perc',
-        )
-    # ignoring all rows that have no nursing staff numbers
-    df_health_workers = df_health_workers.dropna(
-        axis='index',subset=['male_nursing_perc'])
-    
-    # selecting the latest available per country
-    for country in df_health_workers['country'].unique():
-        mask_country = df_health_workers['country'] == country
-        df_workers_country = df_health_workers[mask_country]
-        
-        year_to_remain = df_workers_country['year'].max()
-        # dropping all other years
-        mask_to_drop = mask_country & \
-            (df_health_workers.year != year_to_remain)
-        
-        df_health_workers = df_health_workers[~mask_to_drop]
-        
-    # defining the gender ratio for the nursing personel based on the average
-    # among all the countries listed
-    nursing_male_proportion = df_health_workers.male_nursing_perc.mean()/100
-    nursing_female_proportion = 1 - nursing_male_proportion
+    vacine_male_proportion = sex_stats['vacine_male_proportion']
+    world_male_proportion = sex_stats['world_male_proportion']
+    elderly_male_proportion = sex_stats['elderly_male_proportion']
+    elderly_min_age = sex_stats['elderly_min_age']
+    nursing_male_proportion = sex_stats['nursing_male_proportion']
+    # numbers of recipients matched with their own country, if compared with
+    # it rather than with the world
+    nursing_matched = sex_stats.get('nursing_matched_recipients')
+    population_matched = sex_stats.get('population_matched_recipients')
     
     def plot_stacked_bar(
             ax,y,left_proportion,height=0.9,font_size=ref_font_size):
@@ -194,6 +110,20 @@ if __name__ == '__main__':
     
     plot_stacked_bar(
         ax,y_ticks[0],vacine_male_proportion)
+    # confidence interval of the proportion of males among the recipients,
+    # if computed (see bootstrap.py), below the percentages
+    if 'vacine_male_proportion_interval' in sex_stats:
+        lower, upper = sex_stats['vacine_male_proportion_interval']
+        ax.errorbar(
+            vacine_male_proportion, y_ticks[0] - 0.3,
+            xerr=[[vacine_male_proportion - lower],
+                  [upper - vacine_male_proportion]],
+            fmt='none',
+            ecolor='w',
+            elinewidth=0.75,
+            capsize=2,
+            capthick=0.75,
+            )
     plot_stacked_bar(
         ax,y_ticks[1],world_male_proportion,
         height=0.6,font_size=ref_font_size-1.5)
@@ -222,12 +152,14 @@ if __name__ == '__main__':
         **legend_prop_dict,
         )
     
+    population_name = 'own country' if population_matched else 'world'
     ax.set_yticks(y_ticks)
     ax.set_yticklabels(
         ('first vaccine\nrecipients',
-         'world$^*$\n(all ages)',
-         'world$^*$\n(75+ years old)',
-         'nursing\npersonel$^{**}$'),
+         f'{population_name}$^*$\n(all ages)',
+         f'{population_name}$^*$\n({elderly_min_age}+ years old)',
+         'nursing personel\nof own country$^{**}$' if nursing_matched is not None
+         else 'nursing\npersonel$^{**}$'),
         fontsize=ref_font_size-1,
         )
     for tick in ax.yaxis.get_major_ticks()[1:]:
@@ -257,13 +189,26 @@ if __name__ == '__main__':
         pad=16,
         )
 
-    # adding text with the citation of UN and WHO sources
+    # adding text with the citation of UN and WHO sources; the ratios of
+    # the own countries of the recipients are averaged over them
+    population_note = f'on population in {year_to_consider}; '
+    if population_matched:
+        population_note = f'on population in {year_to_consider}, ' + \
+            'mean over recipients of own-country ratios; '
+        # room for the descent of the third line of the notes, below their
+        # extent as measured by the layout
+        fig.get_layout_engine().set(h_pad=0.08)
+    if nursing_matched is None:
+        nursing_note = 'Average of per country ratios. '
+    else:
+        nursing_note = 'Mean over recipients of own-country ratios. '
     citation_string = \
         '$^*$: United Nations, Department of Economic and Social Affairs, ' + \
         'Population Division (2019). World Population ' + \
         'Prospects 2019, custom data acquired via website. Based \n'+ \
-        'on population in 2015; ' + \
-        '$^{**}$: Average of per country ratios. World Health Organization. ' + \
+        population_note + \
+        '$^{**}$: ' + nursing_note + 'World Health Organization. ' + \
+        ('\n' if population_matched else '') + \
         'Global Health Observatory data repository, ' + \
         'Sex distribution of health workers '
     
@@ -281,8 +226,39 @@ if __name__ == '__main__':
                 linespacing=0.25*note_font_size,
                 )
     
+    return fig
+
+if __name__ == '__main__':
+    print('Start')
+    plt.close("all")
+    
+    year_to_consider = 2015
+    with stage('load'):
+        #### vaccination database ###
+        # ignoring all rows that have no sex info
+        df_vaccine = load_vaccination(dropna_subset=['sex'])
+        
+        #### world population database - UN ###
+        # only `year_to_consider` is considered, year info is removed
+        df_population = load_world_population(year=year_to_consider)
+        
+        #### nurse population database - WHO ###
+        # renamed columns, ignoring all rows that have no nursing staff
+        # numbers
+        df_health_workers = load_health_workers()
+    
+    # proportion of females over 75 years old
+    age_cat_elder = 6 # 8 for 65, 6 for 75
+    with stage('aggregate'):
+        sex_stats = sex_distribution(
+            df_vaccine, df_population, df_health_workers, age_cat_elder)
+    with stage('draw'):
+        fig = plot_distribution_by_gender(sex_stats, year_to_consider)
+    
     filename = 'graph_distribution_by_sex'
     print(f'Saving: {filename}.png')
-    fig.savefig(filename,dpi=450)
+    with stage('save', figure=filename):
+        fig.savefig(filename,dpi=450)
+    write_trace()
     print('Done')
     
\ No newline at end of file
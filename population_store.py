@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+
+Memory-mapped store of the population of every country by year, sex and
+single year of age, for the analysis of the first recipients of COVID-19
+vaccines
+http://wjgsp.com/first-covid-19-vaccines-recipients-by-country
+
+The UN tables by country and single age (World Population Prospects,
+`PopulationBySingleAgeSex` files: one row per country, year and age with
+the male and female population) are hundreds of MB of CSV. They are
+converted once, reading the CSV by chunks, into a single NumPy array
+(country, year, sex, age) saved as .npy next to a JSON index of the
+countries (ISO 3166-1 alpha-3 codes, see countries.py), years and ages. The
+array is then opened memory-mapped: the population of a country is a view
+of the file, without parsing nor copying. The store is rebuilt when the
+source file changes, as the cache of data_loader.py.
+
+Each recipient can then be scored against the age structure of their own
+country: the percentile of their age (see `PopulationStore.age_percentiles`).
+Usage:
+
+    python population_store.py WPP_FILE [--year 2020] [--by-sex]
+                               [--output percentiles.csv]
+
+No plotting library is imported here.
+
+"""
+
+import os
+import json
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from data_loader import CACHE_DIR, file_hash, load_vaccination
+from aggregation import SEXES, BOTH_SEXES, FEMALE, MALE
+from countries import (
+    POPULATION_COUNTRY_COLUMNS, LOCATION_TYPE_COLUMN, COUNTRY_LOCATION_TYPE,
+    recipient_country_codes, population_country_codes)
+
+STORE_NAME = 'population_by_country'
+# columns of the UN tables: country (code, else name, see
+# `countries.population_country_codes`), year, age and population by sex;
+# only the `Medium` variant is kept when there are several, and only the
+# countries when the type of location is given
+YEAR_COLUMN = 'Time'
+AGE_COLUMNS = ('AgeGrpStart', 'AgeGrp')
+SEX_COLUMNS = dict(Female='PopFemale', Male='PopMale')
+VARIANT_COLUMN = 'Variant'
+VARIANT = 'Medium'
+CHUNKSIZE = 1_000_000
+
+
+def _read_chunks(filename, columns, chunksize=CHUNKSIZE):
+    # chunks of the UN table with the `columns` that exist in it
+    header = pd.read_csv(filename, nrows=0).columns
+    usecols = [col for col in columns if col in header]
+    for chunk in pd.read_csv(
+            filename, usecols=usecols, chunksize=chunksize,
+            dtype={**{col: str for col in POPULATION_COUNTRY_COLUMNS},
+                   VARIANT_COLUMN: str, 'AgeGrp': str}):
+        if VARIANT_COLUMN in chunk.columns:
+            chunk = chunk[chunk[VARIANT_COLUMN] == VARIANT]
+        if LOCATION_TYPE_COLUMN in chunk.columns:
+            chunk = chunk[chunk[LOCATION_TYPE_COLUMN] == COUNTRY_LOCATION_TYPE]
+        yield chunk
+
+
+def _chunk_codes(chunk):
+    # country code of each row (see `countries.population_country_codes`)
+    return population_country_codes(chunk)
+
+
+def _chunk_ages(chunk):
+    # single age of each row, the last group (`100+`) being its start
+    if 'AgeGrpStart' in chunk.columns:
+        return chunk['AgeGrpStart'].to_numpy(dtype=np.int64)
+    return chunk['AgeGrp'].astype(str).str.rstrip('+').to_numpy(
+        dtype=np.int64)
+
+
+def build_store(filename, store_dir=CACHE_DIR, chunksize=CHUNKSIZE):
+    # converting the UN table `filename` into the store of `store_dir`, in
+    # two passes over the CSV: dimensions, then counts; the regions and
+    # other aggregates, which have no country code, are ignored
+    columns = POPULATION_COUNTRY_COLUMNS + (YEAR_COLUMN, VARIANT_COLUMN) + \
+        AGE_COLUMNS + tuple(SEX_COLUMNS.values())
+    codes, years, max_age = set(), set(), 0
+    for chunk in _read_chunks(filename, columns, chunksize):
+        chunk_codes = _chunk_codes(chunk)
+        known = pd.notna(chunk_codes)
+        codes.update(chunk_codes[known])
+        years.update(chunk[YEAR_COLUMN].to_numpy()[known].tolist())
+        if known.any():
+            max_age = max(max_age, int(_chunk_ages(chunk)[known].max()))
+    if not codes:
+        raise ValueError(f'no country found in {filename}')
+    codes, years = sorted(codes), sorted(int(year) for year in years)
+    code_index = pd.Index(codes)
+    year_index = pd.Index(years)
+
+    os.makedirs(store_dir, exist_ok=True)
+    array_file = os.path.join(store_dir, STORE_NAME + '.npy')
+    temporary_file = array_file + '.tmp.npy'
+    counts = np.lib.format.open_memmap(
+        temporary_file, mode='w+', dtype=np.float32,
+        shape=(len(codes), len(years), len(SEXES), max_age + 1))
+    counts[:] = 0
+    for chunk in _read_chunks(filename, columns, chunksize):
+        chunk_codes = _chunk_codes(chunk)
+        known = pd.notna(chunk_codes)
+        country = code_index.get_indexer(chunk_codes[known])
+        year = year_index.get_indexer(chunk[YEAR_COLUMN].to_numpy()[known])
+        age = _chunk_ages(chunk)[known]
+        for sex, col in SEX_COLUMNS.items():
+            population = chunk[col].to_numpy(dtype=float)[known]
+            for sex_position in (SEXES.index(sex), BOTH_SEXES):
+                np.add.at(counts, (country, year, sex_position, age),
+                          population)
+    counts.flush()
+    del counts
+    os.replace(temporary_file, array_file)
+
+    index = dict(
+        codes=codes, years=years, ages=list(range(max_age + 1)),
+        sexes=list(SEXES), source=os.path.basename(filename),
+        source_mtime=os.stat(filename).st_mtime_ns,
+        source_hash=file_hash(filename),
+        )
+    index_file = os.path.join(store_dir, STORE_NAME + '.json')
+    with open(index_file + '.tmp', 'w', encoding='utf-8') as file:
+        json.dump(index, file)
+    os.replace(index_file + '.tmp', index_file)
+    return PopulationStore(store_dir)
+
+
+class PopulationStore(object):
+    # population by country, year, sex (`aggregation.SEXES`) and single age,
+    # memory-mapped from the store of `store_dir` (see `build_store`)
+    def __init__(self, store_dir=CACHE_DIR):
+        with open(os.path.join(store_dir, STORE_NAME + '.json'), 'r',
+                  encoding='utf-8') as file:
+            self.info = json.load(file)
+        self.counts = np.load(
+            os.path.join(store_dir, STORE_NAME + '.npy'), mmap_mode='r')
+        self.codes = self.info['codes']
+        self.years = self.info['years']
+        self.code_index = {code: index for index, code in
+                           enumerate(self.codes)}
+        self.year_index = {year: index for index, year in
+                           enumerate(self.years)}
+
+    def year_position(self, year):
+        # position of `year`, or of the latest year before it if missing
+        if year in self.year_index:
+            return self.year_index[year]
+        position = int(np.searchsorted(self.years, year, side='right')) - 1
+        if position < 0:
+            raise KeyError(f'year {year} not in the population store')
+        return position
+
+    def country(self, code, year=None):
+        # population of the country `code` (sex, age), or (year, sex, age)
+        # if `year` is None; a view of the memory-mapped file
+        counts = self.counts[self.code_index[code]]
+        if year is None:
+            return counts
+        return counts[self.year_position(year)]
+
+    def age_percentiles(self, codes, ages, year, sexes=None):
+        # percentile (0-100) of each age in the population of its country
+        # (`codes`) for `year`: share of the population younger, plus half
+        # of the share of the same age; with `sexes` ('female', 'male' or
+        # missing), in the population of the same sex when known; NaN for
+        # unknown countries and ages
+        codes = np.asarray(codes, dtype=object)
+        ages = np.asarray(ages, dtype=float)
+        if sexes is None:
+            sex_positions = np.full(codes.size, BOTH_SEXES)
+        else:
+            sex_positions = pd.Series(np.asarray(sexes, dtype=object)).map(
+                dict(female=FEMALE, male=MALE)).fillna(BOTH_SEXES).to_numpy(
+                    dtype=np.int64)
+        year_position = self.year_position(year)
+        n_ages = self.counts.shape[-1]
+        percentiles = np.full(codes.size, np.nan)
+        known = pd.notna(ages) & np.array(
+            [code in self.code_index for code in codes], dtype=bool)
+        positions = np.flatnonzero(known)
+        # one (view of a) country at a time
+        for code in pd.unique(codes[positions]):
+            rows = positions[codes[positions] == code]
+            counts = self.counts[self.code_index[code], year_position]
+            cumulative = np.concatenate(
+                [np.zeros((counts.shape[0], 1)), np.cumsum(counts, axis=1)],
+                axis=1)
+            age = np.clip(ages[rows], 0, n_ages - 1).astype(np.int64)
+            sex = sex_positions[rows]
+            younger = cumulative[sex, age]
+            same_age = cumulative[sex, age + 1] - younger
+            percentiles[rows] = 100*(younger + same_age/2)/cumulative[sex, -1]
+        return percentiles
+
+
+def load_population_store(filename, store_dir=CACHE_DIR):
+    # store of the UN table `filename`, converted only if it does not exist
+    # or if the source file changed since
+    index_file = os.path.join(store_dir, STORE_NAME + '.json')
+    if os.path.isfile(index_file):
+        try:
+            store = PopulationStore(store_dir)
+        except (OSError, ValueError):
+            store = None
+        if store is not None and \
+                store.info['source'] == os.path.basename(filename):
+            if store.info['source_mtime'] == os.stat(filename).st_mtime_ns:
+                return store
+            if store.info['source_hash'] == file_hash(filename):
+                return store
+    return build_store(filename, store_dir)
+
+
+def recipient_age_percentiles(df_vaccine, store, year, by_sex=False):
+    # percentile of the age of each recipient (in the order of `df_vaccine`)
+    # in the population of their own country, see
+    # `PopulationStore.age_percentiles`
+    return store.age_percentiles(
+        recipient_country_codes(df_vaccine),
+        df_vaccine['age'].to_numpy(dtype=float, na_value=np.nan), year,
+        df_vaccine['sex'].astype(object) if by_sex else None)
+
+
+def parse_arguments(args=None):
+    parser = argparse.ArgumentParser(
+        description='Score the age of the first COVID-19 vaccine recipients '
+                    'against the age structure of their own country.')
+    parser.add_argument(
+        'filename',
+        help='UN table of the population by country, year, sex and single '
+             'age (CSV)')
+    parser.add_argument('--year', type=int, default=2020)
+    parser.add_argument(
+        '--by-sex', action='store_true',
+        help='compare each recipient with the population of the same sex')
+    parser.add_argument('--output', default='age_percentiles.csv')
+    return parser.parse_args(args)
+
+
+if __name__ == '__main__':
+    print('Start')
+    arguments = parse_arguments()
+    store = load_population_store(arguments.filename)
+    df_vaccine = load_vaccination()
+    output = df_vaccine[['country', 'code', 'sex', 'age']].copy()
+    output['age_percentile'] = recipient_age_percentiles(
+        df_vaccine, store, arguments.year, arguments.by_sex)
+    output.to_csv(arguments.output, index=False)
+    print(f'Saving: {arguments.output}')
+    print('Done')
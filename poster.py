@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tiled rendering of the figures of the analysis of the first recipients of
+COVID-19 vaccines at poster resolutions, in bounded memory
+http://wjgsp.com/first-covid-19-vaccines-recipients-by-country
+
+A single Agg canvas of a figure at thousands of dpi does not fit in memory.
+The figure is laid out once, at a usual resolution, and its layout frozen;
+it is then drawn at the target resolution in horizontal strips of
+`--tile-height` pixels, all on the same Agg renderer of the size of a tile
+(the figure being shifted by whole pixels from one strip to the next), and
+the strips are written one after the other to a PNG (rows compressed with
+zlib into a sequence of IDAT chunks) or TIFF (one deflate strip per tile)
+file. The peak memory is the one of a tile, whatever the resolution and the
+number of strips. The strips are aligned with the pixels of the whole
+canvas; the lines crossing the edge of a strip are clipped to it, and their
+antialiasing can differ slightly from the one of a single `savefig`. Usage:
+
+    python poster.py [--figures occupation age gender] [--dpi 2400]
+                     [--format png|tiff] [--tile-height 256] [--years 2015]
+                     [--age-cat-elder 6] [--output-dir .]
+
+The figures are drawn one after the other, since drawing them in parallel
+would multiply the memory used.
+
+"""
+
+import os
+import zlib
+import struct
+import argparse
+import importlib
+
+import numpy as np
+
+from render_all import FIGURES, load_databases, plan_figures, aggregate
+from instrumentation import stage, write_trace
+
+POSTER_FORMATS = ('png', 'tiff')
+TILE_HEIGHT = 256
+# resolution of the layout of the figures, the one of their usual rendering
+LAYOUT_DPI = 450
+# size of the IDAT chunks of the PNG files
+PNG_CHUNK_SIZE = 1 << 20
+
+
+class PngWriter(object):
+    # RGBA PNG file written by strips of rows, compressed as they come; the
+    # image is never held whole in memory
+    def __init__(self, file, width, height, dpi=None, level=6):
+        self.file = file
+        self.width = width
+        self.height = height
+        self.rows = 0
+        self.compressor = zlib.compressobj(level)
+        self.pending = []
+        self.pending_size = 0
+        file.write(b'\x89PNG\r\n\x1a\n')
+        # 8 bits per sample, RGBA, no interlace
+        self._chunk(b'IHDR', struct.pack(
+            '>IIBBBBB', width, height, 8, 6, 0, 0, 0))
+        if dpi is not None:
+            pixels_per_meter = round(dpi/0.0254)
+            self._chunk(b'pHYs', struct.pack(
+                '>IIB', pixels_per_meter, pixels_per_meter, 1))
+
+    def _chunk(self, kind, data):
+        self.file.write(struct.pack('>I', len(data)) + kind + data)
+        self.file.write(struct.pack('>I', zlib.crc32(kind + data)))
+
+    def _compressed(self, data):
+        # sending the compressed data by chunks of about `PNG_CHUNK_SIZE`
+        if data:
+            self.pending.append(data)
+            self.pending_size += len(data)
+        if self.pending_size >= PNG_CHUNK_SIZE:
+            self._chunk(b'IDAT', b''.join(self.pending))
+            self.pending, self.pending_size = [], 0
+
+    def write(self, pixels):
+        # appending the rows of `pixels` (rows, width, 4), each one with no
+        # filter (type 0)
+        rows = np.zeros((pixels.shape[0], self.width*4 + 1), dtype=np.uint8)
+        rows[:, 1:] = pixels.reshape(pixels.shape[0], -1)
+        self._compressed(self.compressor.compress(rows.tobytes()))
+        self.rows += pixels.shape[0]
+
+    def close(self):
+        if self.rows != self.height:
+            raise ValueError(f'{self.rows} rows written, {self.height} '
+                             'expected')
+        self.pending.append(self.compressor.flush())
+        self._chunk(b'IDAT', b''.join(self.pending))
+        self._chunk(b'IEND', b'')
+
+
+class TiffWriter(object):
+    # RGBA TIFF file (little endian, deflate) written by strips of rows, all
+    # of the same height but the last one; the directory of the image,
+    # which lists the strips, is written at the end
+    def __init__(self, file, width, height, dpi=None, level=6):
+        self.file = file
+        self.width = width
+        self.height = height
+        self.dpi = dpi
+        self.level = level
+        self.rows = 0
+        self.rows_per_strip = None
+        self.strip_offsets = []
+        self.strip_sizes = []
+        # header, the offset of the directory being written by `close`
+        file.write(b'II*\x00' + struct.pack('<I', 0))
+
+    def write(self, pixels):
+        if self.rows_per_strip is None:
+            self.rows_per_strip = pixels.shape[0]
+        elif self.rows % self.rows_per_strip or \
+                pixels.shape[0] > self.rows_per_strip:
+            raise ValueError('only the last strip can be smaller')
+        data = zlib.compress(np.ascontiguousarray(pixels).tobytes(),
+                             self.level)
+        self.strip_offsets.append(self.file.tell())
+        self.strip_sizes.append(len(data))
+        self.file.write(data)
+        self.rows += pixels.shape[0]
+
+    def _values(self, values, code):
+        # offset of `values` written after the strips
+        offset = self.file.tell()
+        self.file.write(struct.pack(f'<{len(values)}{code}', *values))
+        return offset
+
+    def close(self):
+        if self.rows != self.height:
+            raise ValueError(f'{self.rows} rows written, {self.height} '
+                             'expected')
+        if self.file.tell() >= 1 << 32:
+            raise ValueError('TIFF files are limited to 4 GB, use PNG')
+        if self.file.tell() % 2:
+            self.file.write(b'\x00')
+        resolution = (round((self.dpi or 72)*1000), 1000)
+        # tag, type (3 SHORT, 4 LONG, 5 RATIONAL), count, value or offset
+        entries = [
+            (256, 4, 1, self.width),
+            (257, 4, 1, self.height),
+            (258, 3, 4, self._values((8, 8, 8, 8), 'H')),
+            # Adobe deflate
+            (259, 3, 1, 8),
+            # RGB
+            (262, 3, 1, 2),
+            (273, 4, len(self.strip_offsets),
+             self._values(self.strip_offsets, 'I')
+             if len(self.strip_offsets) > 1 else self.strip_offsets[0]),
+            (277, 3, 1, 4),
+            (278, 4, 1, self.rows_per_strip),
+            (279, 4, len(self.strip_sizes),
+             self._values(self.strip_sizes, 'I')
+             if len(self.strip_sizes) > 1 else self.strip_sizes[0]),
+            (282, 5, 1, self._values(resolution, 'I')),
+            (283, 5, 1, self._values(resolution, 'I')),
+            # chunky
+            (284, 3, 1, 1),
+            # inches
+            (296, 3, 1, 2),
+            # unassociated alpha
+            (338, 3, 1, 2),
+            ]
+        directory = self.file.tell()
+        self.file.write(struct.pack('<H', len(entries)))
+        for tag, kind, count, value in entries:
+            if kind == 3 and count == 1:
+                value = struct.pack('<HH', value, 0)
+            else:
+                value = struct.pack('<I', value)
+            self.file.write(struct.pack('<HHI', tag, kind, count) + value)
+        self.file.write(struct.pack('<I', 0))
+        self.file.seek(4)
+        self.file.write(struct.pack('<I', directory))
+
+
+POSTER_WRITERS = dict(png=PngWriter, tiff=TiffWriter)
+
+
+def freeze_layout(fig, dpi=LAYOUT_DPI):
+    # laying out the figure once at `dpi`, as `savefig` would, then keeping
+    # this layout for all the tiles; the layout engine is removed rather
+    # than set to 'none', so that drawing a strip does not lay it out again
+    original_dpi = fig.dpi
+    fig.set_dpi(dpi)
+    fig.canvas.draw()
+    fig.set_layout_engine(None)
+    fig.set_dpi(original_dpi)
+
+
+def _inches(pixels, dpi):
+    # `pixels` in inches at `dpi`, rounded so that converting it back to
+    # pixels gives `pixels` exactly when possible: the strips are then not
+    # shifted by a fraction of pixel, which would change the snapping of
+    # the lines and markers
+    inches = pixels/dpi
+    for candidate in (inches, np.nextafter(inches, np.inf),
+                      np.nextafter(inches, -np.inf)):
+        if candidate*dpi == pixels:
+            return float(candidate)
+    return inches
+
+
+def strip_renderer(fig, dpi, tile_height=TILE_HEIGHT):
+    # Agg renderer of the strips of `fig` at `dpi`, as wide as the figure
+    # and `tile_height` rows high; a single renderer is used for all the
+    # strips, since a new one per strip (as `savefig` of the bounding box of
+    # each strip does) also brings a new mathtext parser, whose texts
+    # rasterized at the target resolution are cached for each parser; its
+    # height has the fraction of pixel of the height of the figure, since
+    # the texts are placed from it, as on the canvas of the whole figure
+    from matplotlib.backends.backend_agg import RendererAgg
+    return RendererAgg(fig.get_figwidth()*dpi,
+                       tile_height + fig.get_figheight()*dpi % 1, dpi)
+
+
+def draw_strip(fig, renderer, first_row, rows):
+    # RGBA pixels (rows, width, 4) of the rows `first_row` to
+    # `first_row + rows` (from the top) of the figure drawn on `renderer`
+    # (see `strip_renderer`), the figure dpi being the one of the renderer;
+    # the figure is moved down by a whole number of pixels, so that the
+    # rows of the renderer are the ones of the canvas of the whole figure;
+    # the pixels are valid until the next strip is drawn
+    from matplotlib.backends.backend_agg import RendererAgg
+    bottom = int(fig.get_figheight()*renderer.dpi) - first_row - \
+        int(renderer.height)
+    figure_inches = fig.bbox_inches.get_points().copy()
+    shift = _inches(bottom, renderer.dpi)
+    fig.bbox_inches.set_points(figure_inches - [[0, shift], [0, shift]])
+    renderer.clear()
+    try:
+        with RendererAgg.lock:
+            fig.draw(renderer)
+    finally:
+        fig.bbox_inches.set_points(figure_inches)
+    return np.asarray(renderer.buffer_rgba())[:rows]
+
+
+def save_tiled(fig, filename, dpi, tile_height=TILE_HEIGHT, format=None):
+    # writing the figure at `dpi` to `filename` (PNG or TIFF, from its
+    # extension if `format` is None), drawn by strips of `tile_height` rows
+    if format is None:
+        format = os.path.splitext(filename)[1].lstrip('.').lower()
+        format = dict(tif='tiff').get(format, format)
+    if format not in POSTER_WRITERS:
+        raise ValueError(f'unknown poster format: {format!r}')
+    freeze_layout(fig, min(dpi, LAYOUT_DPI))
+    # size of the canvas `savefig` would draw
+    width = int(fig.get_figwidth()*dpi)
+    height = int(fig.get_figheight()*dpi)
+    renderer = strip_renderer(fig, dpi, tile_height)
+    original_dpi = fig.dpi
+    fig.set_dpi(dpi)
+    try:
+        with open(filename, 'wb') as file:
+            writer = POSTER_WRITERS[format](file, width, height, dpi)
+            for first_row in range(0, height, tile_height):
+                rows = min(tile_height, height - first_row)
+                with stage('poster/tile', row=first_row):
+                    writer.write(draw_strip(fig, renderer, first_row, rows))
+            writer.close()
+    finally:
+        fig.set_dpi(original_dpi)
+    return dict(width=width, height=height)
+
+
+def render_poster(figure, arguments, filename, dpi, tile_height=TILE_HEIGHT,
+                  format='png'):
+    # drawing a figure (see `render_all.aggregate`) and writing it tiled
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    module_name, function_name, _ = FIGURES[figure]
+    plot_function = getattr(
+        importlib.import_module(module_name), function_name)
+    with stage('draw', figure=figure):
+        fig = plot_function(*arguments)
+    print(f'Saving: {filename}')
+    with stage('poster', figure=figure, dpi=dpi):
+        size = save_tiled(fig, filename, dpi, tile_height, format)
+    plt.close(fig)
+    return size
+
+
+def parse_arguments(args=None):
+    parser = argparse.ArgumentParser(
+        description='Render the figures of the first COVID-19 vaccine '
+                    'recipients at poster resolution, by tiles.')
+    parser.add_argument(
+        '--figures', nargs='+', choices=list(FIGURES), default=list(FIGURES),
+        help='figures to render (default: all)')
+    parser.add_argument('--dpi', type=int, default=2400)
+    parser.add_argument(
+        '--format', choices=POSTER_FORMATS, default='png')
+    parser.add_argument(
+        '--tile-height', type=int, default=TILE_HEIGHT,
+        help=f'height of the tiles in pixels (default: {TILE_HEIGHT})')
+    parser.add_argument(
+        '--years', nargs='+', type=int, default=[2015],
+        help='years of the world population to compare with')
+    parser.add_argument(
+        '--age-cat-elder', type=int, default=6,
+        help='number of age bins of the elderly population (6 for 75+)')
+    parser.add_argument('--output-dir', default='.')
+    return parser.parse_args(args)
+
+
+if __name__ == '__main__':
+    print('Start')
+    arguments = parse_arguments()
+    jobs = plan_figures(
+        arguments.figures, arguments.years, arguments.age_cat_elder)
+    with stage('load'):
+        databases = load_databases(arguments.figures)
+    with stage('aggregate'):
+        tasks = aggregate(databases, jobs)
+    os.makedirs(arguments.output_dir, exist_ok=True)
+    for figure, figure_arguments, filename in tasks:
+        render_poster(
+            figure, figure_arguments,
+            os.path.join(
+                arguments.output_dir,
+                f'{filename}_{arguments.dpi}dpi.{arguments.format}'),
+            arguments.dpi, arguments.tile_height, arguments.format)
+    write_trace()
+    print('Done')
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+
+Continent of the countries of the analysis of the first recipients of
+COVID-19 vaccines
+http://wjgsp.com/first-covid-19-vaccines-recipients-by-country
+
+Countries are identified by their ISO 3166-1 alpha-3 code, as in the `code`
+column of the vaccination database; the codes of subdivisions (ISO 3166-2,
+e.g. GB-ENG for England) are those of their country. The continents follow
+the geographic regions of the UN (M49), the Americas being split into North
+(with Central America and the Caribbean) and South America.
+
+"""
+
+CONTINENTS = ('Africa', 'Asia', 'Europe', 'North America', 'South America',
+              'Oceania')
+
+_CONTINENT_CODES = {
+    'Africa': '''
+        AGO BDI BEN BFA BWA CAF CIV CMR COD COG COM CPV DJI DZA EGY ERI ESH
+        ETH GAB GHA GIN GMB GNB GNQ KEN LBR LBY LSO MAR MDG MLI MOZ MRT MUS
+        MWI MYT NAM NER NGA REU RWA SDN SEN SHN SLE SOM SSD STP SWZ SYC TCD
+        TGO TUN TZA UGA ZAF ZMB ZWE''',
+    'Asia': '''
+        AFG ARE ARM AZE BGD BHR BRN BTN CHN CYP GEO HKG IDN IND IRN IRQ ISR
+        JOR JPN KAZ KGZ KHM KOR KWT LAO LBN LKA MAC MDV MMR MNG MYS NPL OMN
+        PAK PHL PRK PSE QAT SAU SGP SYR THA TJK TKM TLS TUR TWN UZB VNM YEM''',
+    'Europe': '''
+        ALA ALB AND AUT BEL BGR BIH BLR CHE CZE DEU DNK ESP EST FIN FRA FRO
+        GBR GGY GIB GRC HRV HUN IMN IRL ISL ITA JEY LIE LTU LUX LVA MCO MDA
+        MKD MLT MNE NLD NOR POL PRT ROU RUS SJM SMR SRB SVK SVN SWE UKR VAT''',
+    'North America': '''
+        ABW AIA ATG BES BHS BLM BLZ BMU BRB CAN CRI CUB CUW CYM DMA DOM GLP
+        GRD GRL GTM HND HTI JAM KNA LCA MAF MEX MSR MTQ NIC PAN PRI SLV SPM
+        SXM TCA TTO USA VCT VGB VIR''',
+    'South America': '''
+        ARG BOL BRA CHL COL ECU FLK GUF GUY PER PRY SUR URY VEN''',
+    'Oceania': '''
+        ASM AUS COK FJI FSM GUM KIR MHL MNP NCL NFK NIU NRU NZL PCN PLW PNG
+        PYF SLB TKL TON TUV UMI VUT WLF WSM''',
+    }
+# continent of each country code
+CONTINENT_BY_CODE = {
+    code: continent for continent, codes in _CONTINENT_CODES.items()
+    for code in codes.split()}
+# ISO 3166-1 alpha-3 codes of the countries of the ISO 3166-2 subdivisions
+# found in the vaccination database
+SUBDIVISION_COUNTRIES = dict(GB='GBR')
+
+
+def country_code(code):
+    # ISO 3166-1 alpha-3 code of a country or of one of its subdivisions,
+    # None if unknown
+    if not isinstance(code, str):
+        return None
+    code = code.strip().upper()
+    if '-' in code:
+        return SUBDIVISION_COUNTRIES.get(code.split('-')[0])
+    return code or None
+
+
+def continent(code):
+    # continent of a country (or subdivision) code, None if unknown
+    return CONTINENT_BY_CODE.get(country_code(code))
@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+"""
+
+Rendering of all the figures of the analysis of the first recipients of
+COVID-19 vaccines in a single run
+http://wjgsp.com/first-covid-19-vaccines-recipients-by-country
+
+The databases are loaded and aggregated once, in the main process; the
+figures are then rendered concurrently in a pool of processes, each worker
+receiving the aggregated data of its figure. Usage:
+
+    python render_all.py [--figures occupation age gender] [--years 2015]
+                         [--age-cat-elder 6] [--output-dir .] [--dpi 450]
+                         [--jobs N] [--stream [CHUNKSIZE]] [--force]
+                         [--trace FILE] [--age-edges 0 18 65 110]
+                         [--bootstrap [RESAMPLES]] [--export [VARIANTS]]
+                         [--own-country]
+
+With --stream, the recipients histogram and counts by sex are computed by
+reading the vaccination database by chunks, in constant memory (see
+streaming.py); the full database is then only loaded for the occupation
+figure. With --age-edges, the age distribution is drawn over these bins
+instead of the ones of the UN database. With --bootstrap, the age and gender
+figures show 95% confidence intervals of the recipients proportions (see
+bootstrap.py). With --export, each figure is drawn once and written in all
+the variants (formats and resolutions) of the JSON file VARIANTS, or in the
+default ones (see export.py), listed in export_manifest.json. With
+--own-country, the gender figure compares the recipients with the nursing
+personnel of their own countries (see `aggregation.sex_distribution`).
+
+"""
+
+import os
+import argparse
+import importlib
+from concurrent.futures import ProcessPoolExecutor
+
+from data_loader import (
+    VACCINATION_FILE, POPULATION_FILE, HEALTH_WORKERS_FILE,
+    load_vaccination, load_world_population, load_health_workers)
+from aggregation import (
+    PopulationStructure, age_bin_edges, age_distribution, sex_distribution,
+    population_by_country)
+from streaming import stream_vaccination
+from bootstrap import recipient_intervals
+from export import (
+    load_variants, variant_filename, export_figure, write_export_manifest)
+from build_cache import render_key, RenderManifest
+from instrumentation import (
+    TRACE_ENV, stage, collect_events, add_events, write_trace)
+
+# plotting module and function, and output file of each figure
+FIGURES = dict(
+    occupation=('plot_age_by_occupation', 'plot_age_by_occupation',
+                'graph_receivers_by_occupation_country'),
+    age=('plot_distribution_by_age', 'plot_distribution_by_age',
+         'graph_distribution_by_age'),
+    gender=('plot_distribution_by_gender', 'plot_distribution_by_gender',
+            'graph_distribution_by_sex'),
+    )
+# databases and modules of this repository used by each figure, for the
+# incremental build; render_all itself aggregates the numbers of the figures
+FIGURE_INPUTS = dict(
+    occupation=(VACCINATION_FILE,),
+    age=(VACCINATION_FILE, POPULATION_FILE),
+    gender=(VACCINATION_FILE, POPULATION_FILE, HEALTH_WORKERS_FILE),
+    )
+FIGURE_CODE = dict(
+    occupation=('plot_age_by_occupation', 'render_all', 'data_loader',
+                'schema', 'beeswarm', 'label_placement'),
+    age=('plot_distribution_by_age', 'render_all', 'data_loader', 'schema',
+         'streaming', 'aggregation', 'bootstrap'),
+    gender=('plot_distribution_by_gender', 'render_all', 'data_loader',
+            'schema', 'streaming', 'aggregation', 'bootstrap', 'countries',
+            'regions'),
+    )
+
+
+def load_databases(
+        figures=tuple(FIGURES), stream_chunksize=None, age_edges=None):
+    # all databases, loaded once; in streaming mode the vaccination database
+    # is replaced by its running aggregates (histogram over `age_edges` if
+    # given) and only loaded if needed by the occupation figure
+    databases = dict(
+        population=load_world_population(),
+        health_workers=load_health_workers(),
+        )
+    if stream_chunksize is None or 'occupation' in figures:
+        databases['vaccine'] = load_vaccination()
+    if stream_chunksize is not None:
+        if age_edges is None:
+            _, _, age_edges = age_bin_edges(databases['population'])
+        databases['vaccine_aggregates'] = stream_vaccination(
+            age_edges, chunksize=stream_chunksize)
+    return databases
+
+
+def plan_figures(
+        figures=tuple(FIGURES), years=(2015,), age_cat_elder=6,
+        age_edges=None, bootstrap=None, own_country=False):
+    # list of the figures to render, as (figure, parameters, output file
+    # name); the output file name gets the year as suffix if there are
+    # several years; with `bootstrap` resamples, the age and gender figures
+    # show the confidence intervals of the recipients proportions; with
+    # `own_country`, the gender figure compares the recipients with their
+    # own countries
+    jobs = []
+    if 'occupation' in figures:
+        jobs.append(('occupation', {}, FIGURES['occupation'][2]))
+    for year in years:
+        suffix = f'_{year}' if len(years) > 1 else ''
+        if 'age' in figures:
+            parameters = dict(year_to_consider=year)
+            if age_edges is not None:
+                parameters['age_edges'] = list(age_edges)
+            if bootstrap:
+                parameters['bootstrap'] = bootstrap
+            jobs.append(('age', parameters, FIGURES['age'][2] + suffix))
+        if 'gender' in figures:
+            parameters = dict(
+                year_to_consider=year, age_cat_elder=age_cat_elder)
+            if bootstrap:
+                parameters['bootstrap'] = bootstrap
+            if own_country:
+                parameters['own_country'] = True
+            jobs.append(('gender', parameters, FIGURES['gender'][2] + suffix))
+    return jobs
+
+
+def figure_key(figure, parameters, dpi=450, variants=None):
+    # key of the incremental build, see `build_cache.render_key`
+    parameters = dict(parameters, figure=figure, dpi=dpi)
+    code = FIGURE_CODE[figure]
+    if variants is not None:
+        parameters['variants'] = list(variants)
+        code += ('export',)
+    return render_key(
+        inputs=FIGURE_INPUTS[figure], parameters=parameters, code=code)
+
+
+def output_filename(filename, variants=None):
+    # main output file of a figure: the PNG, or the first export variant
+    if variants is None:
+        return filename + '.png'
+    return variant_filename(filename, variants[0])
+
+
+def aggregate(databases, jobs, structure=None):
+    # list of (figure, arguments of the plotting function, output file name)
+    # for all the planned `jobs` (see `plan_figures`); `structure` is the
+    # `aggregation.PopulationStructure` of the world population, if built
+    df_vaccine = databases.get('vaccine')
+    aggregates = databases.get('vaccine_aggregates')
+    # all years of the world population at once, each year is then a lookup
+    if structure is None:
+        structure = PopulationStructure(databases['population'])
+    _, _, default_edges = age_bin_edges(structure)
+    country_structures = population_by_country(databases['population'])
+    intervals = {}
+    
+    def bootstrap_intervals(bin_edges, n_resamples):
+        # same recipients for all years, resampled once per age bins
+        key = (tuple(bin_edges), n_resamples)
+        if key not in intervals:
+            intervals[key] = recipient_intervals(
+                df_vaccine, bin_edges, aggregates, n_resamples=n_resamples)
+        return intervals[key]
+    
+    tasks = []
+    for figure, parameters, filename in jobs:
+        if figure == 'occupation':
+            # ignoring all elements that have no age
+            arguments = (df_vaccine.dropna(axis='index',subset=['age']),)
+        else:
+            year = parameters['year_to_consider']
+        if figure == 'age':
+            age_stats = age_distribution(
+                df_vaccine, structure,
+                vaccine_age_heights=getattr(aggregates, 'age_counts', None),
+                year=year, age_edges=parameters.get('age_edges'))
+            if parameters.get('bootstrap'):
+                age_stats['vaccine_age_percentage_interval'] = \
+                    bootstrap_intervals(
+                        age_stats['vaccine_age_edges'],
+                        parameters['bootstrap'],
+                        )['vaccine_age_percentage_interval']
+            arguments = (age_stats, year)
+        elif figure == 'gender':
+            sex_stats = sex_distribution(
+                df_vaccine, structure,
+                databases['health_workers'], parameters['age_cat_elder'],
+                vaccine_sex_counts=getattr(aggregates, 'sex_counts', None),
+                year=year, own_country=parameters.get('own_country', False),
+                country_structures=country_structures)
+            if parameters.get('bootstrap'):
+                sex_stats['vacine_male_proportion_interval'] = \
+                    bootstrap_intervals(
+                        default_edges, parameters['bootstrap'],
+                        )['vacine_male_proportion_interval']
+            arguments = (sex_stats, year)
+        tasks.append((figure, arguments, filename))
+    return tasks
+
+
+def render_figure(figure, arguments, filename, dpi=450, variants=None):
+    # worker: plotting and saving a single figure, as a PNG at `dpi` or in
+    # all the export `variants`; matplotlib and the plotting module are only
+    # imported here, once per worker process
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    module_name, function_name, _ = FIGURES[figure]
+    plot_function = getattr(
+        importlib.import_module(module_name), function_name)
+    with stage('draw', figure=figure):
+        fig = plot_function(*arguments)
+    if variants is None:
+        print(f'Saving: {filename}.png')
+        with stage('save', figure=figure):
+            fig.savefig(filename,dpi=dpi)
+        entries = [dict(
+            file=os.path.basename(filename) + '.png', format='png', dpi=dpi)]
+    else:
+        for variant in variants:
+            print(f'Saving: {variant_filename(filename, variant)}')
+        with stage('export', figure=figure, variants=len(variants)):
+            entries = export_figure(fig, filename, variants)
+    plt.close(fig)
+    # the events recorded in the worker are sent back with the result
+    return entries, collect_events()
+
+
+def render_all(tasks, output_dir='.', dpi=450, jobs=None, variants=None,
+               executor=None):
+    # rendering all `tasks` (see `aggregate`) in a process pool, a new one
+    # of `jobs` workers unless an `executor` is given (e.g. kept by a
+    # long-running process, see watch.py); returns the files written, by
+    # figure output name
+    os.makedirs(output_dir, exist_ok=True)
+    if executor is None:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            return render_all(
+                tasks, output_dir, dpi, jobs, variants, executor)
+    futures = [
+        (filename, executor.submit(
+            render_figure, figure, arguments,
+            os.path.join(output_dir, filename), dpi, variants))
+        for figure, arguments, filename in tasks]
+    outputs = {}
+    for filename, future in futures:
+        entries, events = future.result()
+        add_events(events)
+        outputs[filename] = entries
+    return outputs
+
+
+def parse_arguments(args=None):
+    parser = argparse.ArgumentParser(
+        description='Render all figures of the first COVID-19 vaccine '
+                    'recipients analysis from a single data load.')
+    parser.add_argument(
+        '--figures', nargs='+', choices=list(FIGURES), default=list(FIGURES),
+        help='figures to render (default: all)')
+    parser.add_argument(
+        '--years', nargs='+', type=int, default=[2015],
+        help='years of the world population to compare with')
+    parser.add_argument(
+        '--age-cat-elder', type=int, default=6,
+        help='number of age bins of the elderly population (6 for 75+)')
+    parser.add_argument('--output-dir', default='.')
+    parser.add_argument('--dpi', type=int, default=450)
+    parser.add_argument(
+        '--jobs', type=int, default=None,
+        help='number of worker processes (default: number of CPUs)')
+    parser.add_argument(
+        '--stream', type=int, nargs='?', const=1_000_000, default=None,
+        metavar='CHUNKSIZE',
+        help='aggregate the vaccination database by chunks of CHUNKSIZE '
+             'rows (default 1000000) instead of loading it whole')
+    parser.add_argument(
+        '--age-edges', nargs='+', type=int, default=None,
+        help='edges of the age bins of the age distribution, e.g. '
+             '0 18 65 110 (default: the bins of the UN database)')
+    parser.add_argument(
+        '--bootstrap', type=int, nargs='?', const=10000, default=None,
+        metavar='RESAMPLES',
+        help='show 95%% bootstrap confidence intervals of the recipients '
+             'proportions, from RESAMPLES resamples (default 10000)')
+    parser.add_argument(
+        '--own-country', action='store_true',
+        help='compare the recipients with the nursing personnel of their '
+             'own countries in the gender figure')
+    parser.add_argument(
+        '--export', nargs='?', const='default', default=None,
+        metavar='VARIANTS',
+        help='write every figure in all the variants of the JSON file '
+             'VARIANTS (default: PNG at 450 and 150 dpi, WebP thumbnail, '
+             'SVG and PDF), see export.py')
+    parser.add_argument(
+        '--force', action='store_true',
+        help='render all figures, even the ones that are up to date')
+    parser.add_argument(
+        '--trace', default=None, metavar='FILE',
+        help='record the time and memory of every stage in a Chrome trace '
+             f'(same as setting {TRACE_ENV}=FILE)')
+    return parser.parse_args(args)
+
+
+if __name__ == '__main__':
+    print('Start')
+    arguments = parse_arguments()
+    if arguments.trace:
+        # set before starting the workers, so that they inherit it
+        os.environ[TRACE_ENV] = arguments.trace
+    if arguments.own_country and arguments.stream is not None:
+        raise SystemExit('--own-country needs the whole vaccination database, '
+                         'it cannot be used with --stream')
+
+    variants = None
+    if arguments.export is not None:
+        variants = load_variants(
+            None if arguments.export == 'default' else arguments.export)
+
+    # skipping the figures whose inputs, parameters and code are unchanged
+    manifest = RenderManifest(arguments.output_dir)
+    jobs = []
+    keys = {}
+    for figure, parameters, filename in plan_figures(
+            arguments.figures, arguments.years, arguments.age_cat_elder,
+            arguments.age_edges, arguments.bootstrap, arguments.own_country):
+        keys[filename] = figure_key(
+            figure, parameters, arguments.dpi, variants)
+        output = output_filename(filename, variants)
+        if not arguments.force and manifest.is_up_to_date(
+                output, keys[filename]):
+            print(f'Up to date: {output}')
+        else:
+            jobs.append((figure, parameters, filename))
+    
+    if jobs:
+        figures = set(figure for figure, _, _ in jobs)
+        with stage('load'):
+            databases = load_databases(
+                figures, arguments.stream, arguments.age_edges)
+        with stage('aggregate'):
+            tasks = aggregate(databases, jobs)
+        outputs = render_all(
+            tasks, arguments.output_dir, arguments.dpi, arguments.jobs,
+            variants)
+        if variants is not None:
+            write_export_manifest(outputs, arguments.output_dir)
+        for figure, parameters, filename in jobs:
+            manifest.record(
+                output_filename(filename, variants), keys[filename])
+    write_trace()
+    print('Done')
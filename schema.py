@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+
+Typed in-memory schema of the vaccination database used in the analysis of
+the first recipients of COVID-19 vaccines
+http://wjgsp.com/first-covid-19-vaccines-recipients-by-country
+
+The text values are stripped once, when the database is loaded. Sex,
+occupation and vaccine are stored as categoricals over fixed vocabularies
+(the ones of the figures), the country as a categorical of the values found,
+the ages as nullable small integers (completed years) and the dates as
+datetime64. Values missing from a vocabulary are kept, as categories added
+after the fixed ones.
+
+No plotting library is imported here.
+
+"""
+
+import numpy as np
+import pandas as pd
+
+SEXES = ('female', 'male')
+# in the order of the occupation axis of the age by occupation figure
+OCCUPATIONS = ('retired', 'health minister', 'prime minister', 'president',
+               'nurse', 'sanitation worker', 'medical doctor')
+VACCINES = ('Oxford Univ./AstraZeneca', 'Pfizer/BioNTech', 'Sinopharm',
+            'Sinovac', 'Sputnik V')
+
+# vocabulary of the categorical columns, None for the values found
+CATEGORY_COLUMNS = dict(
+    country=None,
+    sex=SEXES,
+    occupation=OCCUPATIONS,
+    vaccine=VACCINES,
+    )
+TEXT_COLUMNS = ('code', 'name', 'source', 'comments')
+DATE_COLUMNS = ('date', 'acessed')
+DATE_FORMAT = '%d/%m/%y'
+AGE_DTYPE = 'UInt8'
+
+
+def strip_text(series):
+    # stripped strings (object dtype), empty ones being missing
+    stripped = series.astype(object)
+    known = stripped.notna()
+    stripped[known] = stripped[known].astype(str).str.strip()
+    return stripped.mask(stripped == '')
+
+
+def categorical(series, vocabulary=None):
+    # categorical of the stripped values of `series`; its categories are
+    # `vocabulary` followed by the other values found (sorted), so that the
+    # codes of the vocabulary do not depend on the data
+    #
+    # only the distinct values are stripped
+    codes, uniques = pd.factorize(series)
+    stripped = pd.Index(uniques.astype(str)).str.strip()
+    vocabulary = list(vocabulary or ())
+    categories = vocabulary + sorted(
+        set(stripped) - set(vocabulary) - {''})
+    positions = np.append(pd.Index(categories).get_indexer(stripped), -1)
+    # missing values (code -1) are taken from the appended -1
+    return pd.Series(
+        pd.Categorical.from_codes(positions[codes], categories=categories),
+        index=series.index, name=series.name)
+
+
+def ages(series):
+    # ages in completed years as nullable small integers
+    values = np.floor(pd.to_numeric(series, errors='coerce'))
+    if (values < 0).any() or (values > np.iinfo(np.uint8).max).any():
+        raise ValueError(
+            f'ages out of range: {values[(values < 0) | (values > 255)]}')
+    return values.astype(AGE_DTYPE)
+
+
+def float_ages(series):
+    # ages as a float array, NaN where missing, for numpy and matplotlib
+    return pd.Series(series).to_numpy(dtype=float, na_value=np.nan)
+
+
+def apply_schema(dataframe):
+    # typed copy of the vaccination database (or of some of its columns)
+    dataframe = dataframe.copy()
+    for col, vocabulary in CATEGORY_COLUMNS.items():
+        if col in dataframe.columns:
+            dataframe[col] = categorical(dataframe[col], vocabulary)
+    for col in TEXT_COLUMNS:
+        if col in dataframe.columns:
+            dataframe[col] = strip_text(dataframe[col])
+    for col in DATE_COLUMNS:
+        if col in dataframe.columns:
+            dataframe[col] = pd.to_datetime(
+                strip_text(dataframe[col]), format=DATE_FORMAT,
+                errors='coerce')
+    if 'age' in dataframe.columns:
+        dataframe['age'] = ages(dataframe['age'])
+    return dataframe
@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+"""
+
+Local HTTP service rendering the figures of the analysis of the first
+recipients of COVID-19 vaccines on demand
+http://wjgsp.com/first-covid-19-vaccines-recipients-by-country
+
+The databases are loaded once, and the figures are rendered in a pool of
+worker processes in which they stay loaded, with matplotlib and the plotting
+modules imported. The rendered images are kept in a LRU cache bounded in
+bytes, keyed by the normalized parameters of the request, so that a repeated
+request is answered from memory; identical requests arriving while an image
+is being rendered wait for the same rendering. Usage:
+
+    python serve.py [--host 127.0.0.1] [--port 8000] [--workers 2]
+                    [--cache-size 256]
+
+and then, e.g.
+
+    http://127.0.0.1:8000/age.png?year=2010&width=800
+    http://127.0.0.1:8000/gender.svg?elder=4&vaccine=pfizer
+    http://127.0.0.1:8000/occupation.webp?vaccine=sinovac&dpi=100
+
+The figure is one of occupation, age and gender, the format one of png,
+webp, jpeg, svg and pdf. The parameters are the year of the world
+population (age and gender figures, default 2015), the number of age bins
+of the elderly population (`elder`, gender figure, default 6), the vaccine
+of the recipients (`vaccine`, a case-insensitive prefix of its name, default
+all) and the size of raster images, as a `width` in pixels or a `dpi`
+(default 450). The parameters that do not apply to a figure are ignored.
+The cache statistics are at /stats (JSON).
+
+The databases are not reloaded while the service runs.
+
+"""
+
+import io
+import re
+import json
+import argparse
+import importlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+from aggregation import PopulationStructure
+from schema import VACCINES
+from export import draw_pixels, encode_raster
+from render_all import FIGURES, load_databases, aggregate
+
+FORMATS = dict(
+    png='image/png',
+    webp='image/webp',
+    jpeg='image/jpeg',
+    svg='image/svg+xml',
+    pdf='application/pdf',
+    )
+DEFAULT_PARAMETERS = dict(year=2015, elder=6, vaccine=None, width=None,
+                          dpi=450)
+# parameters of each figure, the other ones are ignored
+FIGURE_PARAMETERS = dict(
+    occupation=('vaccine',),
+    age=('year', 'vaccine'),
+    gender=('year', 'elder', 'vaccine'),
+    )
+# bounds of the size of raster images
+WIDTH_RANGE = (16, 8000)
+DPI_RANGE = (10, 1200)
+
+# databases of the process, see `load_state`
+_state = {}
+
+
+def load_state():
+    # loading the databases of this process once, and importing matplotlib
+    # and the plotting modules; also the initializer of the workers, which
+    # already hold the databases of the service if forked from it
+    if not _state:
+        databases = load_databases()
+        _state.update(
+            databases=databases,
+            structure=PopulationStructure(databases['population']),
+            )
+    import matplotlib
+    matplotlib.use('Agg')
+    for module_name, _, _ in FIGURES.values():
+        importlib.import_module(module_name)
+    return _state
+
+
+def _name_key(name):
+    return re.sub(r'[^0-9a-z]', '', name.lower())
+
+
+def find_vaccine(name):
+    # vaccine whose name starts with `name`, ignoring case and punctuation
+    matches = [vaccine for vaccine in VACCINES
+               if _name_key(vaccine).startswith(_name_key(name))]
+    if not _name_key(name) or len(matches) != 1:
+        raise ValueError(f'unknown or ambiguous vaccine: {name!r}')
+    return matches[0]
+
+
+def _integer(query, name, bounds=None):
+    try:
+        value = int(query[name])
+    except ValueError:
+        raise ValueError(f'{name} must be an integer: {query[name]!r}')
+    if bounds is not None and not bounds[0] <= value <= bounds[1]:
+        raise ValueError(f'{name} must be in [{bounds[0]}, {bounds[1]}]')
+    return value
+
+
+def normalize_request(path, query, years=None):
+    # key of the image requested by `path` (/figure.format) and `query`
+    # (dict of the parameters), as a tuple (figure, format, parameters) where
+    # the parameters are a sorted tuple of (name, value), without the ones
+    # that do not apply; raises ValueError for an invalid request
+    match = re.fullmatch(r'/(\w+)\.(\w+)', path)
+    if match is None:
+        raise ValueError(f'not a figure: {path!r}')
+    figure, image_format = match.group(1).lower(), match.group(2).lower()
+    image_format = 'jpeg' if image_format == 'jpg' else image_format
+    if figure not in FIGURES:
+        raise ValueError(f'unknown figure: {figure!r}')
+    if image_format not in FORMATS:
+        raise ValueError(f'unknown format: {image_format!r}')
+    unknown = set(query) - set(DEFAULT_PARAMETERS)
+    if unknown:
+        raise ValueError(f'unknown parameters: {sorted(unknown)}')
+
+    parameters = {}
+    for name in FIGURE_PARAMETERS[figure]:
+        parameters[name] = DEFAULT_PARAMETERS[name]
+    if 'year' in parameters and 'year' in query:
+        parameters['year'] = _integer(query, 'year')
+        if years is not None and parameters['year'] not in years:
+            raise ValueError(f'no world population for {parameters["year"]}')
+    if 'elder' in parameters and 'elder' in query:
+        parameters['elder'] = _integer(query, 'elder', (1, 21))
+    if query.get('vaccine') and query['vaccine'].lower() != 'all':
+        parameters['vaccine'] = find_vaccine(query['vaccine'])
+    if image_format in ('png', 'webp', 'jpeg'):
+        # the same image for all the requests of the same width
+        if 'width' in query:
+            parameters['width'] = _integer(query, 'width', WIDTH_RANGE)
+        else:
+            parameters['dpi'] = DEFAULT_PARAMETERS['dpi']
+            if 'dpi' in query:
+                parameters['dpi'] = _integer(query, 'dpi', DPI_RANGE)
+    return figure, image_format, tuple(sorted(parameters.items()))
+
+
+def render_chart(key):
+    # worker: the image of the normalized request `key`, as bytes
+    import matplotlib.pyplot as plt
+
+    state = load_state()
+    figure, image_format, parameters = key
+    parameters = dict(parameters)
+    databases = state['databases']
+    if parameters.get('vaccine') is not None:
+        df_vaccine = databases['vaccine']
+        databases = dict(databases, vaccine=df_vaccine[
+            df_vaccine['vaccine'] == parameters['vaccine']])
+    plan_parameters = dict(
+        year_to_consider=parameters.get('year'),
+        age_cat_elder=parameters.get('elder'),
+        )
+    (_, arguments, _), = aggregate(
+        databases, [(figure, plan_parameters, figure)], state['structure'])
+
+    module_name, function_name, _ = FIGURES[figure]
+    fig = getattr(importlib.import_module(module_name), function_name)(
+        *arguments)
+    buffer = io.BytesIO()
+    try:
+        if image_format in ('svg', 'pdf'):
+            fig.savefig(buffer, format=image_format)
+        else:
+            dpi = parameters.get('dpi')
+            if parameters.get('width') is not None:
+                dpi = parameters['width']/fig.get_figwidth()
+            if image_format == 'png':
+                fig.savefig(buffer, format='png', dpi=dpi)
+            else:
+                encode_raster(draw_pixels(fig, dpi), dpi,
+                              dict(format=image_format), buffer, dpi)
+    finally:
+        plt.close(fig)
+    return buffer.getvalue()
+
+
+class ImageCache(object):
+    # LRU cache of the rendered images, bounded by their total size in bytes;
+    # the images are rendered by `executor`, once for concurrent requests of
+    # the same key
+    def __init__(self, executor, max_bytes=256*1024**2):
+        self.executor = executor
+        self.max_bytes = max_bytes
+        self.images = OrderedDict()
+        self.bytes = 0
+        self.pending = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        # image of `key`, and whether it was in the cache
+        with self.lock:
+            if key in self.images:
+                self.images.move_to_end(key)
+                self.hits += 1
+                return self.images[key], True
+            self.misses += 1
+            future = self.pending.get(key)
+            if future is None:
+                future = self.executor.submit(render_chart, key)
+                self.pending[key] = future
+        try:
+            image = future.result()
+        finally:
+            with self.lock:
+                if self.pending.get(key) is future:
+                    del self.pending[key]
+        with self.lock:
+            self._add(key, image)
+        return image, False
+
+    def _add(self, key, image):
+        if key in self.images or len(image) > self.max_bytes:
+            return
+        self.images[key] = image
+        self.bytes += len(image)
+        while self.bytes > self.max_bytes:
+            _, evicted = self.images.popitem(last=False)
+            self.bytes -= len(evicted)
+
+    def stats(self):
+        with self.lock:
+            return dict(
+                images=len(self.images), bytes=self.bytes,
+                max_bytes=self.max_bytes, hits=self.hits,
+                misses=self.misses, rendering=len(self.pending))
+
+
+class ChartRequestHandler(BaseHTTPRequestHandler):
+    # the server has the attributes `cache` (ImageCache) and `years`
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == '/stats':
+            body = json.dumps(self.server.cache.stats()).encode('utf-8')
+            return self.respond(200, body, 'application/json')
+        query = {name: values[-1]
+                 for name, values in parse_qs(url.query).items()}
+        try:
+            key = normalize_request(url.path, query, self.server.years)
+        except ValueError as error:
+            return self.respond(
+                400, f'{error}\n'.encode('utf-8'), 'text/plain')
+        try:
+            image, cached = self.server.cache.get(key)
+        except Exception as error:
+            return self.respond(
+                500, f'rendering failed: {error!r}\n'.encode('utf-8'),
+                'text/plain')
+        self.respond(200, image, FORMATS[key[1]],
+                     {'X-Cache': 'hit' if cached else 'miss'})
+
+    def respond(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def parse_arguments(args=None):
+    parser = argparse.ArgumentParser(
+        description='Serve the figures of the first COVID-19 vaccine '
+                    'recipients analysis over HTTP, from memory.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument(
+        '--workers', type=int, default=2,
+        help='number of worker processes rendering the figures')
+    parser.add_argument(
+        '--cache-size', type=int, default=256, metavar='MB',
+        help='maximum size of the cached images, in MB (default 256)')
+    return parser.parse_args(args)
+
+
+if __name__ == '__main__':
+    print('Start')
+    arguments = parse_arguments()
+    # loaded before starting the workers, so that forked ones inherit it
+    state = load_state()
+    with ProcessPoolExecutor(
+            max_workers=arguments.workers,
+            initializer=load_state) as executor:
+        server = ThreadingHTTPServer(
+            (arguments.host, arguments.port), ChartRequestHandler)
+        server.cache = ImageCache(executor, arguments.cache_size*1024**2)
+        server.years = set(
+            int(year) for year in state['structure'].years
+            if year is not None)
+        print(f'Serving on http://{arguments.host}:{arguments.port}/')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    print('Done')
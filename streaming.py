@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+
+Streaming aggregation of the vaccination database
+http://wjgsp.com/first-covid-19-vaccines-recipients-by-country
+
+The CSV file is read by chunks and every chunk is folded into running
+aggregates (age histogram, counts by sex and by occupation and sex), so that
+the memory used does not depend on the size of the file. The result can be
+given to `aggregation.age_distribution` and `aggregation.sex_distribution`.
+
+"""
+
+import numpy as np
+import pandas as pd
+
+from data_loader import VACCINATION_FILE
+from schema import apply_schema
+
+STREAM_COLUMNS = ('sex', 'age', 'occupation')
+
+
+class RunningAggregates(object):
+    # counts of the vaccination records seen so far
+    def __init__(self, age_edges):
+        self.age_edges = np.asarray(age_edges, dtype=float)
+        self.age_counts = np.zeros(self.age_edges.size - 1, dtype=np.int64)
+        self.sex_counts = {}
+        self.occupation_sex_counts = {}
+        self.n_rows = 0
+
+    def update(self, chunk):
+        # folding a chunk of the vaccination database into the aggregates,
+        # typed with the schema of the whole database (see schema.py)
+        chunk = apply_schema(chunk)
+        self.n_rows += len(chunk.index)
+        # ignoring all rows that have no age
+        ages = chunk['age'].dropna().to_numpy(dtype=float)
+        self.age_counts += np.histogram(ages, bins=self.age_edges)[0]
+
+        for key, count in chunk['sex'].value_counts().items():
+            if count:
+                self.sex_counts[key] = \
+                    self.sex_counts.get(key, 0) + int(count)
+
+        for key, count in chunk.groupby(
+                ['occupation', 'sex'], observed=True).size().items():
+            self.occupation_sex_counts[key] = \
+                self.occupation_sex_counts.get(key, 0) + int(count)
+        return self
+
+    def merge(self, other):
+        # adding the counts of another set of aggregates (same age edges)
+        self.age_counts += other.age_counts
+        for counts, other_counts in (
+                (self.sex_counts, other.sex_counts),
+                (self.occupation_sex_counts, other.occupation_sex_counts)):
+            for key, count in other_counts.items():
+                counts[key] = counts.get(key, 0) + count
+        self.n_rows += other.n_rows
+        return self
+
+    def occupation_sex_table(self):
+        # number of recipients by occupation (rows) and sex (columns)
+        if not self.occupation_sex_counts:
+            return pd.DataFrame()
+        return pd.Series(self.occupation_sex_counts).unstack(fill_value=0)
+
+
+def stream_vaccination(
+        age_edges, filename=VACCINATION_FILE, chunksize=1_000_000,
+        aggregates=None):
+    # running aggregates of the whole vaccination database, read by chunks
+    # of `chunksize` rows; only the aggregated columns are parsed
+    if aggregates is None:
+        aggregates = RunningAggregates(age_edges)
+    chunks = pd.read_csv(
+        filename, sep=',', encoding='utf-8',
+        usecols=list(STREAM_COLUMNS), chunksize=chunksize,
+        dtype=dict(sex=str, occupation=str),
+        )
+    for chunk in chunks:
+        aggregates.update(chunk)
+    return aggregates
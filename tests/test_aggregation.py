@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests of the aggregations of the databases (aggregation.py)
+http://wjgsp.com/first-covid-19-vaccines-recipients-by-country
+
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aggregation import SEXES, BOTH_SEXES, population_by_country
+
+
+def _population_rows(location, code, population=10, year=2020, **columns):
+    # rows of each sex of a country database with the age bins of the UN one
+    rows = []
+    for sex, factor in zip(SEXES, (2, 1, 1)):
+        rows.append(dict(Location=location, ISO3_code=code, Time=year,
+                         Sex=sex, **{'0-4': factor*population,
+                                     '5-9': factor*population}, **columns))
+    return rows
+
+
+def test_countries_resolved_by_code():
+    # the UN "Micronesia" region (no code) has the name of an alias of the
+    # Federated States of Micronesia, and must not replace it
+    df_population = pd.DataFrame(
+        _population_rows('Micronesia (Fed. States of)', 'FSM')
+        + _population_rows('Micronesia', None, population=1000)
+        + _population_rows('France', 'FRA'))
+    structures = population_by_country(df_population)
+    assert sorted(structures) == ['FRA', 'FSM']
+    np.testing.assert_array_equal(
+        structures['FSM'].totals[:, BOTH_SEXES], [40])
+
+
+def test_only_countries_kept_by_location_type():
+    rows = _population_rows(
+        'Micronesia (Federated States of)', None, LocTypeName='Country/Area')
+    rows += _population_rows(
+        'Micronesia', None, population=1000, LocTypeName='Subregion')
+    for row in rows:
+        del row['ISO3_code']
+    structures = population_by_country(pd.DataFrame(rows))
+    assert list(structures) == ['FSM']
+    np.testing.assert_array_equal(
+        structures['FSM'].totals[:, BOTH_SEXES], [40])
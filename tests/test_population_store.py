@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests of the memory-mapped population store (population_store.py)
+http://wjgsp.com/first-covid-19-vaccines-recipients-by-country
+
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aggregation import BOTH_SEXES
+from population_store import build_store
+
+
+def _population_rows(location, code, ages=range(3), year=2020, male=10,
+                     female=10):
+    return [dict(Location=location, ISO3_code=code, Time=year, AgeGrp=age,
+                 PopMale=male, PopFemale=female) for age in ages]
+
+
+def test_region_named_as_country_is_ignored(tmp_path):
+    # the UN "Micronesia" region (no code) has the name of an alias of the
+    # Federated States of Micronesia, and must not be added to it
+    filename = tmp_path / 'population.csv'
+    pd.DataFrame(
+        _population_rows('Micronesia (Fed. States of)', 'FSM')
+        + _population_rows('Micronesia', None)
+        + _population_rows('France', 'FRA')
+        ).to_csv(filename, index=False)
+    store = build_store(str(filename), str(tmp_path / 'store'))
+    assert sorted(store.codes) == ['FRA', 'FSM']
+    np.testing.assert_array_equal(
+        store.country('FSM', 2020)[BOTH_SEXES], [20, 20, 20])
+    np.testing.assert_array_equal(
+        store.country('FRA', 2020)[BOTH_SEXES], [20, 20, 20])
+
+
+def test_only_countries_kept_by_location_type(tmp_path):
+    # tables with no code column: the countries are found by name, and the
+    # regions are told apart by their type of location
+    filename = tmp_path / 'population.csv'
+    rows = _population_rows('Micronesia (Federated States of)', None) + \
+        _population_rows('Micronesia', None)
+    for row, location_type in zip(rows, ['Country/Area']*3 + ['Subregion']*3):
+        del row['ISO3_code']
+        row['LocTypeName'] = location_type
+    pd.DataFrame(rows).to_csv(filename, index=False)
+    store = build_store(str(filename), str(tmp_path / 'store'))
+    assert store.codes == ['FSM']
+    np.testing.assert_array_equal(
+        store.country('FSM', 2020)[BOTH_SEXES], [20, 20, 20])
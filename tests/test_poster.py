@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests of the tiled poster rendering (poster.py)
+http://wjgsp.com/first-covid-19-vaccines-recipients-by-country
+
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+import poster
+
+resource = pytest.importorskip('resource')
+
+
+def _peak_memory():
+    # peak resident memory of the process in MB, `ru_maxrss` being in kB
+    # (Linux)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024
+
+
+def test_memory_does_not_grow_with_strips(tmp_path, monkeypatch):
+    # texts (mathtext included) all over the figure, at a resolution where
+    # each strip is small compared to the texts rasterized at that resolution
+    fig = plt.figure(figsize=(4, 3))
+    for index, y in enumerate(np.linspace(0.05, 0.95, 40)):
+        fig.text(0.1, y, f'$x^{{{index}}}$ recipients {index}', fontsize=20)
+    peaks = []
+    draw_strip = poster.draw_strip
+
+    def measured_draw_strip(*args):
+        pixels = draw_strip(*args)
+        peaks.append(_peak_memory())
+        return pixels
+
+    monkeypatch.setattr(poster, 'draw_strip', measured_draw_strip)
+    size = poster.save_tiled(
+        fig, str(tmp_path / 'poster.png'), dpi=2400, tile_height=64)
+    plt.close(fig)
+    assert size == dict(width=9600, height=7200)
+    assert len(peaks) > 100
+    # a strip is 2.4 MB: the peak is reached on the first strips
+    assert peaks[-1] - peaks[10] < 10
@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+"""
+
+Timeline animation of the first recipients of COVID-19 vaccines, by date of
+vaccination
+http://wjgsp.com/first-covid-19-vaccines-recipients-by-country
+
+The recipients are added cumulatively, one frame per day (or per
+`--frequency`), to the age and occupation figure or to the age distribution
+figure. The figure is drawn and laid out once, with all the recipients, so
+that the positions of the points and labels and the axis limits do not
+change; the artists of the recipients (points, labels and leader lines, or
+bars and counts) are then animated: the background is drawn once and each
+frame only restores it and draws these artists, updated in place
+(`set_offsets`, `set_height`, ...). The frames are encoded in a background
+thread while the next ones are drawn. Usage:
+
+    python timeline.py [--figure occupation|age] [--output timeline.gif]
+                       [--start 2020-12-01] [--end 2021-01-15]
+                       [--frequency D] [--fps 10] [--dpi 150] [--year 2015]
+
+The output is an animated GIF or WebP (Pillow), a video (.mp4, .webm, with
+ffmpeg) or, for any other name, a directory of numbered PNG frames (replacing
+the frames already there). The recipients with no date are not shown.
+
+"""
+
+import os
+import glob
+import queue
+import shutil
+import argparse
+import threading
+import subprocess
+
+import numpy as np
+import pandas as pd
+import matplotlib
+import matplotlib.pyplot as plt
+
+from data_loader import load_vaccination, load_world_population
+from aggregation import PopulationStructure, age_distribution
+from bootstrap import age_codes
+from plot_age_by_occupation import (
+    style_occupation_axes, draw_recipients, leader_lines)
+from plot_distribution_by_age import plot_distribution_by_age
+from instrumentation import stage, write_trace
+
+PILLOW_FORMATS = ('.gif', '.webp')
+FFMPEG_FORMATS = ('.mp4', '.webm', '.mkv', '.avi')
+# frames of the age distribution with fewer recipients do not set the y
+# axis, their percentages being mostly noise; their higher bars are clipped
+MIN_FRAME_RECIPIENTS = 50
+# first approval of a COVID-19 vaccine (UK, Pfizer/BioNTech): earlier dates
+# of vaccination are typos, e.g. of the year
+FIRST_APPROVAL = pd.Timestamp('2020-12-02')
+
+
+def frame_dates(dates, start=None, end=None, frequency='D'):
+    # dates of the frames, from the first to the last date of vaccination;
+    # the dates before `FIRST_APPROVAL` are reported, and left out of the
+    # default range (such recipients are shown from the first frame)
+    dates = pd.to_datetime(pd.Series(dates)).dropna()
+    early = dates < FIRST_APPROVAL
+    if early.any():
+        print(f'{early.sum()} dates of vaccination before the first approval '
+              f'({FIRST_APPROVAL:%d/%m/%Y}), not used for the frames: '
+              + ', '.join(f'{date:%d/%m/%Y}' for date in dates[early]))
+        if not early.all():
+            dates = dates[~early]
+    start = pd.Timestamp(start) if start is not None else dates.min()
+    end = pd.Timestamp(end) if end is not None else dates.max()
+    return pd.date_range(start.normalize(), end, freq=frequency)
+
+
+def first_frames(dates, frames):
+    # first frame showing each recipient: the first one on or after its
+    # date, 0 if vaccinated before the first frame; len(frames) if after
+    # the last one
+    dates = pd.to_datetime(pd.Series(dates)).to_numpy(dtype='datetime64[ns]')
+    return np.searchsorted(
+        frames.to_numpy(dtype='datetime64[ns]'), dates, side='left')
+
+
+class FrameWriter(threading.Thread):
+    # thread encoding the RGBA frames put in its queue to `filename`; the
+    # queue is bounded, so that drawing waits for the encoding if it is
+    # ahead by more than `queue_size` frames
+    def __init__(self, filename, fps=10, queue_size=8):
+        super().__init__(daemon=True)
+        self.filename = filename
+        self.fps = fps
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.extension = os.path.splitext(filename)[1].lower()
+        self.error = None
+        self.count = 0
+
+    def put(self, pixels):
+        if self.error is not None:
+            raise self.error
+        self.frames.put(pixels)
+
+    def close(self):
+        # waiting for all the frames to be encoded
+        self.frames.put(None)
+        self.join()
+        if self.error is not None:
+            raise self.error
+        return self.filename
+
+    def run(self):
+        try:
+            if self.extension in PILLOW_FORMATS:
+                self._write_pillow()
+            elif self.extension in FFMPEG_FORMATS:
+                self._write_ffmpeg()
+            else:
+                self._write_png_frames()
+        except Exception as error:
+            self.error = error
+            # draining the queue, so that the drawing is not blocked
+            while self.frames.get() is not None:
+                pass
+
+    def _iter_frames(self):
+        while True:
+            pixels = self.frames.get()
+            if pixels is None:
+                return
+            self.count += 1
+            yield pixels
+
+    def _write_png_frames(self):
+        # the frames of a previous run are removed, so that the directory
+        # only holds the ones of this run
+        from PIL import Image
+        os.makedirs(self.filename, exist_ok=True)
+        for frame_file in glob.glob(
+                os.path.join(self.filename, 'frame_*.png')):
+            os.remove(frame_file)
+        for pixels in self._iter_frames():
+            Image.fromarray(pixels, 'RGBA').save(
+                os.path.join(self.filename, f'frame_{self.count:05d}.png'))
+
+    def _write_pillow(self):
+        # all the frames are kept until the end, as palette images for GIF
+        from PIL import Image
+        images = []
+        for pixels in self._iter_frames():
+            image = Image.fromarray(pixels, 'RGBA').convert('RGB')
+            if self.extension == '.gif':
+                image = image.quantize(method=Image.Quantize.MEDIANCUT)
+            images.append(image)
+        if images:
+            images[0].save(
+                self.filename, save_all=True, append_images=images[1:],
+                duration=round(1000/self.fps), loop=0)
+
+    def _write_ffmpeg(self):
+        ffmpeg = shutil.which('ffmpeg')
+        if ffmpeg is None:
+            raise RuntimeError(f'ffmpeg is needed to write {self.filename}')
+        process = None
+        for pixels in self._iter_frames():
+            if process is None:
+                height, width = pixels.shape[:2]
+                process = subprocess.Popen(
+                    [ffmpeg, '-y', '-loglevel', 'error',
+                     '-f', 'rawvideo', '-pix_fmt', 'rgba',
+                     '-s', f'{width}x{height}', '-r', str(self.fps),
+                     '-i', '-', '-pix_fmt', 'yuv420p',
+                     # even dimensions for the H.264 encoder
+                     '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',
+                     self.filename],
+                    stdin=subprocess.PIPE)
+            process.stdin.write(pixels.tobytes())
+        if process is not None:
+            process.stdin.close()
+            if process.wait() != 0:
+                raise RuntimeError(f'ffmpeg failed to write {self.filename}')
+
+
+def animate(fig, animated, update, n_frames, writer, dpi=150):
+    # drawing the `n_frames` frames of `fig` by blitting: the figure is laid
+    # out and drawn once without the `animated` artists, then for each frame
+    # `update(frame)` modifies these artists, which are drawn over the
+    # background and sent to `writer`
+    fig.set_dpi(dpi)
+    canvas = fig.canvas
+    # settling the layout with all the artists, then freezing it
+    canvas.draw()
+    canvas.draw()
+    fig.set_layout_engine('none')
+    for artist in animated:
+        artist.set_animated(True)
+    with stage('timeline/background'):
+        canvas.draw()
+        background = canvas.copy_from_bbox(fig.bbox)
+    with stage('timeline/frames', frames=n_frames):
+        for frame in range(n_frames):
+            canvas.restore_region(background)
+            update(frame)
+            for artist in animated:
+                fig.draw_artist(artist)
+            writer.put(np.array(canvas.buffer_rgba()))
+
+
+def date_text(fig, top=False):
+    # text of the date of the frames, in the lower (or upper) left corner
+    return fig.text(0.01, 0.99 if top else 0.01, '', ha='left',
+                    va='top' if top else 'bottom', fontsize=5, color='gray')
+
+
+def occupation_timeline(dataframe, frames):
+    # figure, animated artists and update function of the age and
+    # occupation figure for the recipients of `dataframe` (with age and
+    # date), shown from their first frame (see `first_frames`)
+    ref_font_size = 7
+    plt.rc('font', family='serif', size=ref_font_size)
+    fig, ax = plt.subplots(
+        constrained_layout=True, dpi=300, figsize=(10/2.54, 8/2.54))
+    style_occupation_axes(ax, ref_font_size)
+    ax.set_title(
+        'Age and occupation of first recipients of\n'
+        'COVID-19 vaccine by country',
+        pad=20,
+        )
+    fig.canvas.draw()
+    # every recipient is a point, appearing on its date
+    artists = draw_recipients(
+        ax, dataframe, ref_font_size=ref_font_size, density_threshold=None)
+    ax.legend(
+        labels=['male','female'],
+        handles=[artists['scatter']['male'], artists['scatter']['female']],
+        fancybox=False, fontsize=ref_font_size-2, labelspacing=0.4,
+        handletextpad=0.25, handlelength=1.5, columnspacing=0.5,
+        )
+    # above the bands of the occupations
+    text = date_text(fig, top=True)
+
+    shown_from = first_frames(dataframe['date'], frames)
+    sexes = dataframe['sex'].astype(object).to_numpy()
+    point_xy, label_xy = artists['point_xy'], artists['label_xy']
+
+    def update(frame):
+        shown = shown_from <= frame
+        for sex, scatter in artists['scatter'].items():
+            scatter.set_offsets(point_xy[shown & (sexes == sex)])
+        for label, label_shown in zip(artists['labels'], shown):
+            label.set_visible(label_shown)
+        artists['lines'].set_segments(leader_lines(
+            point_xy[shown], label_xy[shown], *artists['point_extent']))
+        text.set_text(
+            f'{frames[frame]:%d/%m/%Y}, {np.sum(shown)} recipients')
+
+    animated = list(artists['scatter'].values()) + artists['labels'] + \
+        [artists['lines'], text]
+    return fig, animated, update
+
+
+def age_timeline(dataframe, df_population, frames, year_to_consider=2015,
+                 min_recipients=MIN_FRAME_RECIPIENTS):
+    # figure, animated artists and update function of the age distribution
+    # figure for the recipients of `dataframe` (with age and date); the y
+    # axis is the one of the static figure, raised for the highest bar of
+    # the frames with at least `min_recipients` recipients, and the bars of
+    # the other frames are clipped to it, their count written inside
+    age_stats = age_distribution(
+        dataframe, df_population, year=year_to_consider)
+    fig = plot_distribution_by_age(age_stats, year_to_consider)
+    ax = fig.axes[0]
+    bars = ax.findobj(lambda artist: artist.get_gid() == 'recipients')
+    counts_text = {
+        int(artist.get_gid().rsplit('_', 1)[1]): artist
+        for artist in ax.texts
+        if (artist.get_gid() or '').startswith('recipients_count_')}
+    text = date_text(fig)
+
+    # cumulative number of recipients of each age bin at each frame
+    edges = np.asarray(age_stats['vaccine_age_edges'])
+    n_bins = edges.size - 1
+    in_bins = (dataframe['age'].to_numpy(dtype=float, na_value=np.nan)
+               >= edges[0])
+    shown_from = np.minimum(
+        first_frames(dataframe['date'], frames)[in_bins], len(frames))
+    counts = np.cumsum(np.bincount(
+        shown_from*n_bins + age_codes(dataframe['age'][in_bins], edges),
+        minlength=(len(frames) + 1)*n_bins).reshape(-1, n_bins)[:-1], axis=0)
+    totals = counts.sum(axis=1, keepdims=True)
+    percentages = 100*counts/np.maximum(totals, 1)
+    # y axis holding the highest bar of the frames with enough recipients
+    # and its count
+    stable = totals[:, 0] >= min_recipients
+    y_max = max(percentages[stable].max(initial=0), ax.get_ylim()[1] - 1)
+    y_top = 5*np.ceil((y_max + 1)/5)
+    ax.set_ylim([0, y_top])
+    heights = np.minimum(percentages, y_top)
+    clipped = percentages > y_top
+
+    def update(frame):
+        for bar, height in zip(bars, heights[frame]):
+            bar.set_height(height)
+        for index, count_text in counts_text.items():
+            count_text.set_visible(counts[frame, index] > 0)
+            count_text.set_text(str(counts[frame, index]))
+            # position of the text, not only of its (unused) arrow; inside
+            # the top of the bar if clipped
+            if clipped[frame, index]:
+                y, va = y_top - .25, 'top'
+            else:
+                y, va = heights[frame, index] + .25, 'baseline'
+            count_text.xy = count_text.xyann = (count_text.xy[0], y)
+            count_text.set_verticalalignment(va)
+        text.set_text(
+            f'{frames[frame]:%d/%m/%Y}, {totals[frame, 0]} recipients')
+
+    # the legend is kept where the static figure places it (the best place
+    # is otherwise searched again for the bars of each frame, `set_loc`
+    # from matplotlib 3.8), and drawn again over the bars, which can reach it
+    legend = ax.get_legend()
+    fig.canvas.draw()
+    legend._set_loc(tuple(ax.transAxes.inverted().transform(
+        legend.get_window_extent().p0)))
+    animated = bars + list(counts_text.values()) + [text, legend]
+    return fig, animated, update
+
+
+def parse_arguments(args=None):
+    parser = argparse.ArgumentParser(
+        description='Animate the first COVID-19 vaccine recipients by date '
+                    'of vaccination.')
+    parser.add_argument(
+        '--figure', choices=('occupation', 'age'), default='occupation')
+    parser.add_argument('--output', default='timeline.gif')
+    parser.add_argument(
+        '--start', default=None, help='first date (default: first recipient)')
+    parser.add_argument(
+        '--end', default=None, help='last date (default: last recipient)')
+    parser.add_argument(
+        '--frequency', default='D',
+        help='time between frames, as a pandas frequency (default: D)')
+    parser.add_argument('--fps', type=int, default=10)
+    parser.add_argument('--dpi', type=int, default=150)
+    parser.add_argument(
+        '--year', type=int, default=2015,
+        help='year of the world population (age figure)')
+    return parser.parse_args(args)
+
+
+if __name__ == '__main__':
+    print('Start')
+    arguments = parse_arguments()
+    matplotlib.use('Agg')
+    plt.close('all')
+
+    # ignoring all elements that have no age or date
+    with stage('load'):
+        dataframe = load_vaccination(dropna_subset=['age', 'date'])
+    frames = frame_dates(
+        dataframe['date'], arguments.start, arguments.end,
+        arguments.frequency)
+
+    with stage('draw'):
+        if arguments.figure == 'occupation':
+            fig, animated, update = occupation_timeline(dataframe, frames)
+        else:
+            fig, animated, update = age_timeline(
+                dataframe, PopulationStructure(load_world_population()),
+                frames, arguments.year)
+
+    writer = FrameWriter(arguments.output, arguments.fps)
+    writer.start()
+    animate(fig, animated, update, len(frames), writer, arguments.dpi)
+    print(f'Saving: {arguments.output}')
+    with stage('timeline/encode'):
+        writer.close()
+    print(f'{writer.count} frames')
+    write_trace()
+    print('Done')
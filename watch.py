@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+"""
+
+Watch mode of the figures of the analysis of the first recipients of
+COVID-19 vaccines: the figures are updated as records are appended to the
+vaccination database
+http://wjgsp.com/first-covid-19-vaccines-recipients-by-country
+
+The vaccination database is append-only. The CSV file (and/or a drop
+directory of JSON Lines files, one record per line with the columns of the
+CSV) is polled, and only the bytes appended since the last poll are parsed;
+an incomplete last line is left for the next poll. The new rows are folded
+into the running aggregates of streaming.py (age histogram, counts by sex
+and by occupation and sex), and the rows with an age are kept for the age
+by occupation figure, which shows every recipient. If a file is rewritten
+instead (smaller, replaced or with another header), everything is read
+again.
+
+Once no row has been appended for `--debounce` seconds (or at the latest
+`--max-delay` seconds after the first new row), the figures whose numbers
+changed are rendered again, in a pool of worker processes kept for the whole
+session (see render_all.py); the other ones are left as they are. Usage:
+
+    python watch.py [--csv FILE] [--drop-dir DIR]
+                    [--figures occupation age gender] [--years 2015]
+                    [--age-cat-elder 6] [--age-edges 0 18 65 110]
+                    [--output-dir .] [--dpi 450] [--jobs N]
+                    [--interval 1] [--debounce 2] [--max-delay 30] [--once]
+
+With --once, the figures are rendered from the current data and the watch
+stops.
+
+"""
+
+import io
+import os
+import glob
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from data_loader import (
+    VACCINATION_FILE, load_world_population, load_health_workers)
+from aggregation import PopulationStructure, age_bin_edges
+from streaming import RunningAggregates
+from schema import ages, apply_schema
+from render_all import FIGURES, plan_figures, aggregate, render_all
+from instrumentation import stage, write_trace
+
+# columns of the vaccination database, for the records of the drop directory
+RECORD_COLUMNS = ('country', 'code', 'date', 'name', 'sex', 'age',
+                  'occupation', 'vaccine', 'acessed', 'source', 'comments')
+BLOCK_SIZE = 64*1024*1024
+
+
+class SourceRewritten(Exception):
+    # a watched file was not only appended to, all sources are read again
+    pass
+
+
+class CsvTail(object):
+    # rows appended to a CSV file since the last read
+    def __init__(self, filename, block_size=BLOCK_SIZE):
+        self.filename = filename
+        self.block_size = block_size
+        self.reset()
+
+    def reset(self):
+        self.offset = 0
+        self.header = None
+        self.inode = None
+
+    def read(self):
+        # new complete rows, by blocks of about `block_size` bytes, as
+        # untyped DataFrames (see `schema.apply_schema`)
+        if not os.path.isfile(self.filename):
+            return
+        status = os.stat(self.filename)
+        if self.inode is not None and (
+                status.st_ino != self.inode or status.st_size < self.offset):
+            raise SourceRewritten(self.filename)
+        if status.st_size == self.offset:
+            return
+        self.inode = status.st_ino
+        with open(self.filename, 'rb') as file:
+            if self.header is None:
+                header = file.readline()
+                if not header.endswith(b'\n'):
+                    return
+                self.header, self.offset = header, file.tell()
+            else:
+                if file.read(len(self.header)) != self.header:
+                    raise SourceRewritten(self.filename)
+                file.seek(self.offset)
+            while True:
+                block = file.read(self.block_size)
+                end = block.rfind(b'\n') + 1
+                if end == 0:
+                    # incomplete last line, left for the next read
+                    return
+                self.offset += end
+                file.seek(self.offset)
+                yield pd.read_csv(
+                    io.BytesIO(self.header + block[:end]), sep=',',
+                    encoding='utf-8', dtype=str)
+
+
+class JsonlDropDirectory(object):
+    # records appended to the JSON Lines files (*.jsonl) of a directory since
+    # the last read, new files included
+    def __init__(self, directory):
+        self.directory = directory
+        self.reset()
+
+    def reset(self):
+        self.offsets = {}
+
+    def read(self):
+        for filename in sorted(glob.glob(
+                os.path.join(self.directory, '*.jsonl'))):
+            offset = self.offsets.get(filename, 0)
+            size = os.stat(filename).st_size
+            if size < offset:
+                raise SourceRewritten(filename)
+            if size == offset:
+                continue
+            with open(filename, 'rb') as file:
+                file.seek(offset)
+                data = file.read(size - offset)
+            end = data.rfind(b'\n') + 1
+            if end == 0:
+                continue
+            self.offsets[filename] = offset + end
+            records = [json.loads(line) for line in
+                       data[:end].decode('utf-8').splitlines()
+                       if line.strip()]
+            if records:
+                yield pd.DataFrame.from_records(records).reindex(
+                    columns=list(RECORD_COLUMNS)).astype(object)
+
+
+class VaccinationWatch(object):
+    # running aggregates of the vaccination records of `sources` (see
+    # `CsvTail` and `JsonlDropDirectory`), and rows with an age
+    def __init__(self, sources, age_edges):
+        self.sources = sources
+        self.age_edges = age_edges
+        self.reset()
+
+    def reset(self):
+        self.aggregates = RunningAggregates(self.age_edges)
+        self.aged_rows = []
+        self.n_aged_rows = 0
+        for source in self.sources:
+            source.reset()
+
+    def poll(self):
+        # folding the new rows of all sources; returns their number
+        try:
+            return self._read()
+        except SourceRewritten as error:
+            print(f'Rewritten: {error}, reading everything again')
+            self.reset()
+            return self._read()
+
+    def _read(self):
+        n_rows = 0
+        for source in self.sources:
+            for chunk in source.read():
+                self.aggregates.update(chunk)
+                aged = chunk[ages(chunk['age']).notna().to_numpy()]
+                if len(aged.index):
+                    self.aged_rows.append(aged)
+                    self.n_aged_rows += len(aged.index)
+                n_rows += len(chunk.index)
+        return n_rows
+
+    def signatures(self):
+        # numbers shown by each figure: a figure is up to date as long as
+        # its signature is unchanged
+        return dict(
+            # every recipient with an age is drawn
+            occupation=self.n_aged_rows,
+            age=tuple(self.aggregates.age_counts.tolist()),
+            gender=tuple(sorted(self.aggregates.sex_counts.items())),
+            )
+
+    def databases(self, population, health_workers):
+        # databases for `render_all.aggregate`: the vaccination database is
+        # the rows with an age, typed once they are all known
+        if len(self.aged_rows) > 1:
+            self.aged_rows = [pd.concat(self.aged_rows, ignore_index=True)]
+        vaccine = apply_schema(self.aged_rows[0]) if self.aged_rows else \
+            apply_schema(pd.DataFrame(columns=list(RECORD_COLUMNS)))
+        return dict(
+            population=population,
+            health_workers=health_workers,
+            vaccine=vaccine,
+            vaccine_aggregates=self.aggregates,
+            )
+
+
+def changed_jobs(jobs, signatures, rendered):
+    # planned `jobs` (see `render_all.plan_figures`) whose figure signature
+    # is not the one of its last rendering (`rendered`, by output name)
+    return [(figure, parameters, filename)
+            for figure, parameters, filename in jobs
+            if rendered.get(filename) != signatures[figure]]
+
+
+def render_changed(watch, jobs, rendered, population, health_workers,
+                   structure, output_dir='.', dpi=450, executor=None):
+    # rendering the figures whose numbers changed since their last rendering
+    if not watch.aggregates.n_rows:
+        print('No recipients yet')
+        return []
+    signatures = watch.signatures()
+    jobs = changed_jobs(jobs, signatures, rendered)
+    if not jobs:
+        print('Figures unchanged')
+        return []
+    with stage('aggregate'):
+        tasks = aggregate(
+            watch.databases(population, health_workers), jobs, structure)
+    render_all(tasks, output_dir, dpi, executor=executor)
+    for figure, _, filename in jobs:
+        rendered[filename] = signatures[figure]
+    return jobs
+
+
+def parse_arguments(args=None):
+    parser = argparse.ArgumentParser(
+        description='Watch the vaccination database and render again the '
+                    'figures of the first COVID-19 vaccine recipients whose '
+                    'numbers changed.')
+    parser.add_argument(
+        '--csv', default=VACCINATION_FILE,
+        help='vaccination database to watch (CSV, append-only)')
+    parser.add_argument(
+        '--drop-dir', default=None,
+        help='directory of JSON Lines files of new records to watch too')
+    parser.add_argument(
+        '--figures', nargs='+', choices=list(FIGURES), default=list(FIGURES),
+        help='figures to render (default: all)')
+    parser.add_argument(
+        '--years', nargs='+', type=int, default=[2015],
+        help='years of the world population to compare with')
+    parser.add_argument(
+        '--age-cat-elder', type=int, default=6,
+        help='number of age bins of the elderly population (6 for 75+)')
+    parser.add_argument(
+        '--age-edges', nargs='+', type=int, default=None,
+        help='edges of the age bins of the age distribution, e.g. '
+             '0 18 65 110 (default: the bins of the UN database)')
+    parser.add_argument('--output-dir', default='.')
+    parser.add_argument('--dpi', type=int, default=450)
+    parser.add_argument(
+        '--jobs', type=int, default=None,
+        help='number of worker processes (default: number of CPUs)')
+    parser.add_argument(
+        '--interval', type=float, default=1.,
+        help='seconds between two polls of the files (default: 1)')
+    parser.add_argument(
+        '--debounce', type=float, default=2.,
+        help='seconds without new rows before rendering (default: 2)')
+    parser.add_argument(
+        '--max-delay', type=float, default=30.,
+        help='longest wait in seconds between a new row and the rendering, '
+             'when rows keep arriving (default: 30)')
+    parser.add_argument(
+        '--once', action='store_true',
+        help='render the figures from the current data, then stop')
+    return parser.parse_args(args)
+
+
+if __name__ == '__main__':
+    print('Start')
+    arguments = parse_arguments()
+
+    with stage('load'):
+        population = load_world_population()
+        health_workers = load_health_workers()
+    structure = PopulationStructure(population)
+    age_edges = arguments.age_edges
+    if age_edges is None:
+        _, _, age_edges = age_bin_edges(structure)
+    jobs = plan_figures(
+        arguments.figures, arguments.years, arguments.age_cat_elder,
+        arguments.age_edges)
+
+    sources = [CsvTail(arguments.csv)]
+    if arguments.drop_dir is not None:
+        sources.append(JsonlDropDirectory(arguments.drop_dir))
+    watch = VaccinationWatch(sources, np.asarray(age_edges))
+    # figure output name: signature of its last rendering
+    rendered = {}
+
+    with ProcessPoolExecutor(max_workers=arguments.jobs) as executor:
+        first_change = last_change = time.monotonic()
+        try:
+            while True:
+                with stage('poll'):
+                    n_rows = watch.poll()
+                now = time.monotonic()
+                if n_rows:
+                    print(f'{n_rows} new rows, {watch.aggregates.n_rows} '
+                          'in total')
+                    if first_change is None:
+                        first_change = now
+                    last_change = now
+                if first_change is not None and (
+                        arguments.once
+                        or now - last_change >= arguments.debounce
+                        or now - first_change >= arguments.max_delay):
+                    render_changed(
+                        watch, jobs, rendered, population, health_workers,
+                        structure, arguments.output_dir, arguments.dpi,
+                        executor)
+                    first_change = None
+                if arguments.once:
+                    break
+                time.sleep(arguments.interval)
+        except KeyboardInterrupt:
+            pass
+    write_trace()
+    print('Done')